@@ -1,11 +1,10 @@
 from . import database
-from .scheduler import scheduler
+from . import startup
+from .scheduler import scheduler, run_job, job_stats
+from .log import setup_logging, stop_logging
 
 import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(levelname)s:%(asctime)s\t-\t%(message)s'
-)
+setup_logging()
 
 logger = logging.getLogger(__name__)
@@ -1,5 +1,10 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import AsyncIterator, Iterator
 from app.models import Role, User
+import uuid
 import os
 
 # Database configuration
@@ -9,79 +14,222 @@ _DatabaseConfig = {
     "PASSWORD": os.getenv("DB_PASSWORD", "password"),
     "HOST": os.getenv("DB_HOST", "localhost"),
     "PORT": os.getenv("DB_PORT", "3308"),
-    "TYPE": os.getenv("DB_TYPE", "mysql")
+    "TYPE": os.getenv("DB_TYPE", "mysql"),
+    # Connection pool, applied to both the sync and the async engine
+    "POOL_SIZE": int(os.getenv("DB_POOL_SIZE", "5")),
+    "MAX_OVERFLOW": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "POOL_TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    # Recycle connections before MySQL's wait_timeout (8 hours by default) closes them
+    "POOL_RECYCLE": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+    "POOL_PRE_PING": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
 }
 
 _engine = None
+_async_engine = None
+_session_factory = None
+_async_session_factory = None
+
+# Drivers used for each database type, (sync, async)
+_drivers = {
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+    "mysql": ("mysql+pymysql", "mysql+aiomysql"),
+}
 
 
-def _get_database_uri() -> str:
+def _get_database_uri(is_async: bool = False) -> str:
     db_type = _DatabaseConfig.get('TYPE')
 
+    if db_type not in _drivers:
+        raise Exception('Database type not supported')
+
+    driver = _drivers[db_type][1 if is_async else 0]
+
     if db_type == 'sqlite':
-        return f'sqlite:///{_DatabaseConfig.get("NAME")}.db'
-    elif db_type == 'mysql':
-        return (f'mysql+pymysql://{_DatabaseConfig.get("USER")}:'
+        return f'{driver}:///{_DatabaseConfig.get("NAME")}.db'
+    else:
+        return (f'{driver}://{_DatabaseConfig.get("USER")}:'
                 f'{_DatabaseConfig.get("PASSWORD")}@{_DatabaseConfig.get("HOST")}:'
                 f'{_DatabaseConfig.get("PORT")}/{_DatabaseConfig.get("NAME")}')
-    else:
-        raise Exception('Database type not supported')
+
+def _get_pool_options() -> dict:
+    return {
+        "pool_size": _DatabaseConfig.get("POOL_SIZE"),
+        "max_overflow": _DatabaseConfig.get("MAX_OVERFLOW"),
+        "pool_timeout": _DatabaseConfig.get("POOL_TIMEOUT"),
+        "pool_recycle": _DatabaseConfig.get("POOL_RECYCLE"),
+        "pool_pre_ping": _DatabaseConfig.get("POOL_PRE_PING"),
+    }
 
 def get_engine():
     global _engine
     if not _engine:
-        _engine = create_engine(_get_database_uri())
+        _engine = create_engine(_get_database_uri(), **_get_pool_options())
     return _engine
 
 def get_session():
-    from sqlalchemy.orm import sessionmaker
-    session = sessionmaker(bind=get_engine())
-    return session()
+    global _session_factory
+    if not _session_factory:
+        _session_factory = sessionmaker(bind=get_engine())
+    return _session_factory()
+
+def get_async_engine():
+    global _async_engine
+    if not _async_engine:
+        _async_engine = create_async_engine(_get_database_uri(is_async=True), **_get_pool_options())
+    return _async_engine
+
+def get_async_session() -> AsyncSession:
+    global _async_session_factory
+    if not _async_session_factory:
+        _async_session_factory = async_sessionmaker(bind=get_async_engine(), expire_on_commit=False)
+    return _async_session_factory()
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI dependency providing one session (unit of work) per request
+    The session is committed when the route returns, or rolled back if it raises,
+    before the response is sent. Handlers may commit earlier to hand the connection
+    back to the pool before slow work, e.g. a bcrypt hash
+    """
+    session = get_async_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+def _pool_status(engine) -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+def pool_status() -> dict:
+    """
+    Report the connection pool usage of the engines that have been created
+    :return: the size, checked in, checked out and overflow counts for each engine
+    """
+    status = {}
+    if _engine:
+        status["sync"] = _pool_status(_engine)
+    if _async_engine:
+        status["async"] = _pool_status(_async_engine.sync_engine)
+    return status
+
+@contextmanager
+def advisory_lock(name: str) -> Iterator[bool]:
+    """
+    Try to take a named lock shared by every process using the database, on any host
+    MySQL: GET_LOCK, held by a pooled connection until the block exits (or the connection drops)
+    sqlite: a file lock next to the database file, which is only reachable from one host anyway
+    :param name: the lock name, scoped to the database
+    :return: a context manager yielding True if the lock was acquired, without waiting for it
+    """
+    if _DatabaseConfig.get("TYPE") != "mysql":
+        from app.utils.file_lock import file_lock
+        with file_lock(f'{_DatabaseConfig.get("NAME")}.{name}.lock', blocking=False) as acquired:
+            yield acquired
+        return
+
+    # MySQL lock names are server wide and at most 64 characters
+    name = f'{_DatabaseConfig.get("NAME")}.{name}'[:64]
+    with get_engine().connect() as connection:
+        acquired = connection.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": name}).scalar() == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+async def async_db_shutdown():
+    if _async_engine:
+        await _async_engine.dispose()
+
+# Alembic configuration, at the root of the project
+_migrations_config = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+
+def db_migrate():
+    """
+    Upgrade the database schema to the latest migration
+    Databases created by create_all before migrations existed are stamped with
+    the initial revision first, then upgraded like any other
+    """
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import inspect
+
+    config = Config(_migrations_config)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(_migrations_config), "migrations"))
+
+    with get_engine().begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if "users" in tables and "alembic_version" not in tables:
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
 
 def db_shutdown():
     from app.models import Base
     Base.metadata.drop_all(bind=get_engine())
+    # The schema is gone, so the next db_migrate must start from scratch
+    with get_engine().begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
 
 def db_init():
-    session = get_session()
-
-    roles = ['admin', 'user']
-    existing_roles = session.query(Role).all()
+    """
+    Seed the roles and the default users, unless the roles already exist
+    Uses the bulk repository methods, so seeding takes a few statements in one transaction
+    """
+    from sqlalchemy import insert
+    from app.models import user_roles
+    from app.utils import Repository, PasswordUtil
 
-    if existing_roles:
-        session.close()
-        return
-    else:
-        for role in roles:
-            session.add(Role(name=role))
+    session = get_session()
+    try:
+        if session.query(Role.id).first():
+            return
+
+        role_ids = {name: str(uuid.uuid4()) for name in ['admin', 'user']}
+        Repository(base_model=Role).create_many(
+            [{"id": role_id, "name": name} for name, role_id in role_ids.items()],
+            session=session
+        )
+
+        users = [
+            {
+                "id": str(uuid.uuid4()),
+                "firstname": 'admin',
+                "lastname": 'admin',
+                "email": 'admin@admin.com',
+                "_password": PasswordUtil.hash_password('admin'),
+                "verified": True,
+                "role": 'admin',
+            },
+            {
+                "id": str(uuid.uuid4()),
+                "firstname": 'user',
+                "lastname": 'user',
+                "email": "user@mail.com",
+                "_password": PasswordUtil.hash_password('password'),
+                "verified": False,
+                "role": 'user',
+            },
+        ]
+        Repository(base_model=User).create_many(
+            [{key: value for key, value in user.items() if key != "role"} for user in users],
+            session=session
+        )
+        session.execute(
+            insert(user_roles),
+            [{"user_id": user["id"], "role_id": role_ids[user["role"]]} for user in users]
+        )
 
         session.commit()
-
-    admin = User(
-        firstname='admin',
-        lastname='admin',
-        email='admin@admin.com',
-        verified=True
-    )
-
-    admin.set_password('admin')
-
-    base_user = User(
-        firstname='user',
-        lastname='user',
-        email="user@mail.com"
-    )
-    base_user.set_password('password')
-
-    session.add(admin)
-    session.add(base_user)
-
-
-    user_role = session.query(Role).filter_by(name='user').first()
-    admin_role = session.query(Role).filter_by(name='admin').first()
-
-    admin.roles.append(admin_role)
-    base_user.roles.append(user_role)
-
-    session.commit()
-    session.close()
\ No newline at end of file
+    finally:
+        session.close()
@@ -0,0 +1,104 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+
+"""
+This is the Logging module
+
+Log calls only put the record on an in-memory queue (QueueHandler); a
+QueueListener thread formats the records and writes them out, so no log I/O
+happens on the request path. Records are written as one JSON object per line
+(LOG_FORMAT=json, the default) or as plain text (LOG_FORMAT=text). Fields
+passed with `extra=` are included in the JSON object.
+
+methods:
+--------
+setup_logging
+    Route every log record through the queue, and start the listener
+stop_logging
+    Write out the queued records and stop the listener
+"""
+
+# Logging configuration
+_LogConfig = {
+    "LEVEL": os.getenv("LOG_LEVEL", "INFO").upper(),
+    "FORMAT": os.getenv("LOG_FORMAT", "json").lower(),
+}
+
+_TEXT_FORMAT = '%(levelname)s:%(asctime)s\t-\t%(message)s'
+
+# Attributes every LogRecord has, anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments into the message here; formatting (and the
+        # traceback) is left to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = None, fmt: str = None):
+    """
+    :param level: the root log level, LOG_LEVEL by default
+    :param fmt: "json" or "text", LOG_FORMAT by default
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if (fmt or _LogConfig["FORMAT"]) == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(_TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [_RecordQueueHandler(records)]
+    root.setLevel(level or _LogConfig["LEVEL"])
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    _listener = None
@@ -1,12 +1,230 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+import logging
+import os
+import time
 
 """
 This is the Scheduler module
 The module contains the functions that will be scheduled to run at specific intervals
 
+Jobs are registered with the `job` decorator, which adds them to the scheduler
+and records the outcome of every run (see `job_stats`). Every worker process
+runs its own scheduler, so jobs working on shared data are registered as
+`exclusive`: a run is skipped while another worker, on any replica, holds the
+job's lock in the database (see `database.advisory_lock`). The cleanup jobs delete in chunks of one transaction each, pausing
+between chunks, so they never hold locks for long.
+
 methods:
 --------
+rotate_signing_keys
+    Rotate the JWT signing keys when due, and reload keys rotated by other workers
+    Runs in every worker, as each must reload the keys; the rotation itself is
+    serialized by the key store's lock, in the key directory shared by the replicas
+
+sync_revocations
+    Load the tokens revoked since the last sync into the in-memory revocation list
+    (every unexpired one on the first run)
+
+purge_refresh_tokens
+    Delete the expired refresh tokens (exclusive)
+
+purge_revoked_tokens
+    Delete the revoked tokens past their expiry (exclusive)
+
+purge_unverified_users
+    Delete the accounts never verified within UNVERIFIED_USER_DAYS (exclusive)
+    Off unless UNVERIFIED_USER_DAYS is set, as nothing verifies accounts yet
+
+purge_orphan_user_roles
+    Delete the user_roles rows whose user or role no longer exists (exclusive)
 
+run_job
+    Run a registered job now, e.g. at startup
+
+job_stats
+    The outcome of the last run of every job
 """
 
+# Scheduler configuration
+_SchedulerConfig = {
+    "KEY_ROTATION_CHECK_MINUTES": float(os.getenv("JWT_KEY_CHECK_MINUTES", "5")),
+    "REFRESH_TOKEN_PURGE_MINUTES": float(os.getenv("REFRESH_TOKEN_PURGE_MINUTES", "60")),
+    "REFRESH_TOKEN_PURGE_CHUNK": int(os.getenv("REFRESH_TOKEN_PURGE_CHUNK", "1000")),
+    # How long a logout takes to reach the other workers
+    "REVOCATION_SYNC_SECONDS": float(os.getenv("JWT_REVOCATION_SYNC_SECONDS", "10")),
+    # Rows revoked this long before the last sync are read again, to cover clock skew
+    # between replicas and transactions committed after the sync read the table
+    "REVOCATION_SYNC_OVERLAP_SECONDS": float(os.getenv("JWT_REVOCATION_SYNC_OVERLAP_SECONDS", "60")),
+    "CLEANUP_MINUTES": float(os.getenv("CLEANUP_MINUTES", "60")),
+    "CLEANUP_CHUNK_SIZE": int(os.getenv("CLEANUP_CHUNK_SIZE", "500")),
+    "CLEANUP_PAUSE_SECONDS": float(os.getenv("CLEANUP_PAUSE_SECONDS", "0.1")),
+    # Unset or 0 disables purge_unverified_users, keep it off until accounts can be verified
+    "UNVERIFIED_USER_DAYS": float(os.getenv("UNVERIFIED_USER_DAYS") or "0"),
+}
+
+logger = logging.getLogger(__name__)
+
 scheduler = BackgroundScheduler()
+
+_jobs: dict[str, Callable] = {}
+_job_runs: dict[str, dict] = {}
+
+# When sync_revocations last read the revoked tokens, None until its first (full) run
+_revocations_synced_at: Optional[datetime] = None
+
+
+def job(job_id: str, exclusive: bool = False, enabled: bool = True, **trigger):
+    """
+    Register a function as a job run at an interval
+    :param job_id: the job's unique identifier
+    :param exclusive: run in one worker of all the replicas at a time, for jobs working on shared data
+    :param enabled: register the job, a disabled job is neither scheduled nor listed
+    :param trigger: the interval, e.g. minutes=5
+    :return: a decorator returning the function unchanged
+    """
+    def register(func: Callable[[], Optional[int]]):
+        if not enabled:
+            return func
+
+        def run():
+            return _run(job_id, func, exclusive)
+
+        _jobs[job_id] = run
+        scheduler.add_job(run, 'interval', id=job_id, name=job_id, coalesce=True, max_instances=1, **trigger)
+        return func
+    return register
+
+
+def run_job(job_id: str) -> Optional[int]:
+    return _jobs[job_id]()
+
+
+def job_stats() -> dict:
+    return {job_id: dict(run) for job_id, run in _job_runs.items()}
+
+
+def _run(job_id: str, func: Callable[[], Optional[int]], exclusive: bool) -> Optional[int]:
+    """
+    Run a job, holding its lock if exclusive, and record the rows it removed and its duration
+    """
+    from app.config import database
+
+    started = time.monotonic()
+    lock = database.advisory_lock(f"job.{job_id}") if exclusive else nullcontext(True)
+
+    with lock as acquired:
+        if not acquired:
+            logger.debug(f"Job {job_id} skipped, running in another worker")
+            _job_runs[job_id] = {"status": "skipped", "last_run": time.time(), "duration": 0.0, "rows": None}
+            return None
+
+        try:
+            rows = func()
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            _job_runs[job_id] = {"status": "error", "last_run": time.time(),
+                                 "duration": time.monotonic() - started, "rows": None}
+            return None
+
+    duration = time.monotonic() - started
+    _job_runs[job_id] = {"status": "ok", "last_run": time.time(), "duration": duration, "rows": rows}
+    if rows is not None:
+        logger.info(f"Job {job_id} removed {rows} rows in {duration:.2f}s")
+    return rows
+
+
+def _cleanup_options() -> dict:
+    return {"chunk_size": _SchedulerConfig["CLEANUP_CHUNK_SIZE"], "pause": _SchedulerConfig["CLEANUP_PAUSE_SECONDS"]}
+
+
+@job('rotate_signing_keys', minutes=_SchedulerConfig["KEY_ROTATION_CHECK_MINUTES"])
+def rotate_signing_keys():
+    from app.utils import JwtUtil
+    JwtUtil.refresh_keys()
+
+
+@job('sync_revocations', seconds=_SchedulerConfig["REVOCATION_SYNC_SECONDS"])
+def sync_revocations():
+    from calendar import timegm
+    from sqlalchemy import select
+    from app.config import database
+    from app.models import RevokedToken
+    from app.utils import JwtUtil
+    from app.utils.refresh_token_repository import utcnow
+
+    global _revocations_synced_at
+    now = utcnow()
+    statement = select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > now)
+    if _revocations_synced_at is not None:
+        overlap = timedelta(seconds=_SchedulerConfig["REVOCATION_SYNC_OVERLAP_SECONDS"])
+        statement = statement.where(RevokedToken.revoked_at >= _revocations_synced_at - overlap)
+
+    session = database.get_session()
+    try:
+        entries = [(jti, timegm(expires_at.utctimetuple())) for jti, expires_at in session.execute(statement)]
+    finally:
+        session.close()
+
+    if _revocations_synced_at is None:
+        JwtUtil.load_revocations(entries)
+    else:
+        for jti, exp in entries:
+            JwtUtil.revoke(jti, exp)
+    _revocations_synced_at = now
+
+
+@job('purge_refresh_tokens', exclusive=True, minutes=_SchedulerConfig["REFRESH_TOKEN_PURGE_MINUTES"])
+def purge_refresh_tokens() -> int:
+    from app.models import RefreshToken
+    from app.utils import Repository
+    from app.utils.refresh_token_repository import utcnow
+
+    return Repository(RefreshToken).delete_where(
+        RefreshToken.expires_at < utcnow(),
+        chunk_size=_SchedulerConfig["REFRESH_TOKEN_PURGE_CHUNK"],
+        pause=_SchedulerConfig["CLEANUP_PAUSE_SECONDS"],
+    )
+
+
+@job('purge_revoked_tokens', exclusive=True, minutes=_SchedulerConfig["CLEANUP_MINUTES"])
+def purge_revoked_tokens() -> int:
+    from app.models import RevokedToken
+    from app.utils import Repository
+    from app.utils.refresh_token_repository import utcnow
+
+    return Repository(RevokedToken).delete_where(RevokedToken.expires_at < utcnow(), **_cleanup_options())
+
+
+@job('purge_unverified_users', exclusive=True, enabled=_SchedulerConfig["UNVERIFIED_USER_DAYS"] > 0,
+     minutes=_SchedulerConfig["CLEANUP_MINUTES"])
+def purge_unverified_users() -> int:
+    from sqlalchemy import or_
+    from app.models import User, RefreshToken, user_roles
+    from app.utils import Repository
+    from app.utils.refresh_token_repository import utcnow
+
+    cutoff = utcnow() - timedelta(days=_SchedulerConfig["UNVERIFIED_USER_DAYS"])
+    return Repository(User).delete_where(
+        or_(User.verified.is_(False), User.verified.is_(None)),
+        User.created_at < cutoff,
+        cascade=(user_roles.c.user_id, RefreshToken.__table__.c.user_id),
+        **_cleanup_options()
+    )
+
+
+@job('purge_orphan_user_roles', exclusive=True, minutes=_SchedulerConfig["CLEANUP_MINUTES"])
+def purge_orphan_user_roles() -> int:
+    from sqlalchemy import exists, or_
+    from app.models import User, Role, user_roles
+    from app.utils import Repository
+
+    return Repository(user_roles).delete_where(
+        or_(
+            ~exists().where(User.id == user_roles.c.user_id),
+            ~exists().where(Role.id == user_roles.c.role_id),
+        ),
+        **_cleanup_options()
+    )
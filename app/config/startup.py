@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from typing import Iterator
+import logging
+import os
+import time
+
+"""
+This is the Startup module
+
+The module decides what the application does when it starts and stops, and
+times each step of it.
+
+modes:
+------
+full (STARTUP_MODE=full, the default)
+    Migrate the schema, seed the default users and rotate the signing keys if
+    due on startup; drop the schema on shutdown.
+    Meant for development, where every run starts from a clean database.
+fast (STARTUP_MODE=fast)
+    None of the above: the schema and the keys are expected to exist (run the
+    migrations once per deployment, e.g. `alembic upgrade head`) and the
+    scheduler rotates the keys. Meant for the replicas of a deployed service,
+    which must be ready as soon as possible.
+
+The email templates are compiled on startup in both modes, so a broken
+template fails at boot rather than on the first email using it.
+
+Each database step can be turned on or off whatever the mode with
+DB_MIGRATE_ON_STARTUP, DB_SEED_ON_STARTUP and DB_DROP_ON_SHUTDOWN.
+
+methods:
+--------
+enabled
+    Whether a startup option is on
+step
+    Time a startup step
+record
+    Record the duration of a step timed elsewhere
+report
+    The startup timing breakdown
+"""
+
+_MODES = ("full", "fast")
+
+_mode = os.getenv("STARTUP_MODE", "full").lower()
+if _mode not in _MODES:
+    raise ValueError(f"STARTUP_MODE must be one of {', '.join(_MODES)}, not '{_mode}'")
+
+
+def _option(name: str) -> bool:
+    # Every option is on in full mode and off in fast mode, unless set explicitly
+    return os.getenv(name, "true" if _mode == "full" else "false").lower() == "true"
+
+
+# Startup configuration
+_StartupConfig = {
+    "MODE": _mode,
+    "MIGRATE": _option("DB_MIGRATE_ON_STARTUP"),
+    "SEED": _option("DB_SEED_ON_STARTUP"),
+    "DROP_ON_SHUTDOWN": _option("DB_DROP_ON_SHUTDOWN"),
+    "ROTATE_KEYS": _mode == "full",
+}
+
+# Duration of each step in milliseconds, in the order they ran
+_steps: dict[str, float] = {}
+
+logger = logging.getLogger(__name__)
+
+
+def enabled(option: str) -> bool:
+    """
+    :param option: MIGRATE, SEED, DROP_ON_SHUTDOWN or ROTATE_KEYS
+    :return: whether the option is on
+    """
+    return _StartupConfig[option]
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    Record the duration of a step
+    :param name: the step name
+    :param seconds: how long the step took
+    """
+    _steps[name] = round(seconds * 1000, 2)
+
+
+@contextmanager
+def step(name: str) -> Iterator[None]:
+    """
+    Time the block as a startup step
+    :param name: the step name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def report() -> dict:
+    """
+    :return: the mode, the duration of each step and their total, in milliseconds
+    """
+    return {
+        "mode": _StartupConfig["MODE"],
+        "steps_ms": dict(_steps),
+        "total_ms": round(sum(_steps.values()), 2),
+    }
@@ -1,3 +1,4 @@
 from . import jwt_handler
 from . import user_handler
-from . import email_handler
\ No newline at end of file
+from . import email_handler
+from . import token_handler
@@ -1,15 +1,35 @@
 from fastapi.security import OAuth2PasswordRequestForm
-from app.schemas import UserLogin, Response
-from .user_handler import login
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas import UserLogin, Response, RefreshRequest
+from .user_handler import login, token_refresh
 
-def get_token(user_login: OAuth2PasswordRequestForm) -> Response:
+async def get_token(
+        user_login: OAuth2PasswordRequestForm,
+        session: AsyncSession = None,
+        client_ip: Optional[str] = None
+) -> Response:
     """
     Get a JWT token
     If the user is found and the password is correct, return a response containing the access token
     else return an error response with the appropriate status code and message
     :param user_login: OAuth2PasswordRequestForm model
+    :param session: the request's database session
+    :param client_ip: the client's IP address, for the rate limiter
     :return: Response model containing the access token
     """
 
     user_login = UserLogin(email=user_login.username, password=user_login.password)
-    return login(user_login)
\ No newline at end of file
+    return await login(user_login, session, client_ip=client_ip)
+
+
+async def refresh_token(refresh: RefreshRequest, session: AsyncSession = None) -> Response:
+    """
+    Refresh a JWT token
+    If the refresh token is valid, return a response containing a new access token and refresh token
+    else return an error response with the appropriate status code and message
+    :param refresh: RefreshRequest model containing the refresh token
+    :param session: the request's database session
+    :return: Response model containing the access token and refresh token
+    """
+    return await token_refresh(refresh, session)
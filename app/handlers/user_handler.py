@@ -1,9 +1,16 @@
-from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, timezone
 from typing import Optional
+import uuid
 
-from app.utils import Repository
-from app.models import User
-from app.schemas import UserLogin, Response, UserRegistration, Password
+from app.utils import AsyncRepository, JwtUtil, PasswordUtil, pagination, rate_limiter
+from app.utils.user_repository import UserRepository
+from app.utils.refresh_token_repository import RefreshTokenRepository, hash_token, utcnow
+from app.config import logger
+from app.models import User, RevokedToken
+from app import schemas
+from app.schemas import UserLogin, Response, UserRegistration, Password, RefreshRequest
 from app.handlers import jwt_handler
 
 
@@ -26,67 +33,186 @@ logout
 register
     Register a new user
     
-token_refresh_request
-    Refresh a JWT token
+token_refresh
+    Exchange a refresh token for a new access token and refresh token
     
 reset_password_request
     Send an email requesting a password reset
     
 reset_password
     Reset a user's password
+
+list_users
+    List the users one page at a time (admin only)
     
 _user_jwt
     get the jwt token for the user
+
+_user_tokens
+    issue the access token and refresh token for the user
+
+_refresh_token_reused
+    revoke a refresh token family after a replay
+
+_end_read
+    end the read transaction of the request's session before hashing a password
 """
 
-user_repo = Repository(
-    base_model=User,
-    options=joinedload(User.roles)
+user_repo = UserRepository(
+    options=joinedload(User.roles),
+    stream_options=selectinload(User.roles)
 )
 
+refresh_repo = RefreshTokenRepository()
+revoked_repo = AsyncRepository(base_model=RevokedToken)
 
-def login(user_login: UserLogin) -> Response:
+_MAX_PAGE_SIZE = 500
+
+
+async def login(user_login: UserLogin, session: AsyncSession = None, client_ip: Optional[str] = None) -> Response:
     """
     Login a user
     If the user is found and the password is correct, return a response containing the access token and refresh token
     else return an error response with the appropriate status code and message
+    Attempts over the rate limits are rejected before the user is looked up or the password checked;
+    each attempt is counted against the email up front, and the count cleared by a successful login
     :param user_login: UserLogin model
+    :param session: the request's database session
+    :param client_ip: the client's IP address, for the rate limiter
     :return: Response model containing the access token and refresh token
+    :raises RateLimitExceeded: if the client IP or the email is over its limit
     """
-    user: Optional[User] = user_repo.get_by(email=user_login.email)
+    await rate_limiter.limit_login(client_ip, user_login.email)
+
+    credentials = await user_repo.get_credentials(user_login.email, session=session)
+    await _end_read(session)
 
-    if not user:
+    if not credentials:
         return Response(node={"message": "User not found"}, status=404)
 
-    if not user.verify_password(user_login.password):
+    try:
+        valid = await PasswordUtil.check_password_async(user_login.password, credentials.password)
+    except Exception:
+        # The password was never checked (e.g. PasswordPoolBusy), so the attempt does not count
+        await rate_limiter.login_aborted(user_login.email)
+        raise
+
+    if not valid:
         return Response(node={"message": "Invalid password"}, status=401)
 
-    return Response(node=_user_jwt(user), status=200)
+    await rate_limiter.login_succeeded(user_login.email)
+
+    tokens = await _user_tokens(credentials.id, credentials.roles, session)
+    if tokens is None:
+        return Response(node={"message": "Tokens could not be issued"}, status=500)
 
+    return Response(node=tokens, status=200)
 
-def register(user: UserRegistration) -> Response:
+
+async def register(user: UserRegistration, session: AsyncSession = None, client_ip: Optional[str] = None) -> Response:
     """
     Register a new user
     If the user is successfully created, return a response containing the access token and refresh token
     else return an error response with the appropriate status code and message
+    Attempts over the rate limit are rejected before anything else
     :param user: UserRegistration model
+    :param session: the request's database session
+    :param client_ip: the client's IP address, for the rate limiter
     :return: Response model containing the access token and refresh token
+    :raises RateLimitExceeded: if the client IP is over its limit
     """
+    await rate_limiter.limit_register(client_ip)
 
-    if user_repo.get_by(email=user.email):
+    exists = await user_repo.get_by(session=session, email=user.email)
+    await _end_read(session)
+    if exists:
         return Response(node={"message": "User already exists"}, status=409)
 
     new_user = User(
         firstname=user.firstname,
         lastname=user.lastname,
         email=user.email,
+        roles=[],
     )
 
-    new_user.set_password(user.password)
+    await new_user.set_password_async(user.password)
+
+    # Written in a new transaction, the email may have been taken since the check
+    if not await user_repo.create(new_user, session=session):
+        return Response(node={"message": "User could not be created"}, status=500)
+
+    # The password was just hashed from the request, so the tokens are issued
+    # without reloading the user or checking the password again
+    tokens = await _user_tokens(new_user.id, [role.name for role in new_user.roles], session)
+    if tokens is None:
+        return Response(node={"message": "Tokens could not be issued"}, status=500)
+
+    return Response(node=tokens, status=200)
+
+
+async def token_refresh(refresh: RefreshRequest, session: AsyncSession = None) -> Response:
+    """
+    Exchange a refresh token for a new access token and refresh token
+    The refresh token is used up (rotated). Presenting a used or revoked token again
+    means it was replayed, so every token of its family is revoked and the user has
+    to log in again. No password check is involved, so bcrypt never runs here.
+    :param refresh: RefreshRequest model containing the refresh token
+    :param session: the request's database session
+    :return: Response model containing the access token and refresh token
+    """
+    grant = await refresh_repo.get_grant(refresh.refresh_token, session=session)
+
+    if not grant:
+        return Response(node={"message": "Invalid refresh token"}, status=401)
+
+    if grant.revoked:
+        return Response(node={"message": "Invalid refresh token"}, status=401)
+
+    if grant.used:
+        return await _refresh_token_reused(grant.user_id, grant.family_id, session)
+
+    if grant.expires_at <= utcnow():
+        return Response(node={"message": "Refresh token has expired"}, status=401)
+
+    # Lost a race with a concurrent refresh using the same token
+    if not await refresh_repo.consume(grant.id, session=session):
+        return await _refresh_token_reused(grant.user_id, grant.family_id, session)
+
+    tokens = await _user_tokens(grant.user_id, grant.roles, session, family_id=grant.family_id)
+    if tokens is None:
+        return Response(node={"message": "Tokens could not be issued"}, status=500)
+
+    return Response(node=tokens, status=200)
+
+
+async def logout(token: str, refresh: Optional[RefreshRequest] = None, session: AsyncSession = None) -> Response:
+    """
+    Logout a user
+    Revoke the access token until it expires, and the refresh token family if one is given
+    The revocation is stored, then picked up by every worker's in-memory revocation list,
+    so verifying tokens never queries the database
+    :param token: a string representation of the jwt token to revoke
+    :param refresh: RefreshRequest model containing the refresh token of the same session
+    :param session: the request's database session
+    :return: Response model
+    """
+    payload = jwt_handler.decode_jwt(token)
+    jti, exp = payload.get("jti"), payload.get("exp")
+    if not jti or not exp:
+        return Response(node={"message": "Token cannot be revoked"}, status=400)
+
+    expires_at = datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+    if not await revoked_repo.upsert_many([{"jti": jti, "expires_at": expires_at}], session=session):
+        return Response(node={"message": "Token could not be revoked"}, status=500)
+    JwtUtil.revoke(jti, exp)
 
-    user_repo.create(new_user)
+    if refresh:
+        grant = await refresh_repo.get_by(session=session, token_hash=hash_token(refresh.refresh_token))
+        # Only the caller's own refresh tokens can be revoked
+        if grant and grant.user_id == payload.get("sub"):
+            await refresh_repo.revoke_family(grant.family_id, session=session)
 
-    return login(UserLogin(email=user.email, password=user.password))
+    return Response(node={"message": "Logged out"}, status=200)
 
 
 def reset_password_request(token: str) -> Response:
@@ -99,24 +225,26 @@ def reset_password_request(token: str) -> Response:
     """
     return Response(node={"message": "Password reset request sent"}, status=200)
 
-def reset_password(token: str, password: Password) -> Response:
+async def reset_password(token: str, password: Password, session: AsyncSession = None) -> Response:
     """
     Reset a user's password
     If the token is valid, reset the user's password
     else return an error response with the appropriate status code and message
     :param token: a string representation of a jwt token containing the user's id
     :param password: the new password
+    :param session: the request's database session
     :return: Response model
     """
     response = Response()
     payload = jwt_handler.decode_jwt(token)
     if payload:
         userid = payload["sub"]
-        user = user_repo.get_by(id=userid)
+        user = await user_repo.get_by(session=session, id=userid)
+        await _end_read(session)
 
         if user:
-            user.set_password(password.password)
-            user_repo.update(user)
+            await user.set_password_async(password.password)
+            await user_repo.update(user, session=session)
             # Update response
             response.status = 200
             response.node = {"message": "Password reset"}
@@ -132,15 +260,100 @@ def reset_password(token: str, password: Password) -> Response:
     return response
 
 
-def _user_jwt(user: User):
+async def list_users(token: str, cursor: Optional[str] = None, limit: int = 50,
+                     session: AsyncSession = None) -> Response:
+    """
+    List the users one page at a time, ordered by id (admin only)
+    Pages are read with keyset pagination, so memory use does not grow with the table
+    :param token: a string representation of a jwt token of an admin
+    :param cursor: the opaque cursor returned with the previous page, None for the first page
+    :param limit: the page size
+    :param session: the request's database session
+    :return: Response model containing the users and the cursor of the next page
+    """
+    payload = jwt_handler.decode_jwt(token)
+    if "admin" not in payload.get("roles", []):
+        return Response(node={"message": "Admin role required"}, status=403)
+
+    try:
+        # Users are paged on their id, so the key has to be a UUID
+        after = str(uuid.UUID(pagination.decode_cursor(cursor, str))) if cursor else None
+    except ValueError:
+        return Response(node={"message": "Invalid cursor"}, status=400)
+
+    users, last_key = await user_repo.get_page(
+        limit=min(max(limit, 1), _MAX_PAGE_SIZE),
+        after=after,
+        session=session
+    )
+
+    return Response(node={
+        "users": [
+            schemas.User(
+                id=user.id,
+                firstname=user.firstname,
+                lastname=user.lastname,
+                email=user.email,
+                roles=[role.name for role in user.roles],
+                two_factor_enabled=bool(user.two_factor_enabled),
+                profile_picture=user.profile_picture,
+            ).model_dump()
+            for user in users
+        ],
+        "next_cursor": pagination.encode_cursor(last_key) if last_key is not None else None,
+    }, status=200)
+
+
+def _user_jwt(user_id: str, roles: list[str]):
     """
     get the jwt token for the user
-    :param user:
+    :param user_id: the user's id
+    :param roles: the names of the user's roles
     :return: the jwt token containing the user's id and roles
     """
     return jwt_handler.sign_jwt(
         {
-            "sub": user.id,
-            "roles": [role.name for role in user.roles],
+            "sub": user_id,
+            "roles": roles,
         }
-    )
\ No newline at end of file
+    )
+
+
+async def _end_read(session: Optional[AsyncSession]):
+    """
+    end the read transaction of the request's session, returning its connection to the pool
+    Called before a bcrypt hash, so the connection is not held idle in a transaction
+    while it runs; the session opens a new transaction for whatever it does next
+    :param session: the request's database session, None if the repositories open their own
+    """
+    if session is not None:
+        await session.commit()
+
+
+async def _refresh_token_reused(user_id: str, family_id: str, session: AsyncSession = None) -> Response:
+    """
+    revoke every refresh token of a family after one of them was replayed
+    """
+    await refresh_repo.revoke_family(family_id, session=session)
+    logger.warning(f"Refresh token reuse detected for user {user_id}, token family revoked")
+    return Response(node={"message": "Invalid refresh token"}, status=401)
+
+
+async def _user_tokens(user_id: str, roles: list[str], session: AsyncSession = None, family_id: str = None):
+    """
+    issue the access token and refresh token for the user
+    :param user_id: the user's id
+    :param roles: the names of the user's roles
+    :param session: the request's database session
+    :param family_id: the family of the refresh token being rotated, None for a new login
+    :return: the tokens, or None if the refresh token could not be stored
+    """
+    refresh_token = await refresh_repo.issue(user_id, family_id, session=session)
+    if refresh_token is None:
+        return None
+
+    return {
+        "access_token": _user_jwt(user_id, roles),
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
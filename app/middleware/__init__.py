@@ -0,0 +1,2 @@
+from .access_log import AccessLogMiddleware
+from .metrics import MetricsMiddleware
@@ -0,0 +1,86 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import logging
+import os
+import random
+import time
+
+"""
+This is the Access Log middleware module
+
+One log record per sampled request, written through the queued logging
+pipeline (see app.config.log), with the method, path, status and duration as
+structured fields. Server errors and slow requests are always logged.
+"""
+
+# Access log configuration
+_AccessLogConfig = {
+    "LEVEL": logging.getLevelName(os.getenv("ACCESS_LOG_LEVEL", "INFO").upper()),
+    # Share of the requests logged, from 0 (none) to 1 (all)
+    "SAMPLE_RATE": float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0")),
+    # Requests taking longer are always logged, as warnings
+    "SLOW_MS": float(os.getenv("ACCESS_LOG_SLOW_MS", "1000")),
+}
+
+logger = logging.getLogger("app.access")
+
+
+class AccessLogMiddleware:
+    """
+    ASGI middleware logging the HTTP requests
+
+    Methods:
+    --------
+    __call__(scope, receive, send) -> None
+        Handle a request, then log it if sampled
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float = None, level: int = None, slow_ms: float = None):
+        """
+        :param app: the ASGI application
+        :param sample_rate: the share of the requests logged, ACCESS_LOG_SAMPLE_RATE by default
+        :param level: the level of the records, ACCESS_LOG_LEVEL by default
+        :param slow_ms: the duration above which a request is always logged, ACCESS_LOG_SLOW_MS by default
+        """
+        self.app = app
+        self.sample_rate = _AccessLogConfig["SAMPLE_RATE"] if sample_rate is None else sample_rate
+        self.level = _AccessLogConfig["LEVEL"] if level is None else level
+        self.slow_ms = _AccessLogConfig["SLOW_MS"] if slow_ms is None else slow_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._log(scope, status, (time.perf_counter() - started) * 1000)
+
+    def _log(self, scope: Scope, status: int, duration_ms: float):
+        if status >= 500 or duration_ms >= self.slow_ms:
+            level = logging.WARNING
+        elif self.sample_rate >= 1 or random.random() < self.sample_rate:
+            level = self.level
+        else:
+            return
+
+        if not logger.isEnabledFor(level):
+            return
+
+        client = scope.get("client")
+        logger.log(level, "%s %s %s", scope["method"], scope["path"], status, extra={
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "client": client[0] if client else None,
+        })
@@ -0,0 +1,48 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.utils.metrics import REQUEST_SECONDS
+import time
+
+"""
+This is the Metrics middleware module
+
+Records the latency of every HTTP request in the http_request_duration_seconds
+histogram, labelled by method, route template (e.g. /users, never the raw path,
+so the label set stays bounded) and status.
+"""
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing the HTTP requests
+
+    Methods:
+    --------
+    __call__(scope, receive, send) -> None
+        Handle a request, then record its latency
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Set by the router on the scope once a route matched
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - started)
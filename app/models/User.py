@@ -1,17 +1,29 @@
 from .base import Base
+from .types import BinaryUUID
 from app.utils import PasswordUtil
-from sqlalchemy import Column, String, Table, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Table, ForeignKey, Boolean, DateTime, Index
+from sqlalchemy.orm import relationship, validates
+from datetime import datetime, timezone
 import uuid
 
+# The composite primary key serves lookups by user_id, the index lookups by role_id
 user_roles = Table(
     'user_roles',
     Base.metadata,
-    Column('user_id', String(36), ForeignKey('users.id')),
-    Column('role_id', String(36), ForeignKey('roles.id'))
+    Column('user_id', BinaryUUID, ForeignKey('users.id'), primary_key=True),
+    Column('role_id', BinaryUUID, ForeignKey('roles.id'), primary_key=True),
+    Index('ix_user_roles_role_id', 'role_id')
 )
 
 
+def normalize_email(email: str) -> str:
+    return email.strip().lower() if email else email
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     """
     User model
@@ -25,7 +37,7 @@ class User(Base):
     lastname : str
         The user's last name
     email : str
-        The user's email address
+        The user's email address, stored lowercased
     phone_number : str
         The user's phone number
     _password : str
@@ -34,6 +46,8 @@ class User(Base):
         Whether the user has two-factor authentication enabled
     profile_picture : str
         The user's profile picture URL
+    created_at : datetime
+        When the user registered (UTC)
     roles : List[Role]
         The roles assigned to the user
 
@@ -46,9 +60,13 @@ class User(Base):
         Set the user's password
     verify_password(password: str) -> bool
         Verify the user's password
+    set_password_async(password: str) -> None
+        Set the user's password, hashing it in the password pool
+    verify_password_async(password: str) -> bool
+        Verify the user's password in the password pool
     """
     __tablename__ = 'users'
-    id = Column(String(36), default=lambda: str(uuid.uuid4()), primary_key=True)
+    id = Column(BinaryUUID, default=lambda: str(uuid.uuid4()), primary_key=True)
     firstname = Column(String(50), nullable=False)
     lastname = Column(String(50), nullable=False)
     email = Column(String(50), unique=True, nullable=False)
@@ -57,9 +75,14 @@ class User(Base):
     verified = Column(Boolean, default=False)
     two_factor_enabled = Column(Boolean, default=False)
     profile_picture = Column(String(100), default=None)
+    created_at = Column(DateTime, nullable=False, default=_utcnow, index=True)
 
     roles = relationship("Role", secondary=user_roles, back_populates="users")
 
+    @validates('email')
+    def _normalize_email(self, key, email):
+        return normalize_email(email)
+
     @property
     def full_name(self):
         return f'{self.firstname} {self.lastname}'
@@ -69,3 +92,9 @@ class User(Base):
 
     def verify_password(self, password: str):
         return PasswordUtil.check_password(password, self._password)
+
+    async def set_password_async(self, password: str):
+        self._password = await PasswordUtil.hash_password_async(password)
+
+    async def verify_password_async(self, password: str):
+        return await PasswordUtil.check_password_async(password, self._password)
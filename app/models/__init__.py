@@ -1,3 +1,6 @@
 from .base import Base
+from .types import BinaryUUID
 from .role import Role
-from .User import User, user_roles
+from .User import User, user_roles, normalize_email
+from .refresh_token import RefreshToken
+from .revoked_token import RevokedToken
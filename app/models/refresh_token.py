@@ -0,0 +1,38 @@
+from .base import Base
+from .types import BinaryUUID
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey
+import uuid
+
+
+class RefreshToken(Base):
+    """
+    RefreshToken model
+
+    Only the SHA-256 digest of a refresh token is stored, so a leaked table
+    cannot be used to refresh, and lookups go through the unique index on it.
+
+    Attributes:
+    -----------
+    id : str
+        The token's unique identifier
+    token_hash : str
+        The hex SHA-256 digest of the token
+    user_id : str
+        The id of the user the token was issued to
+    family_id : str
+        The id shared by a token and every token it was rotated into
+    expires_at : datetime
+        When the token expires (UTC)
+    used : bool
+        Whether the token was already exchanged for a new one
+    revoked : bool
+        Whether the token was revoked
+    """
+    __tablename__ = 'refresh_tokens'
+    id = Column(BinaryUUID, default=lambda: str(uuid.uuid4()), primary_key=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    user_id = Column(BinaryUUID, ForeignKey('users.id'), nullable=False, index=True)
+    family_id = Column(BinaryUUID, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used = Column(Boolean, nullable=False, default=False)
+    revoked = Column(Boolean, nullable=False, default=False)
@@ -0,0 +1,30 @@
+from .base import Base
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RevokedToken(Base):
+    """
+    RevokedToken model
+
+    The access tokens revoked before their expiry (e.g. at logout), kept until
+    then. Workers load them into their in-memory revocation list, so verifying
+    a token never queries this table.
+
+    Attributes:
+    -----------
+    jti : str
+        The revoked token's unique identifier (its `jti` claim)
+    expires_at : datetime
+        When the token expires (UTC), after which the row can be purged
+    revoked_at : datetime
+        When the token was revoked (UTC), so workers only read the new rows on each sync
+    """
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, default=_utcnow, index=True)
@@ -1,4 +1,5 @@
 from .base import Base
+from .types import BinaryUUID
 import uuid
 from sqlalchemy import Column, String
 from sqlalchemy.orm import relationship
@@ -19,7 +20,7 @@ class Role(Base):
         The users assigned to the role
     """
     __tablename__ = 'roles'
-    id = Column(String(36), default=lambda: str(uuid.uuid4()), primary_key=True)
+    id = Column(BinaryUUID, default=lambda: str(uuid.uuid4()), primary_key=True)
     name = Column(String(50), nullable=False)
 
     users = relationship("User", secondary='user_roles', back_populates="roles")
\ No newline at end of file
@@ -0,0 +1,34 @@
+from sqlalchemy.types import TypeDecorator, String, BINARY
+import uuid
+
+
+class BinaryUUID(TypeDecorator):
+    """
+    UUID column stored as BINARY(16) on MySQL
+
+    Halves the width of the primary keys and of every foreign key index compared
+    to CHAR(36) text. Other databases (sqlite) keep the 36 character text form.
+    Either way the application only sees the canonical string form, e.g. in the
+    JWT `sub` claim.
+    """
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(BINARY(16))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == 'mysql':
+            return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(str(value)).bytes
+        return str(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == 'mysql':
+            return str(uuid.UUID(bytes=bytes(value)))
+        return value
@@ -0,0 +1,26 @@
+from typing import Annotated, Optional
+from fastapi import Request
+from fastapi.params import Depends
+
+"""
+This is the Dependencies module
+
+The request dependencies shared by the routers
+
+dependencies:
+-------------
+ClientIp
+    The client's IP address, None if unknown
+"""
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    The peer address, or the client's behind a proxy when uvicorn runs with --proxy-headers
+    :param request: the request
+    :return: the client's IP address, None if unknown
+    """
+    return request.client.host if request.client else None
+
+
+ClientIp = Annotated[Optional[str], Depends(client_ip)]
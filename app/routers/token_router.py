@@ -1,5 +1,31 @@
+from typing import Annotated
 from fastapi import APIRouter
-from app.schemas import Response
+from fastapi.params import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import database
+from app.handlers import token_handler
+from app.schemas import Response, RefreshRequest
+from .dependencies import ClientIp
+
+"""
+This is the Token Router module
+
+routes:
+-------
+POST /token
+    Get a JWT token (OAuth2 password flow)
+    This route requires a valid username and password, sent as a form
+    Returns a JWT token, and a refresh token
+    Rate limited per client IP and by failed logins per email, along with /login (429 with Retry-After)
+
+POST /token/refresh
+    Refresh a JWT token
+    This route requires a valid refresh token
+    Returns a new JWT token, and a new refresh token
+"""
+
+DbSession = Annotated[AsyncSession, Depends(database.get_db)]
 
 router = APIRouter(
     tags=["token"],
@@ -7,7 +33,13 @@ router = APIRouter(
 )
 
 @router.post("/")
-async def get_token() -> Response:
-    pass
-
+async def get_token(
+        user_login: Annotated[OAuth2PasswordRequestForm, Depends()],
+        session: DbSession,
+        client_ip: ClientIp
+) -> Response:
+    return await token_handler.get_token(user_login, session, client_ip=client_ip)
 
+@router.post("/refresh")
+async def refresh_token(refresh: RefreshRequest, session: DbSession) -> Response:
+    return await token_handler.refresh_token(refresh, session)
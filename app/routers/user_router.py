@@ -1,16 +1,20 @@
-from typing import Annotated
-from fastapi import APIRouter
+from typing import Annotated, Optional
+from fastapi import APIRouter, Query
 from fastapi.params import Depends
 from fastapi.security import (
     HTTPBearer,
     OAuth2PasswordBearer,
 )
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import database
 from app.handlers import user_handler
+from .dependencies import ClientIp
 from app.schemas import (
     UserLogin,
     Response,
     UserRegistration,
-    Password
+    Password,
+    RefreshRequest
 )
 
 """
@@ -34,33 +38,59 @@ POST /register
     Register a new user
     This route requires a valid username and password
     Returns a JWT token, and a refresh token
+    Rate limited per client IP (429 with Retry-After)
     
 POST /login
     Login a user
     This route requires a valid username and password
+    Rate limited per client IP and by failed logins per email (429 with Retry-After)
     
 POST /logout
     Logout a user
-    This route requires a valid JWT token
+    This route requires a valid JWT token, and optionally the refresh token to revoke with it
+
+GET /users
+    List the users, one page at a time
+    This route requires a valid JWT token with the admin role
+    Returns the users and an opaque cursor for the next page
 """
 
 # Create a router that always requires the bearer token
 bearer_scheme = HTTPBearer(bearerFormat="JWT")
 auth_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# One database session (unit of work) per request, committed when the route returns
+DbSession = Annotated[AsyncSession, Depends(database.get_db)]
+
 router = APIRouter(
     tags=["auth"],
 )
 
 @router.post("/register")
-async def register(user: UserRegistration) -> Response:
-    return user_handler.register(user)
+async def register(user: UserRegistration, session: DbSession, client_ip: ClientIp) -> Response:
+    return await user_handler.register(user, session, client_ip=client_ip)
 
 @router.post("/login")
-async def login(user: UserLogin) -> Response:
-    return user_handler.login(user)
+async def login(user: UserLogin, session: DbSession, client_ip: ClientIp) -> Response:
+    return await user_handler.login(user, session, client_ip=client_ip)
+
+@router.post("/logout")
+async def logout(
+        token: Annotated[str, Depends(auth_scheme)],
+        session: DbSession,
+        refresh: Optional[RefreshRequest] = None
+) -> Response:
+    return await user_handler.logout(token, refresh, session)
 
 @router.get("/password/reset")
-async def reset_password(password: Password, token: Annotated[str, Depends(auth_scheme)]) -> Response :
-    return user_handler.reset_password(token, password)
+async def reset_password(password: Password, token: Annotated[str, Depends(auth_scheme)], session: DbSession) -> Response :
+    return await user_handler.reset_password(token, password, session)
 
+@router.get("/users")
+async def list_users(
+        token: Annotated[str, Depends(auth_scheme)],
+        session: DbSession,
+        cursor: Optional[str] = None,
+        limit: Annotated[int, Query(ge=1, le=500)] = 50
+) -> Response:
+    return await user_handler.list_users(token, cursor, limit, session)
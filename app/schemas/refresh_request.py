@@ -1,9 +1,11 @@
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 
 
 class RefreshRequest(BaseModel):
     """
     This is the RefreshRequest schema.
     It is used to validate the refresh token in the request body, when requesting a token refresh.
+    The token is sent back under the key it was issued with, `refresh_token`;
+    `session_token`, its former name, is still accepted.
     """
-    session_token: str
\ No newline at end of file
+    refresh_token: str = Field(validation_alias=AliasChoices("refresh_token", "session_token"))
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel, Field
 
 """
@@ -12,17 +13,19 @@ Classes:
 """
 
 class User(BaseModel):
+    id: str = Field(..., examples=["7a60c528-14d8-4792-a022-8281375e724d"])
     firstname: str = Field(..., examples=["John"])
     lastname: str = Field(..., examples=["Doe"])
     email: str = Field(..., examples=["johndoe@mail.com"])
     roles: list[str] = Field(..., examples=[["user"]])
     two_factor_enabled: bool = Field(..., examples=[False])
-    profile_picture: str = Field(..., examples=["profile_picture.jpg"])
+    profile_picture: Optional[str] = Field(None, examples=["profile_picture.jpg"])
 
     class Config:
         from_attributes = True
         json_schema_extra = {
             "example": {
+                "id": "7a60c528-14d8-4792-a022-8281375e724d",
                 "firstname": "John",
                 "lastname": "Doe",
                 "email": "johndoe@mail.com",
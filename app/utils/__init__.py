@@ -1,4 +1,7 @@
-from .repository import Repository
+from .repository import Repository, AsyncRepository
 from .jwt_util import JwtUtil
-from .password_util import PasswordUtil
-from . import email_util
\ No newline at end of file
+from .password_util import PasswordUtil, PasswordPoolBusy
+from . import email_util
+from . import pagination
+from . import metrics
+from . import rate_limiter
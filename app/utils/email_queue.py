@@ -0,0 +1,215 @@
+from dataclasses import dataclass, field
+from email.mime.text import MIMEText
+from typing import Callable, Optional
+import logging
+import queue
+import smtplib
+import threading
+import time
+from .metrics import SMTP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedEmail:
+    to: str
+    message: MIMEText
+    attempts: int = 0
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class EmailQueue:
+    """
+    In-process email delivery queue
+
+    Worker threads take messages off the queue in batches and send each batch
+    over an SMTP connection they keep open between batches. A failed batch is
+    retried with exponential backoff on a new connection, as are transient (4xx)
+    replies; messages the server refuses for good (5xx), or that run out of
+    attempts, are logged and dropped.
+
+    Methods:
+    --------
+    start() -> None
+        Start the worker threads
+    stop(timeout: float) -> None
+        Send what is queued, then stop the workers
+    enqueue(to: str, message: MIMEText) -> None
+        Queue a message, returning immediately
+    depth() -> int
+        The number of messages waiting to be sent
+    """
+
+    def __init__(self, connect: Callable[[], smtplib.SMTP], sender: str, workers: int = 1,
+                 batch_size: int = 20, max_retries: int = 5, backoff: float = 1.0, idle_timeout: float = 60.0):
+        """
+        :param connect: opens an authenticated SMTP connection
+        :param sender: the envelope sender
+        :param workers: the number of worker threads, each with its own connection
+        :param batch_size: the most messages sent per batch
+        :param max_retries: the attempts made for a message before it is dropped
+        :param backoff: the delay before the first retry, doubled on every attempt
+        :param idle_timeout: connections idle for longer are checked with NOOP before reuse
+        """
+        self._connect = connect
+        self._sender = sender
+        self._workers = workers
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._idle_timeout = idle_timeout
+        self._queue: queue.Queue[Optional[QueuedEmail]] = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._run, name=f"email-queue-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        # One sentinel per worker, behind the messages already queued
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def enqueue(self, to: str, message: MIMEText):
+        if not self.running:
+            self.start()
+        self._queue.put(QueuedEmail(to=to, message=message))
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _next_batch(self) -> tuple[list[QueuedEmail], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        while len(batch) < self._batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        connection = None
+        last_used = 0.0
+        stopping = False
+
+        while not stopping:
+            batch, stopping = self._next_batch()
+
+            while batch:
+                if connection is not None and time.monotonic() - last_used > self._idle_timeout:
+                    connection = self._check(connection)
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    batch = self._send_batch(connection, batch)
+                    last_used = time.monotonic()
+                except (smtplib.SMTPException, OSError) as e:
+                    connection = self._close(connection)
+                    batch = self._retry(batch, e)
+
+        self._close(connection)
+
+    def _send_batch(self, connection: smtplib.SMTP, batch: list[QueuedEmail]) -> list[QueuedEmail]:
+        """
+        Send a batch, returning the messages still to send if the connection fails midway
+        """
+        for i, email in enumerate(batch):
+            started = time.perf_counter()
+            try:
+                connection.sendmail(self._sender, email.to, email.message.as_string())
+                SMTP_SECONDS.labels("sent").observe(time.perf_counter() - started)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused) as e:
+                if not _permanent(e):
+                    # A transient (4xx) reply, e.g. 421 or 451: this message and the rest are retried
+                    SMTP_SECONDS.labels("failed").observe(time.perf_counter() - started)
+                    email.attempts += 1
+                    raise _PartialBatch(batch[i:]) from e
+                # Refused by the server, sending it again would not help
+                SMTP_SECONDS.labels("refused").observe(time.perf_counter() - started)
+                logger.error(f"Email to {email.to} refused: {str(e)}")
+            except (smtplib.SMTPException, OSError):
+                # The connection is gone, this message and the rest are retried
+                SMTP_SECONDS.labels("failed").observe(time.perf_counter() - started)
+                email.attempts += 1
+                raise _PartialBatch(batch[i:])
+        return []
+
+    def _retry(self, batch: list[QueuedEmail], error: Exception) -> list[QueuedEmail]:
+        if isinstance(error, _PartialBatch):
+            batch = error.remaining
+        else:
+            for email in batch:
+                email.attempts += 1
+
+        for email in [email for email in batch if email.attempts >= self._max_retries]:
+            logger.error(f"Email to {email.to} dropped after {email.attempts} attempts: {str(error)}")
+        batch = [email for email in batch if email.attempts < self._max_retries]
+
+        if batch:
+            # Messages of a partial batch not tried yet have no attempts, the delay is at least the first one
+            attempts = max(min(email.attempts for email in batch), 1)
+            delay = self._backoff * 2 ** (attempts - 1)
+            logger.warning(f"Email delivery failed, retrying {len(batch)} messages in {delay:.1f}s: {str(error)}")
+            time.sleep(delay)
+        return batch
+
+    @classmethod
+    def _check(cls, connection: smtplib.SMTP) -> Optional[smtplib.SMTP]:
+        """
+        Check an idle connection, the server may have closed it in the meantime
+        """
+        try:
+            if connection.noop()[0] == 250:
+                return connection
+        except (smtplib.SMTPException, OSError):
+            pass
+        return cls._close(connection)
+
+    @staticmethod
+    def _close(connection: Optional[smtplib.SMTP]) -> None:
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+        return None
+
+
+def _permanent(error: smtplib.SMTPException) -> bool:
+    """
+    Whether the server refused for good (5xx), rather than for now (4xx)
+    SMTPRecipientsRefused carries a code per recipient, it is permanent if any is
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    else:
+        codes = [error.smtp_code]
+    return any(code >= 500 for code in codes)
+
+
+class _PartialBatch(smtplib.SMTPException):
+    def __init__(self, remaining: list[QueuedEmail]):
+        super().__init__("Connection lost while sending a batch")
+        self.remaining = remaining
@@ -1,34 +1,137 @@
 import smtplib
 from email.mime.text import MIMEText
+from .email_queue import EmailQueue
 import os
 
 _template_dir = os.path.join(os.path.dirname(__file__), "templates")
-def _template(name: str):
-    return _template_dir + f"/{name}.html"
+
+# Template configuration
+_TemplateConfig: dict = {
+    # Re-read templates changed on disk, for development only
+    "AUTO_RELOAD": os.getenv("EMAIL_TEMPLATE_RELOAD", "false").lower() == "true",
+    # Where compiled templates are kept between restarts, the system temp directory by default
+    "CACHE_DIR": os.getenv("EMAIL_TEMPLATE_CACHE_DIR") or None,
+}
+
+_environment = None
+_templates: dict = {}
+
+def _get_environment():
+    """
+    The template environment, created on first use so jinja2 is only imported
+    once a template is needed
+    """
+    global _environment
+    if _environment is None:
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, StrictUndefined, select_autoescape
+        _environment = Environment(
+            loader=FileSystemLoader(_template_dir),
+            bytecode_cache=FileSystemBytecodeCache(_TemplateConfig["CACHE_DIR"]),
+            auto_reload=_TemplateConfig["AUTO_RELOAD"],
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+        )
+    return _environment
+
+def load_templates() -> None:
+    """
+    Load and compile every template once, so a broken template fails at startup
+    rather than on the first email using it
+    """
+    environment = _get_environment()
+    _templates.update({
+        os.path.splitext(name)[0]: environment.get_template(name)
+        for name in environment.list_templates(extensions=["html"])
+    })
+
+def _render(name: str, **context) -> str:
+    """
+    Render a template
+    :param name: The template name, without the .html extension
+    :param context: The template variables
+    """
+    if not _templates:
+        load_templates()
+    if _TemplateConfig["AUTO_RELOAD"]:
+        # Goes through the environment, which recompiles the template if its file changed
+        return _get_environment().get_template(f"{name}.html").render(**context)
+    return _templates[name].render(**context)
 
 _smtp_server: dict = {
     "host": os.getenv("SMTP_HOST", "smtp.gmail.com"),
-    "port": os.getenv("SMTP_PORT", "25"),
+    "port": int(os.getenv("SMTP_PORT", "25")),
     "user": os.getenv("SMTP_USER", "user"),
     "password": os.getenv("SMTP_PASSWORD", "password"),
+    "starttls": os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+    "timeout": float(os.getenv("SMTP_TIMEOUT", "10")),
+}
+
+# Delivery queue configuration
+_EmailQueueConfig: dict = {
+    "WORKERS": int(os.getenv("EMAIL_WORKERS", "1")),
+    "BATCH_SIZE": int(os.getenv("EMAIL_BATCH_SIZE", "20")),
+    "MAX_RETRIES": int(os.getenv("EMAIL_MAX_RETRIES", "5")),
+    "RETRY_BACKOFF": float(os.getenv("EMAIL_RETRY_BACKOFF", "1.0")),
+    "IDLE_TIMEOUT": float(os.getenv("EMAIL_IDLE_TIMEOUT", "60")),
 }
 
+def _connect() -> smtplib.SMTP:
+    """
+    Open an authenticated SMTP connection, kept open by the queue workers between batches
+    """
+    server = smtplib.SMTP(_smtp_server["host"], _smtp_server["port"], timeout=_smtp_server["timeout"])
+    try:
+        if _smtp_server["starttls"]:
+            server.starttls()
+        if _smtp_server["user"] and _smtp_server["password"]:
+            server.login(_smtp_server["user"], _smtp_server["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+_queue = EmailQueue(
+    connect=_connect,
+    sender=_smtp_server["user"],
+    workers=_EmailQueueConfig["WORKERS"],
+    batch_size=_EmailQueueConfig["BATCH_SIZE"],
+    max_retries=_EmailQueueConfig["MAX_RETRIES"],
+    backoff=_EmailQueueConfig["RETRY_BACKOFF"],
+    idle_timeout=_EmailQueueConfig["IDLE_TIMEOUT"],
+)
+
+def start_queue() -> None:
+    """
+    Start the delivery workers
+    """
+    _queue.start()
+
+def stop_queue(timeout: float = 10.0) -> None:
+    """
+    Send the queued emails and stop the delivery workers
+    :param timeout: How long to wait for each worker to finish
+    """
+    _queue.stop(timeout)
+
+def queue_depth() -> int:
+    """
+    The number of emails waiting to be sent
+    """
+    return _queue.depth()
+
 def _send_email(to: str, subject: str, body: str) -> None:
     """
-    Send an email
+    Queue an email for delivery, returning without waiting for the SMTP server
     :param to: The email address to send the email to
     :param subject: The subject of the email
     :param body: The body of the email
     """
-    msg = MIMEText(body)
+    msg = MIMEText(body, "html")
     msg["Subject"] = subject
     msg["From"] = _smtp_server["user"]
     msg["To"] = to
 
-    with smtplib.SMTP(_smtp_server["host"], _smtp_server["port"]) as server:
-        server.starttls()
-        server.login(_smtp_server["user"], _smtp_server["password"])
-        server.sendmail(_smtp_server["host"], to, msg.as_string())
+    _queue.enqueue(to, msg)
 
 def send_password_reset_email(to: str, reset_code: str) -> None:
     """
@@ -36,9 +139,7 @@ def send_password_reset_email(to: str, reset_code: str) -> None:
     :param to: The email address to send the email to
     :param reset_code: The password reset code
     """
-    with open(_template("password-reset")) as file:
-        body = file.read().replace("{{reset_code}}", reset_code)
-        _send_email(to, "Password Reset", body)
+    _send_email(to, "Password Reset", _render("password-reset", reset_code=reset_code))
 
 def send_verification_email(to: str, verification_code: str) -> None:
     """
@@ -46,6 +147,4 @@ def send_verification_email(to: str, verification_code: str) -> None:
     :param to: The email address to send the email to
     :param verification_code: The verification code
     """
-    with open(_template("verification")) as file:
-        body = file.read().replace("{{verification_code}}", verification_code)
-        _send_email(to, "Email Verification", body)
+    _send_email(to, "Email Verification", _render("verification", verification_code=verification_code))
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+import fcntl
+import os
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    """
+    Hold an exclusive advisory lock on a file
+    The lock is shared by every process on the host that opens the same path,
+    so it can be used to serialize work across uvicorn workers
+    :param path: the lock file, created if missing
+    :param blocking: wait for the lock if True, otherwise give up immediately
+    :return: a context manager yielding True if the lock was acquired
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "a") as file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(file, flags)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
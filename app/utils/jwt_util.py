@@ -1,96 +1,331 @@
 from fastapi import HTTPException
-from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.backends import default_backend
 from datetime import datetime, timedelta
+from calendar import timegm
+from typing import Iterable
+from jwt.algorithms import get_default_algorithms
+from jwt.utils import base64url_encode
+from .key_store import KeyStore, ACTIVE, ALGORITHMS, generate_private_key
+from .token_cache import TokenCache
+from .revocation_list import RevocationList
+from .metrics import JWT_SIGN, JWT_VERIFY
+import json
+import time
+import uuid
 import jwt
 import pytz
+import os
+
+# JWT configuration
+_JwtConfig = {
+    "ALGORITHM": os.getenv("JWT_ALGORITHM", "RS256"),
+    "ACCEPTED_ALGORITHMS": [alg.strip() for alg in os.getenv("JWT_ACCEPTED_ALGORITHMS", "").split(",") if alg.strip()],
+    # Switch the stored key to ALGORITHM on startup, if it is of another one
+    "SWITCH_ALGORITHM": os.getenv("JWT_SWITCH_ALGORITHM", "false").lower() == "true",
+    "KEY_SIZE": int(os.getenv("JWT_KEY_SIZE", "2048")),
+    "CACHE_SIZE": int(os.getenv("JWT_CACHE_SIZE", "10000")),
+    "REVOCATION_CAPACITY": int(os.getenv("JWT_REVOCATION_CAPACITY", "100000")),
+}
+
+if _JwtConfig["ALGORITHM"] not in ALGORITHMS:
+    raise ValueError(f"JWT_ALGORITHM must be one of {', '.join(ALGORITHMS)}, not '{_JwtConfig['ALGORITHM']}'")
 
 
 class JwtUtil:
+    """
+    JWT utility class
+
+    The key material is serialized and prepared once per key set: the PEM
+    encodings, the key objects handed to the signing algorithm and the encoded
+    header segment of each algorithm are cached and reused for every token.
+
+    Every token carries the `kid` of the key that signed it, and every key in
+    the set (active and retiring) is accepted for verification.
+
+    The signing algorithm is set per deployment with JWT_ALGORITHM (RS256, PS256,
+    ES256 or EdDSA, among others). It only applies to new keys: a stored key of
+    another algorithm is kept until it is due for rotation, unless the replicas
+    start with JWT_SWITCH_ALGORITHM=true, where the first one to start replaces it.
+    JWT_ACCEPTED_ALGORITHMS lists the algorithms still accepted for verification,
+    e.g. "RS256,EdDSA" while migrating from RS256.
+
+    Verified tokens are kept in a bounded LRU (JWT_CACHE_SIZE entries, 0 disables
+    it) until their `exp`, so a token presented again skips the signature check.
+
+    Every token carries a `jti`. Revoked ids are held in memory until the token's
+    `exp` (see RevocationList) and checked on every decode, cached or not; the
+    scheduler keeps them in sync with the revoked_tokens table.
+
+    Methods:
+    --------
+    generate_keys(key_size: int) -> None
+        Generate an in-memory key, private to this process
+    load_keys(store: KeyStore, rotate: bool) -> None
+        Load the keys shared through the key store, creating one if needed
+    refresh_keys() -> None
+        Rotate the stored keys when due and reload them
+    get_public_key_jwk() -> dict
+        The JSON Web Key of the active public key
+    get_jwks() -> dict
+        The JSON Web Key Set of the verification keys
+    cache_stats() -> dict
+        The counters of the verified token cache
+    revoke(jti: str, exp: int) -> None
+        Revoke a token in this process
+    load_revocations(entries: Iterable[tuple]) -> None
+        Replace the revoked tokens with the (jti, exp) entries given
+    """
     _KEYS: dict[str] = {
+        "kid": None,
+        "alg": None,
         "private": None,
-        "public": None
+        "public": None,
+        "private_pem": None,
+        "public_pem": None,
+        "verify": {},
     }
+    _STORE: KeyStore = None
+    _RELOAD_INTERVAL = 30
+    _LAST_RELOAD = 0.0
+    _ALGORITHMS = get_default_algorithms()
+    _HEADERS: dict[tuple, bytes] = {}
+    _CACHE = TokenCache(max_size=_JwtConfig["CACHE_SIZE"])
+    _REVOKED = RevocationList(capacity=_JwtConfig["REVOCATION_CAPACITY"])
 
     @classmethod
-    def generate_keys(cls, key_size=2048):
+    def generate_keys(cls, key_size=None, algorithm=None):
         if cls._KEYS["private"] is not None or cls._KEYS["public"] is not None:
             raise ValueError("Keys already generated. Call 'generate_keys()' only once.")
 
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=key_size,
-            backend=default_backend()
-        )
+        algorithm = algorithm or _JwtConfig["ALGORITHM"]
+        private_key = generate_private_key(algorithm, key_size or _JwtConfig["KEY_SIZE"])
+        cls._set_keys([{"kid": uuid.uuid4().hex, "alg": algorithm, "status": ACTIVE, "key": private_key}])
+
+    @classmethod
+    def load_keys(cls, store: KeyStore = None, rotate: bool = True):
+        """
+        Load the keys shared through the key store
+        :param store: the key store, the configured directory by default
+        :param rotate: rotate the stored keys first if due; when False the existing keys are
+            loaded as they are (a key is only created if the store has none) and rotation is
+            left to the scheduler
+        """
+        cls._STORE = store or KeyStore(algorithm=_JwtConfig["ALGORITHM"], key_size=_JwtConfig["KEY_SIZE"])
+        if _JwtConfig["SWITCH_ALGORITHM"]:
+            # Asked for explicitly, in either startup mode
+            cls._STORE.rotate(switch_algorithm=True)
+        if not rotate:
+            cls._set_keys(cls._STORE.load())
+            return
+        cls.refresh_keys()
+
+    @classmethod
+    def refresh_keys(cls):
+        """
+        Rotate the stored keys if the active key is due, then reload them
+        Every worker runs this, so keys rotated by another process are picked up as well
+        """
+        if cls._STORE is None:
+            return
+
+        cls._STORE.rotate()
+        cls._set_keys(cls._STORE.load())
+
+    @classmethod
+    def _set_keys(cls, entries: list[dict]):
+        active = next(entry for entry in entries if entry["status"] == ACTIVE)
+        private_key = active["key"]
         public_key = private_key.public_key()
 
-        cls._KEYS["private"] = private_key
-        cls._KEYS["public"] = public_key
+        # Tokens signed by keys that left the set must not be served from the cache anymore
+        removed = set(cls._KEYS["verify"]) - {entry["kid"] for entry in entries}
+        if removed:
+            cls._CACHE.purge(removed)
+
+        # Swap the whole key set at once, so concurrent readers never see a mix of two sets
+        cls._HEADERS = {}
+        cls._KEYS = {
+            "kid": active["kid"],
+            "alg": active["alg"],
+            "private": private_key,
+            "public": public_key,
+            "private_pem": private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ),
+            "public_pem": public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            ),
+            "verify": {entry["kid"]: (entry["alg"], entry["key"].public_key()) for entry in entries},
+        }
+        cls._LAST_RELOAD = time.monotonic()
 
     @classmethod
     def get_private_key_pem(cls) -> bytes:
         if cls._KEYS["private"] is None:
             raise ValueError("Private key not generated. Call 'generate_keys()' first.")
 
-        pem = cls._KEYS["private"].private_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption()
-        )
-        return pem
+        return cls._KEYS["private_pem"]
 
     @classmethod
     def get_public_key_pem(cls) -> bytes:
         if cls._KEYS["public"] is None:
             raise ValueError("Public key not generated. Call 'generate_keys()' first.")
 
-        pem = cls._KEYS["public"].public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        return pem
+        return cls._KEYS["public_pem"]
 
     @classmethod
-    def encode_jwt(cls, payload: dict, algorithm='RS256', exp: timedelta = timedelta(minutes=15)) -> str:
-        if cls._KEYS["private"] is None:
+    def get_public_key_jwk(cls) -> dict:
+        if cls._KEYS["public"] is None:
+            raise ValueError("Public key not generated. Call 'generate_keys()' first.")
+
+        return cls._to_jwk(cls._KEYS["kid"], *cls._KEYS["verify"][cls._KEYS["kid"]])
+
+    @classmethod
+    def get_jwks(cls) -> dict:
+        return {"keys": [cls._to_jwk(kid, alg, key) for kid, (alg, key) in cls._KEYS["verify"].items()]}
+
+    @classmethod
+    def _to_jwk(cls, kid: str, algorithm: str, public_key) -> dict:
+        jwk = cls._get_algorithm(algorithm).to_jwk(public_key, as_dict=True)
+        jwk.pop("key_ops", None)
+        jwk.update({"kid": kid, "use": "sig", "alg": algorithm})
+        return jwk
+
+    @classmethod
+    def encode_jwt(cls, payload: dict, algorithm=None, exp: timedelta = timedelta(minutes=15)) -> str:
+        keys = cls._KEYS
+        if keys["private"] is None:
             raise ValueError("Private key not generated. Call 'generate_keys()' first.")
 
+        algorithm = algorithm or keys["alg"]
+
         # Merge the provided payload with the default payload
         default_payload = cls._get_default_payload(exp)
         payload.update(default_payload)
 
-        token = jwt.encode(payload, cls.get_private_key_pem(), algorithm=algorithm)
-        return token
+        claims = {
+            key: timegm(value.utctimetuple()) if isinstance(value, datetime) else value
+            for key, value in payload.items()
+        }
+        signing_input = b".".join([
+            cls._get_header_segment(algorithm, keys["kid"]),
+            base64url_encode(json.dumps(claims, separators=(",", ":")).encode("utf-8")),
+        ])
+        with JWT_SIGN.time():
+            signature = cls._get_algorithm(algorithm).sign(signing_input, keys["private"])
+
+        return b".".join([signing_input, base64url_encode(signature)]).decode("utf-8")
 
     @classmethod
     def decode_jwt(cls, token: str, algorithms=None) -> dict:
-        if algorithms is None:
-            algorithms = ['RS256']
+        # Only tokens checked against the configured algorithms are cached
+        use_cache = algorithms is None
+        if use_cache:
+            payload = cls._CACHE.get(token)
+            if payload is not None:
+                return cls._check_revoked(payload)
+            algorithms = cls._get_accepted_algorithms()
         if cls._KEYS["public"] is None:
             raise ValueError("Public key not generated. Call 'generate_keys()' first.")
 
         try:
-            payload = jwt.decode(
-                token.encode("utf-8"),
-                cls.get_public_key_pem(),
-                algorithms=algorithms,
-                verify={
-                    "exp": True,
-                    "iss": False,
-                    "aud": False,
-                }
-            )
-            return payload
+            kid = jwt.get_unverified_header(token).get("kid")
+            key_algorithm, key = cls._get_verification_key(kid)
+            if key_algorithm not in algorithms:
+                raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+            # Only the algorithm of the selected key is allowed, so a token can never
+            # be checked with a key of another type
+            with JWT_VERIFY.time():
+                payload = jwt.decode(
+                    token.encode("utf-8"),
+                    key,
+                    algorithms=[key_algorithm],
+                    options={
+                        "verify_exp": True,
+                        "verify_iss": False,
+                        "verify_aud": False,
+                    }
+                )
+            if use_cache:
+                cls._CACHE.put(token, payload, kid)
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Token has expired")
         except jwt.InvalidTokenError as e:
             raise HTTPException(status_code=401, detail="Invalid token: " + str(e))
 
+        return cls._check_revoked(payload)
+
+    @classmethod
+    def _check_revoked(cls, payload: dict) -> dict:
+        if cls._REVOKED.is_revoked(payload.get("jti")):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        return payload
+
+    @classmethod
+    def revoke(cls, jti: str, exp: int):
+        cls._REVOKED.add(jti, exp)
+
+    @classmethod
+    def load_revocations(cls, entries: Iterable[tuple]):
+        cls._REVOKED.replace(entries)
+
+    @classmethod
+    def revocation_stats(cls) -> dict:
+        return cls._REVOKED.stats()
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return cls._CACHE.stats()
+
+    @classmethod
+    def _get_accepted_algorithms(cls) -> list[str]:
+        # The signing algorithm is always accepted, on top of the configured ones
+        return _JwtConfig["ACCEPTED_ALGORITHMS"] + [cls._KEYS["alg"]]
+
+    @classmethod
+    def _get_verification_key(cls, kid: str) -> tuple:
+        """
+        Find the algorithm and public key for a kid
+        Tokens without a kid are checked against the active key. An unknown kid
+        triggers a throttled reload, as another worker may have just rotated.
+        """
+        if kid is None:
+            return cls._KEYS["alg"], cls._KEYS["public"]
+
+        key = cls._KEYS["verify"].get(kid)
+        if key is None and cls._STORE is not None and time.monotonic() - cls._LAST_RELOAD > cls._RELOAD_INTERVAL:
+            cls._set_keys(cls._STORE.load(create=False))
+            key = cls._KEYS["verify"].get(kid)
+
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id '{kid}'")
+        return key
+
+    @classmethod
+    def _get_algorithm(cls, algorithm: str):
+        # A configuration error, the keys are only ever generated for these
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Algorithm must be one of {', '.join(ALGORITHMS)}, not '{algorithm}'")
+        return cls._ALGORITHMS[algorithm]
+
+    @classmethod
+    def _get_header_segment(cls, algorithm: str, kid: str) -> bytes:
+        segment = cls._HEADERS.get((algorithm, kid))
+        if segment is None:
+            header = json.dumps({"typ": "JWT", "alg": algorithm, "kid": kid}, separators=(",", ":"))
+            segment = base64url_encode(header.encode("utf-8"))
+            cls._HEADERS[(algorithm, kid)] = segment
+        return segment
+
     @classmethod
     def _get_default_payload(cls, exp: timedelta) -> dict:
         now = datetime.now(pytz.utc)
         return {
             "iss": "OF-AuthService",
             "exp": now + exp,
+            "jti": uuid.uuid4().hex,
         }
@@ -0,0 +1,213 @@
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.backends import default_backend
+from .file_lock import file_lock
+import json
+import time
+import uuid
+import os
+
+"""
+This is the Key Store module
+
+The module persists the JWT signing keys on disk so every worker and replica
+sharing the directory signs and verifies with the same keys.
+
+layout:
+-------
+<directory>/keys.json
+    The manifest, listing every key with its kid, algorithm, status and timestamps
+<directory>/<kid>.pem
+    The PKCS8 private key for each key in the manifest
+<directory>/.lock
+    The lock file serializing writers across processes
+"""
+
+# Key store configuration
+_KeyStoreConfig = {
+    "DIRECTORY": os.getenv("JWT_KEY_DIR", "keys"),
+    "ROTATION_DAYS": float(os.getenv("JWT_KEY_ROTATION_DAYS", "30")),
+    "RETENTION_HOURS": float(os.getenv("JWT_KEY_RETENTION_HOURS", "24")),
+}
+
+ACTIVE = "active"
+RETIRING = "retiring"
+
+# The JWT algorithms keys can be generated for
+ALGORITHMS = ("RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512", "EdDSA")
+
+# Curves used by the ECDSA algorithms
+_curves = {
+    "ES256": ec.SECP256R1(),
+    "ES384": ec.SECP384R1(),
+    "ES512": ec.SECP521R1(),
+}
+
+
+def generate_private_key(algorithm: str, key_size: int = 2048):
+    """
+    Generate a private key of the type required by a JWT algorithm
+    :param algorithm: RS256/RS384/RS512, PS256/PS384/PS512, ES256/ES384/ES512 or EdDSA
+    :param key_size: the modulus size for RSA keys
+    :return: the private key
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Algorithm must be one of {', '.join(ALGORITHMS)}, not '{algorithm}'")
+
+    if algorithm[:2] in ("RS", "PS"):
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=key_size,
+            backend=default_backend()
+        )
+    elif algorithm in _curves:
+        return ec.generate_private_key(_curves[algorithm], backend=default_backend())
+    else:
+        return ed25519.Ed25519PrivateKey.generate()
+
+
+class KeyStore:
+    """
+    File based store for the JWT signing keys
+
+    Exactly one key is active and used for signing. Rotated keys are kept as
+    retiring for the retention period, so tokens they signed still verify.
+
+    Methods:
+    --------
+    load(create: bool) -> list[dict]
+        Load every key, creating an active key if there is none
+    rotate(force: bool, switch_algorithm: bool) -> bool
+        Replace the active key once it is older than the rotation period, or
+        when asked to switch it to the configured algorithm
+
+    A different configured algorithm alone never rotates the key: replicas may
+    run different JWT_ALGORITHM values during a rolling deploy, and would
+    otherwise keep rotating each other's key. The switch has to be asked for.
+    """
+
+    def __init__(self, directory: str = None, algorithm: str = "RS256", key_size: int = 2048):
+        self.directory = directory or _KeyStoreConfig["DIRECTORY"]
+        self.algorithm = algorithm
+        self.key_size = key_size
+        # Keys already loaded and validated by this process
+        self._validated: set[str] = set()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, "keys.json")
+
+    @property
+    def _lock_path(self) -> str:
+        return os.path.join(self.directory, ".lock")
+
+    def _key_path(self, kid: str) -> str:
+        return os.path.join(self.directory, f"{kid}.pem")
+
+    def load(self, create: bool = True) -> list[dict]:
+        """
+        Load the keys from the store
+        :param create: create an active key if the store has none
+        :return: the manifest entries, each with its private key under "key"
+        """
+        with file_lock(self._lock_path):
+            manifest = self._read_manifest()
+
+            if create and not any(entry["status"] == ACTIVE for entry in manifest):
+                manifest.append(self._create_key())
+                self._write_manifest(manifest)
+
+            return [
+                dict(entry, alg=entry.get("alg", "RS256"), key=self._read_key(entry["kid"]))
+                for entry in manifest
+            ]
+
+    def rotate(self, force: bool = False, switch_algorithm: bool = False) -> bool:
+        """
+        Rotate the active key if it is due, and drop retiring keys past their retention
+        Safe to call from every worker, the first caller does the work
+        :param force: rotate even if the active key is not due yet
+        :param switch_algorithm: rotate if the active key is not of the configured algorithm;
+            once the first caller has switched it, the others find it matching and leave it
+        :return: True if the manifest changed
+        """
+        now = time.time()
+        max_age = _KeyStoreConfig["ROTATION_DAYS"] * 86400
+        retention = _KeyStoreConfig["RETENTION_HOURS"] * 3600
+
+        with file_lock(self._lock_path):
+            manifest = self._read_manifest()
+            changed = False
+
+            for entry in list(manifest):
+                if entry["status"] == RETIRING and entry["retired_at"] + retention < now:
+                    manifest.remove(entry)
+                    self._remove_key(entry["kid"])
+                    changed = True
+
+            active = [entry for entry in manifest if entry["status"] == ACTIVE]
+            if force or not active or any(
+                entry["created_at"] + max_age < now
+                or (switch_algorithm and entry.get("alg", "RS256") != self.algorithm)
+                for entry in active
+            ):
+                for entry in active:
+                    entry["status"] = RETIRING
+                    entry["retired_at"] = now
+                manifest.append(self._create_key())
+                changed = True
+
+            if changed:
+                self._write_manifest(manifest)
+            return changed
+
+    def _create_key(self) -> dict:
+        private_key = generate_private_key(self.algorithm, self.key_size)
+        kid = uuid.uuid4().hex
+
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        self._write_file(self._key_path(kid), pem)
+
+        return {"kid": kid, "alg": self.algorithm, "status": ACTIVE, "created_at": time.time()}
+
+    def _read_key(self, kid: str):
+        with open(self._key_path(kid), "rb") as file:
+            # Each key is fully validated the first time it is loaded; the costly RSA
+            # consistency checks (tens of milliseconds per key) are skipped on the
+            # periodic reloads of a key that already passed them
+            key = serialization.load_pem_private_key(
+                file.read(), password=None, unsafe_skip_rsa_key_validation=kid in self._validated
+            )
+        self._validated.add(kid)
+        return key
+
+    def _remove_key(self, kid: str):
+        try:
+            os.remove(self._key_path(kid))
+        except FileNotFoundError:
+            pass
+
+    def _read_manifest(self) -> list[dict]:
+        try:
+            with open(self._manifest_path) as file:
+                return json.load(file)["keys"]
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, manifest: list[dict]):
+        self._write_file(self._manifest_path, json.dumps({"keys": manifest}, indent=2).encode("utf-8"))
+
+    @staticmethod
+    def _write_file(path: str, content: bytes):
+        """
+        Write a file atomically, readable by the owner only
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(tmp_path, path)
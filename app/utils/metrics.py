@@ -0,0 +1,134 @@
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import time
+
+"""
+This is the Metrics module
+
+Prometheus metrics for the hot paths, exposed at /metrics:
+
+- http_request_duration_seconds{method, route, status}: request latency, by route template
+- bcrypt_duration_seconds{operation}: hashing and checking, including the wait for a pool worker
+- jwt_duration_seconds{operation}: signing and full verification (verified cache hits are counted
+  by jwt_cache_hits_total instead, timing them would cost as much as the hit itself)
+- db_statement_duration_seconds{operation}: every statement sent by the repositories, by SQL verb
+- smtp_send_duration_seconds{outcome}: each message sent by the email queue
+- rate_limited_total{rule}: attempts turned away by the rate limiter, by limit (e.g. login_ip)
+
+The gauges (DB pool, scheduler jobs, email queue, token cache) are read when
+scraped, so they add nothing to the request path.
+
+Each worker process has its own metrics; set PROMETHEUS_MULTIPROC_DIR to an empty
+shared directory to aggregate the histograms of every worker.
+
+methods:
+--------
+render() -> tuple[bytes, str]
+    The metrics in the Prometheus text format, and its content type
+"""
+
+# Latency buckets from 1ms to 10s, the range of everything timed here
+_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"], buckets=_BUCKETS
+)
+BCRYPT_SECONDS = Histogram("bcrypt_duration_seconds", "bcrypt call latency", ["operation"], buckets=_BUCKETS)
+JWT_SECONDS = Histogram("jwt_duration_seconds", "JWT signing and verification latency", ["operation"], buckets=_BUCKETS)
+DB_SECONDS = Histogram(
+    "db_statement_duration_seconds", "Database statement latency", ["operation"], buckets=_BUCKETS
+)
+SMTP_SECONDS = Histogram("smtp_send_duration_seconds", "SMTP send latency", ["outcome"], buckets=_BUCKETS)
+RATE_LIMITED = Counter("rate_limited_total", "Attempts rejected by the rate limiter", ["rule"])
+
+# Children bound once, so the hot paths skip the label lookup
+BCRYPT_HASH = BCRYPT_SECONDS.labels("hash")
+BCRYPT_CHECK = BCRYPT_SECONDS.labels("check")
+JWT_SIGN = JWT_SECONDS.labels("sign")
+JWT_VERIFY = JWT_SECONDS.labels("verify")
+
+
+_DB_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation = statement.lstrip()[:6].upper()
+    DB_SECONDS.labels(operation if operation in _DB_OPERATIONS else "OTHER").observe(
+        time.perf_counter() - conn.info["statement_started"]
+    )
+
+
+class _StateCollector(Collector):
+    """
+    Gauges read from the application state at scrape time
+    """
+
+    def describe(self):
+        # Keeps the registry from calling collect at registration, before the app is loaded
+        return []
+
+    def collect(self):
+        from app.config import database, job_stats
+        from app.utils import JwtUtil, email_util
+
+        pool = GaugeMetricFamily("db_pool_connections", "Database pool connections", labels=["engine", "state"])
+        for engine, status in database.pool_status().items():
+            for state, value in status.items():
+                pool.add_metric([engine, state], value)
+        yield pool
+
+        jobs = job_stats()
+        duration = GaugeMetricFamily(
+            "scheduler_job_last_duration_seconds", "Duration of the last run of a job", labels=["job"]
+        )
+        rows = GaugeMetricFamily("scheduler_job_last_rows", "Rows removed by the last run of a job", labels=["job"])
+        last_run = GaugeMetricFamily(
+            "scheduler_job_last_run_timestamp_seconds", "When a job last ran", labels=["job"]
+        )
+        status = GaugeMetricFamily(
+            "scheduler_job_last_status", "Status of the last run of a job (1 for the current status)",
+            labels=["job", "status"]
+        )
+        for job_id, run in jobs.items():
+            duration.add_metric([job_id], run["duration"])
+            last_run.add_metric([job_id], run["last_run"])
+            status.add_metric([job_id, run["status"]], 1)
+            if run["rows"] is not None:
+                rows.add_metric([job_id], run["rows"])
+        yield from (duration, rows, last_run, status)
+
+        yield GaugeMetricFamily("email_queue_depth", "Emails waiting to be sent", value=email_util.queue_depth())
+
+        cache = JwtUtil.cache_stats()
+        yield CounterMetricFamily("jwt_cache_hits", "Verified token cache hits", value=cache["hits"])
+        yield CounterMetricFamily("jwt_cache_misses", "Verified token cache misses", value=cache["misses"])
+        yield GaugeMetricFamily("jwt_cache_size", "Verified tokens cached", value=cache["size"])
+        yield GaugeMetricFamily(
+            "jwt_revoked_tokens", "Revoked tokens held in memory", value=JwtUtil.revocation_stats()["size"]
+        )
+
+
+REGISTRY.register(_StateCollector())
+
+
+def render() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        # The histograms of every worker, plus this worker's state gauges
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StateCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,41 @@
+from typing import Any
+import base64
+import binascii
+import json
+
+"""
+This is the Pagination module
+
+Keyset pagination cursors are the key of the last row of a page, wrapped in an
+opaque url-safe token so clients cannot depend on their content.
+
+functions:
+----------
+encode_cursor
+    Wrap a key in an opaque cursor
+decode_cursor
+    Unwrap a cursor, raising ValueError if it is malformed or its key of the wrong type
+"""
+
+
+def encode_cursor(key: Any) -> str:
+    payload = json.dumps({"k": key}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type = str) -> Any:
+    """
+    :param cursor: the cursor, as sent by the client
+    :param key_type: the type of the key (str or int), a tampered cursor may hold anything
+    :return: the key
+    :raises ValueError: if the cursor is malformed, or its key is not of key_type
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["k"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    # bool is an int to isinstance, but never a key
+    if not isinstance(key, key_type) or isinstance(key, bool):
+        raise ValueError("Invalid cursor")
+    return key
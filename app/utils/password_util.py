@@ -1,9 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from typing import Optional
+import asyncio
+import os
 import bcrypt
+from .metrics import BCRYPT_HASH, BCRYPT_CHECK
+
+# Password hashing pool configuration
+_PasswordConfig = {
+    "POOL_SIZE": int(os.getenv("BCRYPT_POOL_SIZE", os.cpu_count() or 1)),
+    "QUEUE_DEPTH": int(os.getenv("BCRYPT_QUEUE_DEPTH", "64")),
+    # The bcrypt cost factor of new hashes; existing hashes keep the cost they were made with
+    "ROUNDS": int(os.getenv("BCRYPT_ROUNDS", "12")),
+}
+
+
+def _hashpw(password: bytes, rounds: int = None) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds or _PasswordConfig["ROUNDS"]))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def _to_bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+class PasswordPoolBusy(HTTPException):
+    """
+    Raised when every worker of the bcrypt pool is busy and its queue is full,
+    answered with a 503 and a Retry-After header
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Too many password checks in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
+
 
 class PasswordUtil:
     """
     Password utility class
 
+    The async methods run bcrypt in a process pool of BCRYPT_POOL_SIZE workers,
+    with at most BCRYPT_QUEUE_DEPTH calls waiting for a free worker. Calls made
+    while the queue is full fail right away with PasswordPoolBusy, so a flood
+    of logins is shed instead of making every request wait longer.
+
     Methods:
     --------
     hash_password(password: str) -> str
@@ -11,12 +57,89 @@ class PasswordUtil:
 
     check_password(password: str, hashed: str) -> bool
         Check if a password matches a hashed password
+
+    hash_password_async(password: str) -> str
+        Hash a password using bcrypt in the process pool
+        Raises PasswordPoolBusy if the pool's queue is full
+
+    check_password_async(password: str, hashed: str) -> bool
+        Check a password against a hash in the process pool
+        Raises PasswordPoolBusy if the pool's queue is full
+
+    start_pool(size: int, queue_depth: int) -> None
+        Start the process pool used by the async methods
+
+    shutdown_pool() -> None
+        Stop the process pool
     """
+    _POOL: Optional[ProcessPoolExecutor] = None
+    _SLOTS: Optional[asyncio.Semaphore] = None
 
     @staticmethod
-    def hash_password(password):
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    def hash_password(password) -> str:
+        with BCRYPT_HASH.time():
+            return _hashpw(_to_bytes(password)).decode('utf-8')
 
     @staticmethod
-    def check_password(password: str, hashed: str):
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    def check_password(password: str, hashed: str) -> bool:
+        with BCRYPT_CHECK.time():
+            return _checkpw(_to_bytes(password), _to_bytes(hashed))
+
+    @classmethod
+    def start_pool(cls, size: int = None, queue_depth: int = None):
+        """
+        Start the bcrypt process pool
+        Must be called from within the running event loop (e.g. the application lifespan)
+        :param size: the number of worker processes
+        :param queue_depth: the number of calls allowed to wait for a free worker,
+            calls beyond it are rejected with PasswordPoolBusy
+        """
+        if cls._POOL is not None:
+            raise ValueError("Password pool already started. Call 'start_pool()' only once.")
+
+        size = size or _PasswordConfig["POOL_SIZE"]
+        queue_depth = _PasswordConfig["QUEUE_DEPTH"] if queue_depth is None else queue_depth
+
+        cls._POOL = ProcessPoolExecutor(max_workers=size)
+        cls._SLOTS = asyncio.Semaphore(size + queue_depth)
+
+    @classmethod
+    def shutdown_pool(cls):
+        if cls._POOL is None:
+            return
+
+        cls._POOL.shutdown(wait=True, cancel_futures=True)
+        cls._POOL = None
+        cls._SLOTS = None
+
+    @classmethod
+    async def hash_password_async(cls, password) -> str:
+        with BCRYPT_HASH.time():
+            # The rounds are passed along, pool workers do not share this process's config
+            hashed = await cls._run(_hashpw, _to_bytes(password), _PasswordConfig["ROUNDS"])
+        return hashed.decode('utf-8')
+
+    @classmethod
+    async def check_password_async(cls, password: str, hashed: str) -> bool:
+        with BCRYPT_CHECK.time():
+            return await cls._run(_checkpw, _to_bytes(password), _to_bytes(hashed))
+
+    @classmethod
+    async def _run(cls, func, *args):
+        """
+        Run a bcrypt call off the event loop
+        Uses the process pool when started, otherwise the loop's default thread executor
+        (bcrypt releases the GIL, so threads still keep the loop responsive)
+        :raises PasswordPoolBusy: if the pool's workers and queue are all taken
+        """
+        loop = asyncio.get_running_loop()
+
+        if cls._POOL is None:
+            return await loop.run_in_executor(None, func, *args)
+
+        # Fail fast rather than wait for a slot, the wait would be unbounded
+        if cls._SLOTS.locked():
+            raise PasswordPoolBusy()
+
+        async with cls._SLOTS:
+            return await loop.run_in_executor(cls._POOL, func, *args)
@@ -0,0 +1,316 @@
+from collections import OrderedDict
+from fastapi import HTTPException
+from typing import Optional
+from .metrics import RATE_LIMITED
+import logging
+import math
+import threading
+import time
+import os
+
+"""
+This is the Rate Limiter module
+
+Throttles the credential endpoints before any database query or bcrypt hash,
+so a burst of attempts is turned away for the cost of a dictionary lookup.
+
+Attempts are counted per client IP, and per email, over a sliding window
+(RATE_LIMIT_WINDOW_SECONDS): the count of the current fixed window is added to
+the count of the previous one, weighted by how much of it still overlaps the
+sliding window. This takes two counters per key, whatever the limit. Rejected
+attempts are not counted, so a client is let through again as soon as its
+earlier attempts leave the window. A login attempt is counted against its
+email before the password is checked, so concurrent guesses cannot all slip
+under the limit, and a successful login clears the count, so only failed
+logins add up; an attacker can still hold an account's logins back for a
+window with wrong passwords, the price of throttling guesses spread over many
+IPs. Emails are normalized like the account lookup, so "User@x.com " and
+"user@x.com" share one count.
+
+The counters are kept in a bounded LRU (RATE_LIMIT_MAX_KEYS entries) in each
+worker, or in Redis when RATE_LIMIT_REDIS_URL is set, so the limits hold across
+workers and replicas (requires the `redis` package). Redis errors let the
+attempt through rather than locking every user out.
+
+The client IP is the peer address; behind a proxy, run uvicorn with
+--proxy-headers (and --forwarded-allow-ips) so it is the client's.
+
+methods:
+--------
+limit_login(ip: str, email: str) -> None
+    Count a login attempt against the IP and the email, raising
+    RateLimitExceeded if either is over its limit
+login_succeeded(email: str) -> None
+    Clear the attempts counted against the email
+login_aborted(email: str) -> None
+    Give back the attempt counted against the email
+limit_register(ip: str) -> None
+    Count a registration attempt, raising RateLimitExceeded if over the limit
+stats() -> dict
+    The state of each limiter
+"""
+
+# Rate limit configuration, limits are attempts per window
+_RateLimitConfig = {
+    "ENABLED": os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+    "WINDOW_SECONDS": float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60")),
+    "LOGIN_PER_IP": int(os.getenv("RATE_LIMIT_LOGIN_PER_IP", "20")),
+    # Failed logins, successful ones clear the count
+    "LOGIN_PER_EMAIL": int(os.getenv("RATE_LIMIT_LOGIN_PER_EMAIL", "5")),
+    "REGISTER_PER_IP": int(os.getenv("RATE_LIMIT_REGISTER_PER_IP", "5")),
+    "MAX_KEYS": int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")),
+    "REDIS_URL": os.getenv("RATE_LIMIT_REDIS_URL", ""),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(HTTPException):
+    """
+    Raised when a client is over a rate limit, answered with a 429 and a Retry-After header
+    """
+
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class SlidingWindowLimiter:
+    """
+    In-memory sliding window limiter, local to the process
+
+    Methods:
+    --------
+    hit(key: str) -> float
+        Count an attempt for the key if it is under the limit
+        Returns 0 if the attempt is allowed (and counted), else the seconds until it would be
+    release(key: str) -> None
+        Uncount an attempt counted earlier
+    reset(key: str) -> None
+        Forget the attempts of the key
+    stats() -> dict
+        The number of keys tracked, and the limit, window and max keys
+    """
+
+    def __init__(self, limit: int, window: float = 60.0, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [window number, count in that window, count in the window before]
+        self._entries: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _retry_after(self, previous: int, current: int, elapsed: float) -> float:
+        """
+        :return: 0 if one more attempt fits in the sliding window, else the seconds until it does
+        """
+        weight = (self.window - elapsed) / self.window
+        if previous * weight + current + 1 <= self.limit:
+            return 0.0
+        if current + 1 > self.limit:
+            # Once the window turns, its count becomes the previous window's and has to shrink in turn
+            return self.window - elapsed + self.window * (1 - (self.limit - 1) / max(current, 1))
+        # The previous window's share shrinks linearly, until enough of it has left
+        return self.window * (1 - (self.limit - current - 1) / previous) - elapsed
+
+    async def hit(self, key: str) -> float:
+        now = time.time()
+        number, elapsed = divmod(now, self.window)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [number, 0, 0]
+                if len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+                if entry[0] != number:
+                    entry[2] = entry[1] if entry[0] == number - 1 else 0
+                    entry[0], entry[1] = number, 0
+
+            retry_after = self._retry_after(entry[2], entry[1], elapsed)
+            if not retry_after:
+                entry[1] += 1
+            return retry_after
+
+    async def release(self, key: str) -> None:
+        number = time.time() // self.window
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            # The attempt was counted in this window, or in the previous one if it has turned since
+            if entry[0] == number and entry[1]:
+                entry[1] -= 1
+            elif entry[0] == number and entry[2]:
+                entry[2] -= 1
+            elif entry[0] == number - 1 and entry[1]:
+                entry[1] -= 1
+
+    async def reset(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._entries), "limit": self.limit, "window": self.window, "max_keys": self.max_keys}
+
+
+# Reads both windows and counts the attempt if allowed, in one round trip
+_REDIS_HIT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current + 1 <= tonumber(ARGV[2]) then
+    redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {previous, current}
+"""
+
+# Uncounts an attempt from the current window, or from the previous one if it has turned since
+_REDIS_RELEASE = """
+for _, key in ipairs(KEYS) do
+    if tonumber(redis.call('GET', key) or '0') > 0 then
+        return redis.call('DECR', key)
+    end
+end
+return 0
+"""
+
+
+class RedisSlidingWindowLimiter(SlidingWindowLimiter):
+    """
+    Sliding window limiter with the counters kept in Redis, shared by every worker
+    Counters expire on their own after two windows, so max_keys does not apply
+    """
+
+    def __init__(self, limit: int, window: float = 60.0, url: str = None, prefix: str = "rate"):
+        super().__init__(limit, window)
+        from redis.asyncio import Redis
+
+        self.prefix = prefix
+        self._redis = Redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_HIT)
+        self._release = self._redis.register_script(_REDIS_RELEASE)
+
+    def _keys(self, key: str, number: int) -> list[str]:
+        return [f"{self.prefix}:{key}:{number}", f"{self.prefix}:{key}:{number - 1}"]
+
+    async def hit(self, key: str) -> float:
+        now = time.time()
+        number, elapsed = divmod(now, self.window)
+        number = int(number)
+        weight = (self.window - elapsed) / self.window
+
+        try:
+            previous, current = await self._script(
+                keys=self._keys(key, number),
+                args=[weight, self.limit, math.ceil(self.window * 2)],
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, attempt allowed: {e}")
+            return 0.0
+        return self._retry_after(int(previous), int(current), elapsed)
+
+    async def release(self, key: str) -> None:
+        try:
+            await self._release(keys=self._keys(key, int(time.time() // self.window)))
+        except Exception as e:
+            logger.warning(f"Rate limit release failed: {e}")
+
+    async def reset(self, key: str) -> None:
+        try:
+            await self._redis.delete(*self._keys(key, int(time.time() // self.window)))
+        except Exception as e:
+            logger.warning(f"Rate limit reset failed: {e}")
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "limit": self.limit, "window": self.window}
+
+
+def _limiter(limit: int, prefix: str) -> SlidingWindowLimiter:
+    if _RateLimitConfig["REDIS_URL"]:
+        return RedisSlidingWindowLimiter(
+            limit, _RateLimitConfig["WINDOW_SECONDS"], _RateLimitConfig["REDIS_URL"], prefix=f"rate:{prefix}"
+        )
+    return SlidingWindowLimiter(limit, _RateLimitConfig["WINDOW_SECONDS"], _RateLimitConfig["MAX_KEYS"])
+
+
+_limiters: dict[str, SlidingWindowLimiter] = {
+    "login_ip": _limiter(_RateLimitConfig["LOGIN_PER_IP"], "login_ip"),
+    "login_email": _limiter(_RateLimitConfig["LOGIN_PER_EMAIL"], "login_email"),
+    "register_ip": _limiter(_RateLimitConfig["REGISTER_PER_IP"], "register_ip"),
+}
+
+
+async def _check(rule: str, key: Optional[str]) -> None:
+    if not key:
+        return
+    retry_after = await _limiters[rule].hit(key)
+    if retry_after:
+        RATE_LIMITED.labels(rule).inc()
+        raise RateLimitExceeded(retry_after)
+
+
+def _email_key(email: str) -> str:
+    # The same normalization as the account lookup, so every spelling of an email shares its count.
+    # Imported here, as app.models imports app.utils
+    from app.models import normalize_email
+    return normalize_email(email)
+
+
+async def limit_login(ip: Optional[str], email: str) -> None:
+    """
+    Count a login attempt against the client IP and the email
+    The attempt is counted against the email before the password is checked, so
+    concurrent attempts cannot all pass the limit; a successful login clears it
+    :param ip: the client IP, not limited if unknown
+    :param email: the email the attempt is made for
+    :raises RateLimitExceeded: if either is over its limit
+    """
+    if not _RateLimitConfig["ENABLED"]:
+        return
+    await _check("login_ip", ip)
+    await _check("login_email", _email_key(email))
+
+
+async def login_succeeded(email: str) -> None:
+    """
+    Clear the attempts counted against the email
+    :param email: the email the user logged in with
+    """
+    if not _RateLimitConfig["ENABLED"]:
+        return
+    await _limiters["login_email"].reset(_email_key(email))
+
+
+async def login_aborted(email: str) -> None:
+    """
+    Give back the attempt counted against the email, when the password could not be checked
+    :param email: the email the attempt was made for
+    """
+    if not _RateLimitConfig["ENABLED"]:
+        return
+    await _limiters["login_email"].release(_email_key(email))
+
+
+async def limit_register(ip: Optional[str]) -> None:
+    """
+    Count a registration attempt against the client IP
+    :param ip: the client IP, not limited if unknown
+    :raises RateLimitExceeded: if it is over its limit
+    """
+    if not _RateLimitConfig["ENABLED"]:
+        return
+    await _check("register_ip", ip)
+
+
+def stats() -> dict:
+    """
+    :return: the state of each limiter
+    """
+    return {rule: limiter.stats() for rule, limiter in _limiters.items()}
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, List
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import RefreshToken, Role, user_roles
+from .repository import AsyncRepository, logger
+import hashlib
+import secrets
+import uuid
+import os
+
+"""
+This is the Refresh Token Repository module
+
+Like the user repository, it is imported directly rather than through the
+app.utils package, as it needs the models.
+"""
+
+# Refresh token configuration
+_RefreshTokenConfig = {
+    "TTL_DAYS": float(os.getenv("REFRESH_TOKEN_DAYS", "14")),
+}
+
+
+def hash_token(token: str) -> str:
+    """
+    The digest a refresh token is stored and looked up by
+    Refresh tokens are random, so a fast unsalted hash is enough (unlike passwords)
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def utcnow() -> datetime:
+    # Naive UTC, as stored in the DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RefreshTokenGrant(NamedTuple):
+    """
+    A stored refresh token with what is needed to issue the next access token
+    """
+    id: str
+    user_id: str
+    family_id: str
+    expires_at: datetime
+    used: bool
+    revoked: bool
+    roles: List[str]
+
+
+class RefreshTokenRepository(AsyncRepository):
+    """
+    AsyncRepository for the RefreshToken model
+
+    Methods:
+    --------
+    issue(user_id: str, family_id: str) -> Optional[str]
+        Create a refresh token, returning the token itself (only its digest is stored)
+    get_grant(token: str) -> Optional[RefreshTokenGrant]
+        Fetch a stored token and its user's role names as one row
+    consume(token_id: str) -> bool
+        Mark a token as used, unless it already was
+    revoke_family(family_id: str) -> int
+        Revoke every token of a family
+    """
+
+    def __init__(self):
+        super().__init__(base_model=RefreshToken)
+
+    async def issue(self, user_id: str, family_id: str = None, session: AsyncSession = None) -> Optional[str]:
+        """
+        :param user_id: the id of the user the token is issued to
+        :param family_id: the family of the token being rotated, None to start a new family (at login)
+        :return: the refresh token, or None if it could not be stored
+        """
+        token = secrets.token_urlsafe(32)
+        created = await self.create_many([{
+            "id": str(uuid.uuid4()),
+            "token_hash": hash_token(token),
+            "user_id": user_id,
+            "family_id": family_id or str(uuid.uuid4()),
+            "expires_at": utcnow() + timedelta(days=_RefreshTokenConfig["TTL_DAYS"]),
+            "used": False,
+            "revoked": False,
+        }], session=session)
+        return token if created else None
+
+    async def get_grant(self, token: str, session: AsyncSession = None) -> Optional[RefreshTokenGrant]:
+        """
+        One lookup on the unique token_hash index, with the role names aggregated
+        so the next access token can be signed without loading the user
+        :param token: the refresh token presented by the client
+        :return: the grant, or None if the token is unknown
+        """
+        statement = (
+            select(
+                RefreshToken.id, RefreshToken.user_id, RefreshToken.family_id, RefreshToken.expires_at,
+                RefreshToken.used, RefreshToken.revoked, func.group_concat(Role.name)
+            )
+            .select_from(RefreshToken)
+            .outerjoin(user_roles, user_roles.c.user_id == RefreshToken.user_id)
+            .outerjoin(Role, Role.id == user_roles.c.role_id)
+            .where(RefreshToken.token_hash == hash_token(token))
+            .group_by(
+                RefreshToken.id, RefreshToken.user_id, RefreshToken.family_id, RefreshToken.expires_at,
+                RefreshToken.used, RefreshToken.revoked
+            )
+        )
+        async with self._session(session) as session:
+            try:
+                row = (await session.execute(statement)).first()
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching a refresh token: {str(e)}")
+                await session.rollback()
+                return None
+
+        if row is None:
+            return None
+        token_id, user_id, family_id, expires_at, used, revoked, roles = row
+        return RefreshTokenGrant(
+            token_id, user_id, family_id, expires_at, bool(used), bool(revoked), roles.split(",") if roles else []
+        )
+
+    async def consume(self, token_id: str, session: AsyncSession = None) -> bool:
+        """
+        Mark a token as used with a conditional UPDATE, so of two concurrent
+        refreshes with the same token only one succeeds
+        :return: True if the token was unused and is now used
+        """
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(
+                    update(RefreshToken)
+                    .where(RefreshToken.id == token_id, RefreshToken.used.is_(False), RefreshToken.revoked.is_(False))
+                    .values(used=True),
+                    execution_options={"synchronize_session": False}
+                )
+                await self._save(session, owned)
+                return result.rowcount == 1
+            except SQLAlchemyError as e:
+                logger.error(f"Error consuming refresh token {token_id}: {str(e)}")
+                await session.rollback()
+                return False
+
+    async def revoke_family(self, family_id: str, session: AsyncSession = None) -> int:
+        return await self.update_where({"revoked": True}, session=session, family_id=family_id)
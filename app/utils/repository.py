@@ -1,6 +1,12 @@
 import logging
-from typing import Optional, Type, List, TypeVar
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Type, List, TypeVar, Iterable, Iterator, AsyncIterator, Tuple, Any
+from sqlalchemy import select, delete, insert, update, inspect, tuple_
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 from app.config import database
 from app.models import Base
 
@@ -9,99 +15,550 @@ logger = logging.getLogger(__name__)
 
 T = TypeVar('T', bound=Base)
 
+"""
+This is the Repository module
+
+Every method takes an optional `session`. When given, the method works inside
+that session (unit of work): changes are flushed, and committing, rolling back
+and closing are left to the owner of the session. Without one, the method opens
+its own session and commits before returning.
+
+The bulk methods (create_many, get_many_by_ids, update_where, upsert_many) run
+a single statement for the whole batch instead of one round trip per row.
+delete_where, meant for background jobs, deletes in chunks of one transaction each.
+
+Large reads go through iter_all / stream_all, which fetch rows in batches from a
+server-side cursor, or through get_page, which pages on an indexed column
+(keyset pagination) instead of loading the whole table. Joined eager loads of
+collections cannot be streamed, so those methods use `stream_options`
+(e.g. selectinload) in place of `options`.
+"""
+
+
+def _primary_key(base_model):
+    return inspect(base_model).primary_key[0]
+
+
+def _name(base_model) -> str:
+    # Models and plain tables (e.g. association tables) alike
+    return getattr(base_model, "__name__", None) or base_model.name
+
+
+def _in_id_order(models: Iterable, ids: list, key: str) -> list:
+    by_id = {getattr(model, key): model for model in models}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _upsert_statement(base_model, dialect: str, rows: List[dict]):
+    """
+    Build an INSERT that updates the existing row on a conflict
+    MySQL resolves a conflict on the primary key or any unique key (ON DUPLICATE KEY UPDATE);
+    sqlite only on the primary key, a conflict on another unique key still raises
+    :param base_model: the model (or table) to insert into
+    :param dialect: the name of the database dialect
+    :param rows: the rows, used to pick the columns to update
+    :return: the statement, to execute with the rows as parameters
+    """
+    primary_key = [column.key for column in inspect(base_model).primary_key]
+    columns = [column for column in rows[0] if column not in primary_key]
+
+    if dialect == 'mysql':
+        statement = mysql.insert(base_model)
+        # Rows made of their primary key alone (e.g. association tables) have nothing to update
+        updates = columns or primary_key[:1]
+        return statement.on_duplicate_key_update({column: statement.inserted[column] for column in updates})
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(base_model)
+        if not columns:
+            return statement.on_conflict_do_nothing(index_elements=primary_key)
+        return statement.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={column: statement.excluded[column] for column in columns}
+        )
+    else:
+        raise Exception(f'Upsert not supported for {dialect}')
+
+def _page_statement(statement, base_model, order_by: str, after: Any, limit: int):
+    column = getattr(base_model, order_by) if order_by else _primary_key(base_model)
+    if after is not None:
+        statement = statement.where(column > after)
+    # One extra row tells whether there is a next page
+    return statement.order_by(column).limit(limit + 1), column.key
+
+
+def _page(models: List, key: str, limit: int) -> Tuple[List, Any]:
+    if len(models) <= limit:
+        return models, None
+    models = models[:limit]
+    return models, getattr(models[-1], key)
+
+
 class Repository:
-    def __init__(self, base_model: Type[T], options = None):
+    def __init__(self, base_model: Type[T], options = None, stream_options = None):
         self.base_model = base_model
         self.options = options
+        self.stream_options = stream_options
 
     def _query(self, session):
         return session.query(self.base_model).options(self.options) if self.options else session.query(self.base_model)
 
+    def _stream_select(self):
+        return select(self.base_model).options(self.stream_options) if self.stream_options else select(self.base_model)
 
-    def get_by(self, **kwargs) -> Optional[T]:
-        session = database.get_session()
-        try:
-            model = self._query(session).filter_by(**kwargs).first()
-            return model
-        except SQLAlchemyError as e:
-            logger.error(f"Error fetching {self.base_model.__name__} by {kwargs}: {str(e)}")
-            session.rollback()
-            return None
-        finally:
-            session.close()
+    @contextmanager
+    def _session(self, session: Optional[Session]):
+        if session is not None:
+            yield session
+            return
 
-    def create(self, model: Base) -> Optional[T]:
         session = database.get_session()
         try:
-            session.add(model)
-            session.commit()
-            return model
-        except SQLAlchemyError as e:
-            logger.error(f"Error creating {self.base_model.__name__}: {str(e)}")
-            session.rollback()
-            return None
+            yield session
         finally:
             session.close()
 
-    def update(self, model: Base) -> Optional[T]:
-        session = database.get_session()
-        try:
-            session.merge(model)
+    @staticmethod
+    def _save(session: Session, owned: bool):
+        if owned:
             session.commit()
-            return model
-        except SQLAlchemyError as e:
-            logger.error(f"Error updating {self.base_model.__name__}: {str(e)}")
-            session.rollback()
-            return None
-        finally:
-            session.close()
+        else:
+            session.flush()
 
-    def delete(self, model: Base) -> bool:
-        session = database.get_session()
-        try:
-            session.delete(model)
-            session.commit()
-            return True
-        except SQLAlchemyError as e:
-            logger.error(f"Error deleting {self.base_model.__name__}: {str(e)}")
-            session.rollback()
-            return False
-        finally:
-            session.close()
+    def get_by(self, session: Session = None, **kwargs) -> Optional[T]:
+        with self._session(session) as session:
+            try:
+                model = self._query(session).filter_by(**kwargs).first()
+                return model
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+                return None
 
-    def get_all(self) -> List[T]:
-        session = database.get_session()
-        try:
-            models = self._query(session).all()
-            return models
-        except SQLAlchemyError as e:
-            logger.error(f"Error fetching all {self.base_model.__name__}: {str(e)}")
-            session.rollback()
-            return []
-        finally:
-            session.close()
+    def create(self, model: Base, session: Session = None) -> Optional[T]:
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                session.add(model)
+                self._save(session, owned)
+                return model
+            except SQLAlchemyError as e:
+                logger.error(f"Error creating {self.base_model.__name__}: {str(e)}")
+                session.rollback()
+                return None
 
-    def get_all_by(self, **kwargs) -> List[T]:
-        session = database.get_session()
-        try:
-            models = self._query(session).filter_by(**kwargs).all()
-            return models
-        except SQLAlchemyError as e:
-            logger.error(f"Error fetching all {self.base_model.__name__} by {kwargs}: {str(e)}")
-            session.rollback()
+    def update(self, model: Base, session: Session = None) -> Optional[T]:
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                # Objects loaded by this session are already tracked, only detached ones need a merge
+                if model not in session:
+                    model = session.merge(model)
+                self._save(session, owned)
+                return model
+            except SQLAlchemyError as e:
+                logger.error(f"Error updating {self.base_model.__name__}: {str(e)}")
+                session.rollback()
+                return None
+
+    def delete(self, model: Base, session: Session = None) -> bool:
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                session.delete(model if model in session else session.merge(model))
+                self._save(session, owned)
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Error deleting {self.base_model.__name__}: {str(e)}")
+                session.rollback()
+                return False
+
+    def get_all(self, session: Session = None) -> List[T]:
+        with self._session(session) as session:
+            try:
+                models = self._query(session).all()
+                return models
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching all {self.base_model.__name__}: {str(e)}")
+                session.rollback()
+                return []
+
+    def get_all_by(self, session: Session = None, **kwargs) -> List[T]:
+        with self._session(session) as session:
+            try:
+                models = self._query(session).filter_by(**kwargs).all()
+                return models
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching all {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+                return []
+
+    def delete_by(self, session: Session = None, **kwargs) -> bool:
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                self._query(session).filter_by(**kwargs).delete()
+                self._save(session, owned)
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Error deleting {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+                return False
+
+    def create_many(self, rows: List[dict], session: Session = None) -> int:
+        """
+        Insert many rows with one bulk INSERT
+        :param rows: the rows, as dictionaries of attribute values
+        :return: the number of rows inserted
+        """
+        if not rows:
+            return 0
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                session.execute(insert(self.base_model), rows)
+                self._save(session, owned)
+                return len(rows)
+            except SQLAlchemyError as e:
+                logger.error(f"Error creating {len(rows)} {self.base_model.__name__}: {str(e)}")
+                session.rollback()
+                return 0
+
+    def get_many_by_ids(self, ids: List, session: Session = None) -> List[T]:
+        """
+        Fetch many rows by primary key with a single IN query
+        :param ids: the primary keys
+        :return: the models found, in the order of the ids
+        """
+        if not ids:
             return []
-        finally:
-            session.close()
+        primary_key = _primary_key(self.base_model)
+        with self._session(session) as session:
+            try:
+                models = self._query(session).filter(primary_key.in_(ids)).all()
+                return _in_id_order(models, ids, primary_key.key)
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching {self.base_model.__name__} by ids: {str(e)}")
+                session.rollback()
+                return []
 
-    def delete_by(self, **kwargs) -> bool:
-        session = database.get_session()
+    def update_where(self, values: dict, session: Session = None, **kwargs) -> int:
+        """
+        Update every row matching the filters with one UPDATE, without loading them
+        :param values: the attribute values to set
+        :return: the number of rows updated
+        """
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                result = session.execute(
+                    update(self.base_model).filter_by(**kwargs).values(**values),
+                    execution_options={"synchronize_session": False}
+                )
+                self._save(session, owned)
+                return result.rowcount
+            except SQLAlchemyError as e:
+                logger.error(f"Error updating {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+                return 0
+
+    def upsert_many(self, rows: List[dict], session: Session = None) -> int:
+        """
+        Insert many rows, updating the ones that already exist, with one statement
+        A row exists if its primary key does (on MySQL, also if any unique key does)
+        :param rows: the rows, as dictionaries of attribute values with the same keys
+        :return: the number of rows given
+        """
+        if not rows:
+            return 0
+        owned = session is None
+        with self._session(session) as session:
+            try:
+                statement = _upsert_statement(self.base_model, session.get_bind().dialect.name, rows)
+                session.execute(statement, rows)
+                self._save(session, owned)
+                return len(rows)
+            except SQLAlchemyError as e:
+                logger.error(f"Error upserting {len(rows)} {_name(self.base_model)}: {str(e)}")
+                session.rollback()
+                return 0
+
+    def iter_all(self, batch_size: int = 1000, session: Session = None, **kwargs) -> Iterator[T]:
+        """
+        Iterate over every row matching the filters, fetching them in batches
+        Only one batch is held in memory at a time
+        :param batch_size: the number of rows fetched per round trip
+        :return: an iterator of models
+        """
+        with self._session(session) as session:
+            try:
+                result = session.execute(
+                    self._stream_select().filter_by(**kwargs),
+                    execution_options={"yield_per": batch_size}
+                )
+                yield from result.scalars()
+            except SQLAlchemyError as e:
+                logger.error(f"Error streaming {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+
+    def get_page(self, limit: int = 50, after: Any = None, order_by: str = None,
+                 session: Session = None, **kwargs) -> Tuple[List[T], Any]:
+        """
+        Fetch one page of rows ordered by an indexed column (keyset pagination)
+        :param limit: the page size
+        :param after: the key of the last row of the previous page, None for the first page
+        :param order_by: the attribute to order by, the primary key by default
+        :return: the models, and the key to pass as `after` for the next page (None on the last page)
+        """
+        statement, key = _page_statement(self._stream_select().filter_by(**kwargs), self.base_model, order_by, after, limit)
+        with self._session(session) as session:
+            try:
+                return _page(list(session.execute(statement).scalars().all()), key, limit)
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching a page of {self.base_model.__name__} by {kwargs}: {str(e)}")
+                session.rollback()
+                return [], None
+
+    def delete_where(self, *criteria, chunk_size: int = 1000, pause: float = 0.0, cascade: Iterable = ()) -> int:
+        """
+        Delete every row matching the criteria, one chunk per transaction
+        Meant for background jobs: each chunk is committed on its own, so locks are
+        held briefly and the work already done survives an error in a later chunk
+        :param criteria: the SQL expressions rows must match, e.g. Model.expires_at < now
+        :param chunk_size: the number of rows deleted per transaction
+        :param pause: the seconds to sleep between chunks, leaving room for other writers
+        :param cascade: the foreign key columns of other tables referencing the primary key,
+            whose rows are deleted first in the same transaction
+        :return: the number of rows deleted
+        """
+        primary_keys = list(inspect(self.base_model).primary_key)
+        deleted = 0
+        while True:
+            with self._session(None) as session:
+                try:
+                    keys = session.execute(select(*primary_keys).where(*criteria).limit(chunk_size)).all()
+                    if keys:
+                        if len(primary_keys) == 1:
+                            keys = [key for key, in keys]
+                            chunk = primary_keys[0].in_(keys)
+                        else:
+                            chunk = tuple_(*primary_keys).in_([tuple(key) for key in keys])
+                        for column in cascade:
+                            session.execute(delete(column.table).where(column.in_(keys)))
+                        session.execute(delete(self.base_model).where(chunk))
+                        session.commit()
+                except SQLAlchemyError as e:
+                    logger.error(f"Error deleting {_name(self.base_model)} in chunks: {str(e)}")
+                    session.rollback()
+                    return deleted
+
+            deleted += len(keys)
+            if len(keys) < chunk_size:
+                return deleted
+            if pause:
+                time.sleep(pause)
+
+
+class AsyncRepository:
+    """
+    Async counterpart of Repository
+
+    Exposes the same methods as coroutines, backed by the async engine, so
+    database round trips do not block the event loop.
+    """
+    def __init__(self, base_model: Type[T], options = None, stream_options = None):
+        self.base_model = base_model
+        self.options = options
+        self.stream_options = stream_options
+
+    def _select(self):
+        return select(self.base_model).options(self.options) if self.options else select(self.base_model)
+
+    def _stream_select(self):
+        return select(self.base_model).options(self.stream_options) if self.stream_options else select(self.base_model)
+
+    @asynccontextmanager
+    async def _session(self, session: Optional[AsyncSession]):
+        if session is not None:
+            yield session
+            return
+
+        session = database.get_async_session()
         try:
-            self._query(session).filter_by(**kwargs).delete()
-            session.commit()
-            return True
-        except SQLAlchemyError as e:
-            logger.error(f"Error deleting {self.base_model.__name__} by {kwargs}: {str(e)}")
-            session.rollback()
-            return False
+            yield session
         finally:
-            session.close()
\ No newline at end of file
+            await session.close()
+
+    @staticmethod
+    async def _save(session: AsyncSession, owned: bool):
+        if owned:
+            await session.commit()
+        else:
+            await session.flush()
+
+    async def get_by(self, session: AsyncSession = None, **kwargs) -> Optional[T]:
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(self._select().filter_by(**kwargs))
+                return result.unique().scalars().first()
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+                return None
+
+    async def create(self, model: Base, session: AsyncSession = None) -> Optional[T]:
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                session.add(model)
+                await self._save(session, owned)
+                return model
+            except SQLAlchemyError as e:
+                logger.error(f"Error creating {self.base_model.__name__}: {str(e)}")
+                await session.rollback()
+                return None
+
+    async def update(self, model: Base, session: AsyncSession = None) -> Optional[T]:
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                # Objects loaded by this session are already tracked, only detached ones need a merge
+                if model not in session:
+                    model = await session.merge(model)
+                await self._save(session, owned)
+                return model
+            except SQLAlchemyError as e:
+                logger.error(f"Error updating {self.base_model.__name__}: {str(e)}")
+                await session.rollback()
+                return None
+
+    async def delete(self, model: Base, session: AsyncSession = None) -> bool:
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                await session.delete(model if model in session else await session.merge(model))
+                await self._save(session, owned)
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Error deleting {self.base_model.__name__}: {str(e)}")
+                await session.rollback()
+                return False
+
+    async def get_all(self, session: AsyncSession = None) -> List[T]:
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(self._select())
+                return list(result.unique().scalars().all())
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching all {self.base_model.__name__}: {str(e)}")
+                await session.rollback()
+                return []
+
+    async def get_all_by(self, session: AsyncSession = None, **kwargs) -> List[T]:
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(self._select().filter_by(**kwargs))
+                return list(result.unique().scalars().all())
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching all {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+                return []
+
+    async def delete_by(self, session: AsyncSession = None, **kwargs) -> bool:
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                await session.execute(delete(self.base_model).filter_by(**kwargs))
+                await self._save(session, owned)
+                return True
+            except SQLAlchemyError as e:
+                logger.error(f"Error deleting {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+                return False
+
+    async def create_many(self, rows: List[dict], session: AsyncSession = None) -> int:
+        if not rows:
+            return 0
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                await session.execute(insert(self.base_model), rows)
+                await self._save(session, owned)
+                return len(rows)
+            except SQLAlchemyError as e:
+                logger.error(f"Error creating {len(rows)} {self.base_model.__name__}: {str(e)}")
+                await session.rollback()
+                return 0
+
+    async def get_many_by_ids(self, ids: List, session: AsyncSession = None) -> List[T]:
+        if not ids:
+            return []
+        primary_key = _primary_key(self.base_model)
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(self._select().where(primary_key.in_(ids)))
+                return _in_id_order(result.unique().scalars().all(), ids, primary_key.key)
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching {self.base_model.__name__} by ids: {str(e)}")
+                await session.rollback()
+                return []
+
+    async def update_where(self, values: dict, session: AsyncSession = None, **kwargs) -> int:
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(
+                    update(self.base_model).filter_by(**kwargs).values(**values),
+                    execution_options={"synchronize_session": False}
+                )
+                await self._save(session, owned)
+                return result.rowcount
+            except SQLAlchemyError as e:
+                logger.error(f"Error updating {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+                return 0
+
+    async def upsert_many(self, rows: List[dict], session: AsyncSession = None) -> int:
+        if not rows:
+            return 0
+        owned = session is None
+        async with self._session(session) as session:
+            try:
+                statement = _upsert_statement(self.base_model, session.get_bind().dialect.name, rows)
+                await session.execute(statement, rows)
+                await self._save(session, owned)
+                return len(rows)
+            except SQLAlchemyError as e:
+                logger.error(f"Error upserting {len(rows)} {_name(self.base_model)}: {str(e)}")
+                await session.rollback()
+                return 0
+
+    async def stream_all(self, batch_size: int = 1000, session: AsyncSession = None, **kwargs) -> AsyncIterator[T]:
+        """
+        Iterate over every row matching the filters through a server-side cursor
+        Only one batch is held in memory at a time
+        :param batch_size: the number of rows fetched per round trip
+        :return: an async iterator of models
+        """
+        async with self._session(session) as session:
+            try:
+                result = await session.stream_scalars(
+                    self._stream_select().filter_by(**kwargs),
+                    execution_options={"yield_per": batch_size}
+                )
+                async for model in result:
+                    yield model
+            except SQLAlchemyError as e:
+                logger.error(f"Error streaming {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+
+    async def get_page(self, limit: int = 50, after: Any = None, order_by: str = None,
+                       session: AsyncSession = None, **kwargs) -> Tuple[List[T], Any]:
+        statement, key = _page_statement(self._stream_select().filter_by(**kwargs), self.base_model, order_by, after, limit)
+        async with self._session(session) as session:
+            try:
+                result = await session.execute(statement)
+                return _page(list(result.scalars().all()), key, limit)
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching a page of {self.base_model.__name__} by {kwargs}: {str(e)}")
+                await session.rollback()
+                return [], None
@@ -1,29 +1,45 @@
+from functools import lru_cache
 from fastapi.exceptions import RequestValidationError
 from starlette.responses import JSONResponse
 from app.schemas.response import Response
 from fastapi import HTTPException
+import orjson
 # Assuming logger is defined in your .config module
 
+_response_keys = frozenset(Response.model_fields)
+
 
 class JsonResponse(JSONResponse):
     """
     Custom JSONResponse class that accepts a Response object.
 
     It ensures that the response Json will always be a Response object.
+
+    Content is serialized straight to bytes, without being validated again:
+    Response objects through pydantic-core, and dicts already in the Response
+    shape (as FastAPI passes the Response returned by a route) through orjson.
+    Bytes are taken as an already serialized body.
     """
 
-    def __init__(self, response, status_code=200, **kwargs):
-        if isinstance(response, Response):
-            response = response.model_dump()
-        elif isinstance(response, dict):
-            if 'node' not in response and 'errors' not in response:
-                response = Response(node=response, status=status_code).model_dump()
-            else :
-                response = Response(**response).model_dump()
-        else:
-            response = Response(node=response, status=status_code).model_dump()
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, Response):
+            return Response.__pydantic_serializer__.to_json(content)
+        if isinstance(content, dict):
+            if content.keys() == _response_keys:
+                return orjson.dumps(content)
+            if 'node' in content or 'errors' in content:
+                return Response.__pydantic_serializer__.to_json(Response(**content))
+        return orjson.dumps({"node": content, "errors": [], "status": self.status_code})
+
 
-        super().__init__(response, status_code, **kwargs)
+@lru_cache(maxsize=256)
+def _error_body(detail: str, status: int) -> bytes:
+    """
+    The serialized Response of an error, built once per message and status
+    """
+    return Response.__pydantic_serializer__.to_json(Response(node=None, errors=[detail], status=status))
 
 
 def validation_error_handler(request, exc: RequestValidationError):
@@ -47,4 +63,18 @@ def HTTPException_handler(request, exc: HTTPException):
     :param exc: The exception object.
     :return: JsonResponse
     """
+    if isinstance(exc.detail, str):
+        return JsonResponse(_error_body(exc.detail, exc.status_code))
     return JsonResponse(Response(node=None, errors=[exc.detail], status=exc.status_code))
+
+def retry_after_handler(request, exc: HTTPException):
+    """
+    Custom exception handler for the errors asking the client to come back later
+    (RateLimitExceeded, PasswordPoolBusy).
+    Unlike other errors they are answered with their status (429, 503) and Retry-After
+    header themselves, so clients and proxies back off without reading the body.
+    :param request: The request object.
+    :param exc: The exception object.
+    :return: JsonResponse
+    """
+    return JsonResponse(_error_body(exc.detail, exc.status_code), status_code=exc.status_code, headers=exc.headers)
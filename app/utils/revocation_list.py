@@ -0,0 +1,124 @@
+from typing import Iterable, Optional, Tuple
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over strings
+
+    Answers "definitely absent" or "possibly present". Sized for `capacity`
+    items at the given false positive rate; past that the rate degrades, so the
+    owner rebuilds it (see RevocationList.replace).
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: the k positions are derived from two 64 bit halves of one digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        # Stops at the first unset bit, usually the first one or two for absent items
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    In-memory set of revoked token ids (`jti`), each kept until the token's `exp`
+
+    A Bloom filter sits in front of the set, so checking a token that was never
+    revoked (nearly all of them) costs one hash and a few bit probes. Bloom
+    filters cannot forget, so expired entries leave the filter when it is
+    rebuilt by `replace` or `purge`.
+
+    Methods:
+    --------
+    add(jti: str, exp: int) -> None
+        Revoke a token id until its expiry (epoch seconds)
+    is_revoked(jti: str) -> bool
+        Whether a token id is revoked
+    replace(entries: Iterable[tuple]) -> None
+        Swap in a new set of (jti, exp) entries, e.g. reloaded from the database
+    purge() -> None
+        Drop the expired entries
+    stats() -> dict
+        The size and filter parameters
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._entries: dict[str, int] = {}
+        self._filter = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, exp: Optional[int]):
+        if not jti:
+            return
+
+        with self._lock:
+            self._entries[jti] = exp
+            self._filter.add(jti)
+            if len(self._entries) > self._filter.capacity:
+                self._rebuild(self._entries)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or not self._entries or jti not in self._filter:
+            return False
+
+        exp = self._entries.get(jti, 0)
+        return exp is None or exp > time.time()
+
+    def replace(self, entries: Iterable[Tuple[str, Optional[int]]]):
+        now = time.time()
+        with self._lock:
+            # Entries added since the reload started are kept
+            merged = {jti: exp for jti, exp in entries if exp is None or exp > now}
+            merged.update(self._entries)
+            self._rebuild(merged)
+
+    def purge(self):
+        with self._lock:
+            self._rebuild(self._entries)
+
+    def _rebuild(self, entries: dict):
+        now = time.time()
+        live = {jti: exp for jti, exp in entries.items() if exp is None or exp > now}
+
+        bloom = BloomFilter(max(self.capacity, 2 * len(live)), self.error_rate)
+        for jti in live:
+            bloom.add(jti)
+
+        # The entries go first: a reader between the two assignments probes the old
+        # filter, which only misses entries that were not revoked before this rebuild
+        self._entries = live
+        self._filter = bloom
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "filter_bits": self._filter.size,
+            "filter_hashes": self._filter.hash_count,
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import threading
+import time
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified tokens
+
+    Entries are keyed by the SHA-256 digest of the token, so the cache never holds
+    the bearer tokens themselves, and store the decoded claims with the token's
+    expiry and signing key. An entry is never returned past its `exp`.
+
+    Methods:
+    --------
+    get(token: str) -> Optional[dict]
+        The cached claims of a token, or None
+    put(token: str, claims: dict, kid: str) -> None
+        Cache the claims of a verified token
+    purge(kids: Optional[set]) -> None
+        Drop every entry, or the entries signed by the given keys
+    stats() -> dict
+        The hit and miss counters, size and max size
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        if self.max_size <= 0:
+            return None
+
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            claims, exp, _ = entry
+            if exp is not None and exp <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        # Callers get their own copy, so the cached claims cannot be altered
+        return dict(claims)
+
+    def put(self, token: str, claims: dict, kid: Optional[str] = None):
+        if self.max_size <= 0:
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(claims), claims.get("exp"), kid)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def purge(self, kids: Optional[set] = None):
+        with self._lock:
+            if kids is None:
+                self._entries.clear()
+                return
+
+            for key in [key for key, (_, _, kid) in self._entries.items() if kid in kids]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,76 @@
+from typing import NamedTuple, Optional, List
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User, Role, user_roles, normalize_email
+from .repository import AsyncRepository, logger
+
+"""
+This is the User Repository module
+
+It is imported directly rather than through the app.utils package, as app.models
+itself imports app.utils and the models are not defined yet at that point.
+"""
+
+
+class UserCredentials(NamedTuple):
+    """
+    The columns needed to authenticate a user and issue their tokens
+    """
+    id: str
+    password: str
+    verified: bool
+    roles: List[str]
+
+
+class UserRepository(AsyncRepository):
+    """
+    AsyncRepository for the User model, with the queries specific to users
+
+    Emails are stored lowercased, so lookups by email are normalized the same way
+    and served by the unique index on users.email.
+
+    Methods:
+    --------
+    get_by(**kwargs) -> Optional[User]
+        AsyncRepository.get_by, with the email normalized
+    get_credentials(email: str) -> Optional[UserCredentials]
+        Fetch the id, password hash, verified flag and role names of a user as one row
+    """
+
+    def __init__(self, options = None, stream_options = None):
+        super().__init__(base_model=User, options=options, stream_options=stream_options)
+
+    async def get_by(self, session: AsyncSession = None, **kwargs) -> Optional[User]:
+        if "email" in kwargs:
+            kwargs["email"] = normalize_email(kwargs["email"])
+        return await super().get_by(session=session, **kwargs)
+
+    async def get_credentials(self, email: str, session: AsyncSession = None) -> Optional[UserCredentials]:
+        """
+        Fetch what login needs, and nothing else
+        Selects plain columns with the role names aggregated, so no ORM objects are
+        built and the roles come back in the same row
+        :param email: the user's email
+        :return: the user's credentials, or None if there is no such user
+        """
+        statement = (
+            select(User.id, User._password, User.verified, func.group_concat(Role.name))
+            .select_from(User)
+            .outerjoin(user_roles, user_roles.c.user_id == User.id)
+            .outerjoin(Role, Role.id == user_roles.c.role_id)
+            .where(User.email == normalize_email(email))
+            .group_by(User.id, User._password, User.verified)
+        )
+        async with self._session(session) as session:
+            try:
+                row = (await session.execute(statement)).first()
+            except SQLAlchemyError as e:
+                logger.error(f"Error fetching credentials for {email}: {str(e)}")
+                await session.rollback()
+                return None
+
+        if row is None:
+            return None
+        user_id, password, verified, roles = row
+        return UserCredentials(user_id, password, bool(verified), roles.split(",") if roles else [])
@@ -0,0 +1,3 @@
+# app.utils and app.models import each other; loading the config package first
+# resolves them in the same order as main.py
+import app.config  # noqa: F401
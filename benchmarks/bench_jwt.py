@@ -0,0 +1,40 @@
+"""
+JwtUtil.encode_jwt / decode_jwt, for each supported signing algorithm
+"""
+import pytest
+
+from app.utils.key_store import generate_private_key, ACTIVE
+
+ALGORITHMS = ["RS256", "PS256", "ES256", "EdDSA"]
+
+
+@pytest.fixture(params=ALGORITHMS)
+def signing_keys(request, jwt_keys):
+    # Swap in a key of the algorithm under test, restoring the session's key set afterwards
+    previous = jwt_keys._KEYS
+    jwt_keys._set_keys([{
+        "kid": request.param.lower(),
+        "alg": request.param,
+        "status": ACTIVE,
+        "key": generate_private_key(request.param),
+    }])
+    yield jwt_keys
+    jwt_keys._KEYS = previous
+    jwt_keys._HEADERS = {}
+
+
+def bench_encode(benchmark, signing_keys, jwt_payload):
+    benchmark(lambda: signing_keys.encode_jwt(jwt_payload()))
+
+
+def bench_decode(benchmark, signing_keys, jwt_payload):
+    token = signing_keys.encode_jwt(jwt_payload())
+    algorithms = [signing_keys._KEYS["alg"]]
+    # Passing the algorithms bypasses the verified token cache: a full signature check
+    benchmark(signing_keys.decode_jwt, token, algorithms)
+
+
+def bench_decode_cached(benchmark, jwt_keys, jwt_payload):
+    token = jwt_keys.encode_jwt(jwt_payload())
+    jwt_keys.decode_jwt(token)
+    benchmark(jwt_keys.decode_jwt, token)
@@ -0,0 +1,33 @@
+"""
+PasswordUtil.hash_password / check_password at several bcrypt costs
+"""
+import pytest
+
+from app.utils import PasswordUtil
+from app.utils import password_util
+
+# Each round doubles the cost, 12 (the default) takes a few hundred milliseconds
+ROUNDS = [4, 8, 10, 12]
+
+
+@pytest.fixture(params=ROUNDS, ids=lambda rounds: f"rounds={rounds}")
+def rounds(request, monkeypatch):
+    monkeypatch.setitem(password_util._PasswordConfig, "ROUNDS", request.param)
+    return request.param
+
+
+def _run(benchmark, rounds, func, *args):
+    if rounds >= 10:
+        # Slow enough that a few rounds already give a stable figure
+        benchmark.pedantic(func, args=args, rounds=5, iterations=1, warmup_rounds=1)
+    else:
+        benchmark(func, *args)
+
+
+def bench_hash_password(benchmark, rounds):
+    _run(benchmark, rounds, PasswordUtil.hash_password, "correct horse battery staple")
+
+
+def bench_check_password(benchmark, rounds):
+    hashed = PasswordUtil.hash_password("correct horse battery staple")
+    _run(benchmark, rounds, PasswordUtil.check_password, "correct horse battery staple", hashed)
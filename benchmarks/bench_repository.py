@@ -0,0 +1,54 @@
+"""
+Repository reads against a seeded sqlite database
+"""
+from sqlalchemy.orm import joinedload
+import pytest
+
+from app.config import database
+from app.models import User
+from app.utils import Repository
+from app.utils.user_repository import UserRepository
+
+EMAIL = "user1000@mail.com"
+
+
+@pytest.fixture(scope="module")
+def session(sqlite_db):
+    session = database.get_session()
+    yield session
+    session.close()
+
+
+def bench_get_by_email(benchmark, sqlite_db, session):
+    repository = Repository(base_model=User, options=joinedload(User.roles))
+
+    def lookup():
+        user = repository.get_by(session=session, email=EMAIL)
+        # Start from an empty identity map, as a new request would
+        session.expunge_all()
+        return user
+
+    assert benchmark(lookup) is not None
+
+
+def bench_get_by_id(benchmark, sqlite_db, session):
+    repository = Repository(base_model=User)
+    user_id = repository.get_by(session=session, email=EMAIL).id
+
+    def lookup():
+        user = repository.get_by(session=session, id=user_id)
+        session.expunge_all()
+        return user
+
+    assert benchmark(lookup) is not None
+
+
+def bench_get_credentials(benchmark, sqlite_db, event_loop):
+    repository = UserRepository()
+    session = database.get_async_session()
+
+    def lookup():
+        return event_loop.run_until_complete(repository.get_credentials(EMAIL, session=session))
+
+    assert benchmark(lookup) is not None
+    event_loop.run_until_complete(session.close())
@@ -0,0 +1,42 @@
+"""
+JsonResponse serialization of the payloads it receives
+"""
+import pytest
+
+from app.schemas import Response
+from app.utils import response_util
+
+
+def _node() -> dict:
+    return {
+        "users": [
+            {"id": f"7a60c528-14d8-4792-a022-{i:012d}", "firstname": "John", "lastname": "Doe",
+             "email": f"john{i}@mail.com", "roles": ["user"], "two_factor_enabled": False,
+             "profile_picture": None}
+            for i in range(10)
+        ],
+        "next_cursor": "eyJrIjoiN2E2MGM1MjgifQ",
+    }
+
+
+@pytest.fixture
+def model():
+    return Response(node=_node(), status=200)
+
+
+def bench_route_dict(benchmark, model):
+    # What FastAPI passes after serializing a route's -> Response
+    content = model.model_dump(mode="json")
+    benchmark(response_util.JsonResponse, content)
+
+
+def bench_model(benchmark, model):
+    benchmark(response_util.JsonResponse, model)
+
+
+def bench_bare(benchmark):
+    benchmark(response_util.JsonResponse, _node())
+
+
+def bench_error(benchmark):
+    benchmark(lambda: response_util.JsonResponse(response_util._error_body("Token has expired", 401)))
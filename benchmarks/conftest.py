@@ -0,0 +1,72 @@
+"""
+Fixtures shared by the microbenchmarks (bench_*.py)
+
+Every fixture builds the same data on every run (fixed payloads, seeded users,
+a fresh sqlite database), so results stay comparable between runs and machines
+only differ by their speed.
+"""
+from sqlalchemy import insert
+import asyncio
+import pytest
+import uuid
+
+from app.config import database
+
+USERS = 2000
+PASSWORD = "correct horse battery staple"
+
+
+@pytest.fixture(scope="session")
+def jwt_payload():
+    def payload() -> dict:
+        # encode_jwt adds the default claims to the dict it is given, so each call gets a new one
+        return {"sub": "7a60c528-14d8-4792-a022-8281375e724d", "roles": ["user"]}
+    return payload
+
+
+@pytest.fixture(scope="session")
+def jwt_keys():
+    from app.utils import JwtUtil
+
+    if JwtUtil._KEYS["private"] is None:
+        JwtUtil.generate_keys(algorithm="RS256")
+    return JwtUtil
+
+
+@pytest.fixture(scope="session")
+def sqlite_db(tmp_path_factory):
+    """
+    A migrated sqlite database with USERS users, each holding the user role
+    """
+    from app.models import Role, User, user_roles
+    from app.utils import Repository, PasswordUtil
+
+    database._DatabaseConfig.update(TYPE="sqlite", NAME=str(tmp_path_factory.mktemp("db") / "bench"))
+    database.db_migrate()
+
+    password = PasswordUtil.hash_password(PASSWORD)
+    role_id = str(uuid.uuid4())
+    rows = [
+        {"id": str(uuid.UUID(int=i + 1)), "firstname": "user", "lastname": str(i),
+         "email": f"user{i}@mail.com", "_password": password, "verified": True}
+        for i in range(USERS)
+    ]
+
+    session = database.get_session()
+    Repository(base_model=Role).create_many([{"id": role_id, "name": "user"}], session=session)
+    Repository(base_model=User).create_many(rows, session=session)
+    session.execute(insert(user_roles), [{"user_id": row["id"], "role_id": role_id} for row in rows])
+    session.commit()
+    session.close()
+
+    yield [row["email"] for row in rows]
+
+    database.db_shutdown()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(database.async_db_shutdown())
+    loop.close()
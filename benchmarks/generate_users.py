@@ -0,0 +1,82 @@
+"""
+Large dataset generator
+
+Bulk-loads users, each holding the user role, into the configured database
+(DB_TYPE, DB_NAME, DB_HOST, ... as for the service). Hashing a password per
+user would take days at the default bcrypt cost, so --hashes hashes of the
+same password are computed once and assigned to the users in turn: every
+generated user logs in with --password, and every --hashes-th user shares the
+same hash (and salt). Fine for load testing, not for anything relying on unique salts.
+
+Rows are inserted in chunks of one transaction each, with multi-row INSERTs.
+The schema is migrated and the roles seeded first if needed. Users are named
+load<i>@mail.com, so runs with --start append to an existing dataset.
+
+usage:
+------
+python -m benchmarks.generate_users --users 1000000 [--start 0] [--chunk 10000] [--password password] [--hashes 8]
+"""
+from sqlalchemy import insert, select
+import argparse
+import time
+import uuid
+
+from app.config import database
+
+
+def _role_id(session) -> str:
+    from app.models import Role
+    return session.execute(select(Role.id).where(Role.name == "user")).scalar_one()
+
+
+def generate(users: int, start: int = 0, chunk: int = 10000, password: str = "password", hashes: int = 8) -> float:
+    """
+    :return: the rows inserted per second (users and role links)
+    """
+    from app.models import User, user_roles
+    from app.utils import Repository, PasswordUtil
+
+    database.db_migrate()
+    database.db_init()
+
+    passwords = [PasswordUtil.hash_password(password) for _ in range(hashes)]
+    repository = Repository(base_model=User)
+
+    session = database.get_session()
+    try:
+        role_id = _role_id(session)
+        started = time.perf_counter()
+        for offset in range(start, start + users, chunk):
+            rows = [
+                {"id": str(uuid.uuid4()), "firstname": "load", "lastname": str(i), "email": f"load{i}@mail.com",
+                 "_password": passwords[i % hashes], "verified": True}
+                for i in range(offset, min(offset + chunk, start + users))
+            ]
+            if not repository.create_many(rows, session=session):
+                raise RuntimeError(f"Could not insert users {offset} to {offset + len(rows)}")
+            session.execute(insert(user_roles), [{"user_id": row["id"], "role_id": role_id} for row in rows])
+            session.commit()
+
+            done = offset + len(rows) - start
+            elapsed = time.perf_counter() - started
+            print(f"\r{done}/{users} users, {2 * done / elapsed:,.0f} rows/s", end="", flush=True)
+        print()
+        return 2 * users / (time.perf_counter() - started)
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, required=True, help="the number of users to generate")
+    parser.add_argument("--start", type=int, default=0, help="the index of the first user, to extend a dataset")
+    parser.add_argument("--chunk", type=int, default=10000, help="the users inserted per transaction")
+    parser.add_argument("--password", default="password", help="the password of every generated user")
+    parser.add_argument("--hashes", type=int, default=8, help="the number of distinct password hashes")
+    args = parser.parse_args()
+
+    generate(args.users, args.start, args.chunk, args.password, args.hashes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+JWT algorithm benchmark
+
+Measures sign and verify throughput of JwtUtil.encode_jwt / decode_jwt for each
+algorithm selectable through JWT_ALGORITHM.
+
+usage:
+------
+python -m benchmarks.jwt_algorithms [--seconds 2] [--algorithms RS256,PS256,ES256,EdDSA]
+"""
+import argparse
+import time
+import uuid
+
+from app.utils import JwtUtil
+from app.utils.key_store import generate_private_key, ACTIVE
+
+
+def _payload() -> dict:
+    return {"sub": "7a60c528-14d8-4792-a022-8281375e724d", "roles": ["user"]}
+
+
+def _rate(func, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+    parser.add_argument("--algorithms", default="RS256,PS256,ES256,EdDSA", help="comma separated algorithms")
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<10}{'sign (tok/s)':>14}{'verify (tok/s)':>16}{'token bytes':>13}")
+    for algorithm in args.algorithms.split(","):
+        JwtUtil._set_keys([{
+            "kid": uuid.uuid4().hex,
+            "alg": algorithm,
+            "status": ACTIVE,
+            "key": generate_private_key(algorithm),
+        }])
+        token = JwtUtil.encode_jwt(_payload())
+
+        sign = _rate(lambda: JwtUtil.encode_jwt(_payload()), args.seconds)
+        # Passing the algorithms explicitly bypasses the verified token cache
+        verify = _rate(lambda: JwtUtil.decode_jwt(token, algorithms=[algorithm]), args.seconds)
+        print(f"{algorithm:<10}{sign:>14.0f}{verify:>16.0f}{len(token):>13}")
+
+
+if __name__ == "__main__":
+    main()
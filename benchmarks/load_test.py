@@ -0,0 +1,156 @@
+"""
+End-to-end load driver
+
+Drives the ASGI app in-process through httpx (no server, no network), against
+the configured database, typically filled by benchmarks.generate_users:
+
+- login:    POST /login as a random generated user
+- register: POST /register with a new email
+- reset:    GET /password/reset as a random generated user (the password is
+            set to the same value, so the dataset stays usable)
+
+Each endpoint is run on its own, with --concurrency requests in flight, and
+reported with its throughput and p50/p95/p99 latency. A request counts as an
+error unless both the HTTP status and the Response status are 2xx.
+
+The app's lifespan is not run, as its shutdown drops the tables; the driver
+starts the parts of it the endpoints need instead. Every request comes from the
+same client, so the rate limiter is turned off unless --rate-limit is given.
+
+usage:
+------
+python -m benchmarks.load_test [--requests 1000] [--concurrency 32] [--endpoints login,register,reset]
+                               [--sample 1000] [--password password] [--rate-limit]
+"""
+from dataclasses import dataclass, field
+from sqlalchemy import select
+import argparse
+import asyncio
+import httpx
+import random
+import time
+import uuid
+
+from app.config import database, run_job
+
+
+@dataclass
+class _Result:
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+
+def _percentile(values: list, percent: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _sample_users(count: int) -> list:
+    from app.models import User
+
+    session = database.get_session()
+    try:
+        users = session.execute(
+            select(User.id, User.email).where(User.email.like("load%")).limit(count)
+        ).all()
+    finally:
+        session.close()
+    if not users:
+        raise SystemExit("No generated users found, run benchmarks.generate_users first")
+    return users
+
+
+def _requests(endpoint: str, users: list, password: str):
+    """
+    :return: a function building the method, url and request options of each request
+    """
+    from app.utils import JwtUtil
+
+    if endpoint == "login":
+        return lambda: ("POST", "/login", {"json": {"email": random.choice(users).email, "password": password}})
+    if endpoint == "register":
+        return lambda: ("POST", "/register", {"json": {
+            "email": f"register-{uuid.uuid4().hex}@mail.com", "password": password,
+            "firstname": "load", "lastname": "test",
+        }})
+    if endpoint == "reset":
+        # Tokens are signed up front, so the run measures the reset itself
+        tokens = [JwtUtil.encode_jwt({"sub": user.id, "roles": ["user"]}) for user in users]
+        return lambda: ("GET", "/password/reset", {
+            "json": {"password": password},
+            "headers": {"Authorization": f"Bearer {random.choice(tokens)}"},
+        })
+    raise SystemExit(f"Unknown endpoint '{endpoint}'")
+
+
+async def _run(client: httpx.AsyncClient, build, requests: int, concurrency: int) -> _Result:
+    result = _Result()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            method, url, options = build()
+            started = time.perf_counter()
+            response = await client.request(method, url, **options)
+            result.latencies.append(time.perf_counter() - started)
+            # JsonResponse answers 200, the outcome is in the Response body
+            if not response.is_success or not 200 <= response.json().get("status", 200) < 300:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def load_test(
+        endpoints: list, requests: int, concurrency: int, sample: int, password: str, rate_limit: bool = False
+) -> dict:
+    from main import app
+    from app.utils import JwtUtil, PasswordUtil, email_util, rate_limiter
+
+    rate_limiter._RateLimitConfig["ENABLED"] = rate_limit
+
+    JwtUtil.load_keys()
+    PasswordUtil.start_pool()
+    run_job("sync_revocations")
+    email_util.load_templates()
+    users = _sample_users(sample)
+
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            for endpoint in endpoints:
+                build = _requests(endpoint, users, password)
+                # Warm up the pools and caches before measuring
+                await _run(client, build, concurrency, concurrency)
+                results[endpoint] = await _run(client, build, requests, concurrency)
+    finally:
+        PasswordUtil.shutdown_pool()
+        await database.async_db_shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="the requests sent to each endpoint")
+    parser.add_argument("--concurrency", type=int, default=32, help="the requests in flight at a time")
+    parser.add_argument("--endpoints", default="login,register,reset", help="comma separated: login, register, reset")
+    parser.add_argument("--sample", type=int, default=1000, help="the generated users the requests are spread over")
+    parser.add_argument("--password", default="password", help="the password of the generated users")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the rate limiter on")
+    args = parser.parse_args()
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    results = asyncio.run(load_test(endpoints, args.requests, args.concurrency, args.sample, args.password, args.rate_limit))
+
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}")
+    for endpoint, result in results.items():
+        latencies = sorted(result.latencies)
+        print(f"{endpoint:<10}{len(latencies):>10}{result.errors:>8}{len(latencies) / result.elapsed:>10.1f}"
+              + "".join(f"{_percentile(latencies, p) * 1000:>10.1f}" for p in (50, 95, 99)))
+
+
+if __name__ == "__main__":
+    main()
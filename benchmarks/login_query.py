@@ -0,0 +1,104 @@
+"""
+Login query benchmark
+
+Compares the per-login database time of the full entity lookup
+(`get_by(email=...)` with the roles joined-eager-loaded) with the projection
+based `UserRepository.get_credentials`, against a temporary sqlite database.
+
+usage:
+------
+python -m benchmarks.login_query [--users 20000] [--lookups 2000]
+"""
+from sqlalchemy import insert
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from app.config import database
+
+
+def _seed(users: int):
+    from app.models import Base, Role, User, user_roles
+    from app.utils import Repository, PasswordUtil
+
+    Base.metadata.create_all(bind=database.get_engine())
+    password = PasswordUtil.hash_password("password")
+    role_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    session = database.get_session()
+    Repository(base_model=Role).create_many(
+        [{"id": role_ids[0], "name": "admin"}, {"id": role_ids[1], "name": "user"}],
+        session=session
+    )
+    rows = [
+        {"id": str(uuid.uuid4()), "firstname": "user", "lastname": str(i), "email": f"user{i}@mail.com",
+         "_password": password}
+        for i in range(users)
+    ]
+    Repository(base_model=User).create_many(rows, session=session)
+    session.execute(insert(user_roles), [{"user_id": row["id"], "role_id": role_ids[1]} for row in rows])
+    session.commit()
+    session.close()
+
+
+async def _time(lookup, emails: list) -> float:
+    session = database.get_async_session()
+    try:
+        start = time.perf_counter()
+        for email in emails:
+            await lookup(email, session)
+            # Start from an empty identity map, as a new request would
+            session.expunge_all()
+        return (time.perf_counter() - start) / len(emails)
+    finally:
+        await session.close()
+
+
+async def _run(users: int, lookups: int):
+    from app.utils.user_repository import UserRepository
+    from app.handlers.user_handler import user_repo
+
+    emails = [f"user{random.randrange(users)}@mail.com" for _ in range(lookups)]
+    credentials_repo = UserRepository()
+
+    async def full_entity(email, session):
+        user = await user_repo.get_by(session=session, email=email)
+        return user.id, user._password, [role.name for role in user.roles]
+
+    async def credentials(email, session):
+        return await credentials_repo.get_credentials(email, session=session)
+
+    # Warm up the connections and statement caches
+    await _time(full_entity, emails[:50])
+    await _time(credentials, emails[:50])
+
+    before = await _time(full_entity, emails)
+    after = await _time(credentials, emails)
+
+    print(f"{'lookup':<28}{'per login (us)':>16}")
+    print(f"{'get_by + joinedload(roles)':<28}{before * 1e6:>16.1f}")
+    print(f"{'get_credentials':<28}{after * 1e6:>16.1f}")
+    print(f"speedup: {before / after:.2f}x")
+
+    await database.async_db_shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000, help="number of users to seed")
+    parser.add_argument("--lookups", type=int, default=2000, help="number of logins measured per query")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database._DatabaseConfig.update(TYPE="sqlite", NAME=os.path.join(directory, "bench"))
+
+    _seed(args.users)
+    asyncio.run(_run(args.users, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
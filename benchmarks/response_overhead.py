@@ -0,0 +1,89 @@
+"""
+Response serialization benchmark
+
+Compares the previous JsonResponse, which validated every payload into a
+Response again, dumped it to a dict and encoded that with the stdlib json
+module, with the direct serialization path, for the payloads it receives:
+
+- route: the dict FastAPI passes after serializing the route's `-> Response`
+- model: a Response object (exception handlers)
+- bare:  any other value, wrapped into a Response
+- error: an HTTPException payload, pre-serialized once per message
+
+usage:
+------
+python -m benchmarks.response_overhead [--seconds 2]
+"""
+from starlette.responses import JSONResponse
+import argparse
+import time
+
+from app.schemas import Response
+from app.utils import response_util
+
+
+class _LegacyJsonResponse(JSONResponse):
+    # The JsonResponse before the fast path, for comparison
+    def __init__(self, response, status_code=200, **kwargs):
+        if isinstance(response, Response):
+            response = response.model_dump()
+        elif isinstance(response, dict):
+            if 'node' not in response and 'errors' not in response:
+                response = Response(node=response, status=status_code).model_dump()
+            else:
+                response = Response(**response).model_dump()
+        else:
+            response = Response(node=response, status=status_code).model_dump()
+
+        super().__init__(response, status_code, **kwargs)
+
+
+def _node() -> dict:
+    return {
+        "users": [
+            {"id": f"7a60c528-14d8-4792-a022-{i:012d}", "firstname": "John", "lastname": "Doe",
+             "email": f"john{i}@mail.com", "roles": ["user"], "two_factor_enabled": False,
+             "profile_picture": None}
+            for i in range(10)
+        ],
+        "next_cursor": "eyJrIjoiN2E2MGM1MjgifQ",
+    }
+
+
+def _rate(func, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+    args = parser.parse_args()
+
+    node = _node()
+    model = Response(node=node, status=200)
+    route = model.model_dump(mode="json")
+    detail = "Token has expired"
+
+    cases = [
+        ("route", lambda: _LegacyJsonResponse(route), lambda: response_util.JsonResponse(route)),
+        ("model", lambda: _LegacyJsonResponse(model), lambda: response_util.JsonResponse(model)),
+        ("bare", lambda: _LegacyJsonResponse(node), lambda: response_util.JsonResponse(node)),
+        ("error", lambda: _LegacyJsonResponse(Response(node=None, errors=[detail], status=401)),
+         lambda: response_util.JsonResponse(response_util._error_body(detail, 401))),
+    ]
+
+    print(f"{'payload':<10}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, before, after in cases:
+        assert before().body.replace(b" ", b"") == after().body.replace(b" ", b"")
+        before_rate, after_rate = _rate(before, args.seconds), _rate(after, args.seconds)
+        print(f"{name:<10}{1e6 / before_rate:>14.2f}{1e6 / after_rate:>14.2f}{after_rate / before_rate:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+UUID key benchmark
+
+Builds the users / roles / user_roles tables twice in sqlite, once with CHAR(36)
+text ids and once with 16 byte binary ids, and compares the size of every table
+and index and the latency of the login role join.
+
+The tables are WITHOUT ROWID, so rows are clustered on the primary key like
+InnoDB tables on MySQL, where BinaryUUID stores ids as BINARY(16).
+
+usage:
+------
+python -m benchmarks.uuid_keys [--rows 1000000] [--lookups 20000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+_SCHEMA = """
+CREATE TABLE roles (id {key} PRIMARY KEY, name VARCHAR(50) NOT NULL) WITHOUT ROWID;
+CREATE TABLE users (
+    id {key} PRIMARY KEY,
+    firstname VARCHAR(50) NOT NULL,
+    lastname VARCHAR(50) NOT NULL,
+    email VARCHAR(50) NOT NULL UNIQUE,
+    _password VARCHAR(100)
+) WITHOUT ROWID;
+CREATE TABLE user_roles (
+    user_id {key} NOT NULL REFERENCES users(id),
+    role_id {key} NOT NULL REFERENCES roles(id),
+    PRIMARY KEY (user_id, role_id)
+) WITHOUT ROWID;
+CREATE INDEX ix_user_roles_role_id ON user_roles (role_id);
+"""
+
+_JOIN = """
+SELECT r.name FROM users u
+JOIN user_roles ur ON ur.user_id = u.id
+JOIN roles r ON r.id = ur.role_id
+WHERE u.id = ?
+"""
+
+_PASSWORD = "$2b$12$Jx8m3oGmI0gJ0vR0m4fB3uXq1w5o2W8pQ3QeY0p7Jm1bq2m9P4y3e"
+
+
+def _build(path: str, key_type: str, encode, rows: int, batch: int = 50000) -> list:
+    connection = sqlite3.connect(path)
+    connection.executescript(_SCHEMA.format(key=key_type))
+
+    role_ids = [encode(uuid.uuid4()) for _ in range(2)]
+    connection.executemany("INSERT INTO roles VALUES (?, ?)", zip(role_ids, ["admin", "user"]))
+
+    ids = []
+    for start in range(0, rows, batch):
+        chunk = [(encode(uuid.uuid4()), i) for i in range(start, min(start + batch, rows))]
+        connection.executemany(
+            "INSERT INTO users VALUES (?, 'user', ?, ?, ?)",
+            [(user_id, str(i), f"user{i}@mail.com", _PASSWORD) for user_id, i in chunk]
+        )
+        connection.executemany(
+            "INSERT INTO user_roles VALUES (?, ?)",
+            [(user_id, role_ids[1]) for user_id, _ in chunk]
+        )
+        ids.extend(user_id for user_id, _ in chunk)
+
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+    return ids
+
+
+def _sizes(path: str) -> dict:
+    connection = sqlite3.connect(path)
+    sizes = dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    connection.close()
+    return sizes
+
+
+def _join_latency(path: str, ids: list, lookups: int) -> float:
+    connection = sqlite3.connect(path)
+    sample = random.sample(ids, min(lookups, len(ids)))
+    start = time.perf_counter()
+    for user_id in sample:
+        connection.execute(_JOIN, (user_id,)).fetchall()
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return elapsed / len(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000, help="number of users")
+    parser.add_argument("--lookups", type=int, default=20000, help="number of joins measured")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    variants = [
+        ("CHAR(36)", "CHAR(36)", str),
+        ("BINARY(16)", "BLOB", lambda value: value.bytes),
+    ]
+
+    results = []
+    for name, key_type, encode in variants:
+        path = os.path.join(directory, f"{key_type.lower().replace('(', '').replace(')', '')}.db")
+        ids = _build(path, key_type, encode, args.rows)
+        results.append((name, _sizes(path), os.path.getsize(path), _join_latency(path, ids, args.lookups)))
+
+    objects = sorted(set(results[0][1]) - {"sqlite_schema"})
+    print(f"{args.rows} users, size in MiB")
+    print(f"{'object':<42}" + "".join(f"{name:>14}" for name, *_ in results))
+    for obj in objects:
+        print(f"{obj:<42}" + "".join(f"{sizes.get(obj, 0) / 2 ** 20:>14.1f}" for _, sizes, _, _ in results))
+    print(f"{'database file':<42}" + "".join(f"{size / 2 ** 20:>14.1f}" for _, _, size, _ in results))
+    print(f"{'login role join (us)':<42}" + "".join(f"{latency * 1e6:>14.1f}" for *_, latency in results))
+
+
+if __name__ == "__main__":
+    main()
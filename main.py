@@ -1,34 +1,69 @@
+import time
+
+# Taken before anything else is imported, to time the imports as a startup step
+_import_started = time.perf_counter()
+
 from contextlib import asynccontextmanager, AbstractAsyncContextManager
 from fastapi import FastAPI, HTTPException
 from fastapi.exceptions import RequestValidationError
-from app.config import database, scheduler, logger
-from app.utils import JwtUtil, response_util
-from app.models import Base
+from starlette.responses import JSONResponse, Response as RawResponse
+from app.config import database, startup, scheduler, run_job, job_stats, logger
+from app.utils import JwtUtil, PasswordUtil, PasswordPoolBusy, email_util, metrics, rate_limiter, response_util
 from app.routers import *
+from app.middleware import AccessLogMiddleware, MetricsMiddleware
 
 Response = response_util.Response
 
+startup.record("imports", time.perf_counter() - _import_started)
+
 """
 This is the main entry point for the FastAPI application.
 
 The `lifespan` context manager is used to manage the lifecycle of the application.
-The `database.db_init` method is called to initialize the database connection.
+What it runs depends on STARTUP_MODE (see app/config/startup.py); full runs every step, fast only the unmarked ones.
+The `JwtUtil.load_keys` method is called to load (or create) the shared RSA keys used for JWT signing (rotated if due: full).
+The `PasswordUtil.start_pool` method is called to start the process pool used for bcrypt hashing.
+The `database.db_migrate` method is called to upgrade the database schema, see migrations/ (full).
+The `database.db_init` method is called to seed the roles and the default users (full).
+The `sync_revocations` job is run once to load the revoked tokens, before any request is verified.
 The `scheduler.start` method is called to start the background scheduler.
-The `JwtUtil.generate_keys` method is called to generate the RSA keys used for JWT signing.
+The `email_util.load_templates` method is called to compile the email templates, so broken ones fail at startup.
+The `email_util.start_queue` method is called to start the background email delivery workers.
+The `database.db_shutdown` method is called on shutdown to drop the schema (full).
+Each step is timed, the breakdown is logged once started and served on /internal/startup.
 """
-Base.metadata.create_all(bind=database.get_engine())
 
 @asynccontextmanager
 async def lifespan(app) -> AbstractAsyncContextManager[None]:
-    JwtUtil.generate_keys()
-    database.db_init()
-    scheduler.start()
-    logger.info("Application started")
+    with startup.step("keys"):
+        JwtUtil.load_keys(rotate=startup.enabled("ROTATE_KEYS"))
+    with startup.step("password_pool"):
+        PasswordUtil.start_pool()
+    if startup.enabled("MIGRATE"):
+        with startup.step("migrate"):
+            database.db_migrate()
+    if startup.enabled("SEED"):
+        with startup.step("seed"):
+            database.db_init()
+    with startup.step("revocations"):
+        run_job("sync_revocations")
+    with startup.step("scheduler"):
+        scheduler.start()
+    with startup.step("templates"):
+        email_util.load_templates()
+    with startup.step("email_queue"):
+        email_util.start_queue()
+    timings = startup.report()
+    logger.info("Application started in %s ms (%s mode)", timings["total_ms"], timings["mode"], extra={"startup": timings})
 
     yield
 
-    database.db_shutdown()
+    if startup.enabled("DROP_ON_SHUTDOWN"):
+        database.db_shutdown()
+    await database.async_db_shutdown()
     scheduler.shutdown()
+    PasswordUtil.shutdown_pool()
+    email_util.stop_queue()
     logger.info("Application stopped")
 
 
@@ -37,10 +72,16 @@ app = FastAPI(
     lifespan=lifespan,
     exception_handlers={
         RequestValidationError: response_util.validation_error_handler,
-        HTTPException: response_util.HTTPException_handler
+        HTTPException: response_util.HTTPException_handler,
+        rate_limiter.RateLimitExceeded: response_util.retry_after_handler,
+        PasswordPoolBusy: response_util.retry_after_handler
     }
 )
 
+# Requests are logged here, run uvicorn with --no-access-log to avoid logging them twice
+app.add_middleware(AccessLogMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(user_router)
 app.include_router(email_router)
 app.include_router(token_router)
@@ -55,6 +96,36 @@ async def health() -> Response:
 
 @app.get("/public-key")
 async def public_key() -> Response:
-    return Response(public_key=JwtUtil.get_public_key_pem(), status=200)
+    return Response(node=JwtUtil.get_public_key_pem().decode("utf-8"), status=200)
+
+@app.get("/internal/db-pool", tags=["internal"], include_in_schema=False)
+async def db_pool() -> Response:
+    return Response(node=database.pool_status(), status=200)
+
+@app.get("/internal/email-queue", tags=["internal"], include_in_schema=False)
+async def email_queue() -> Response:
+    return Response(node={"depth": email_util.queue_depth()}, status=200)
+
+@app.get("/internal/startup", tags=["internal"], include_in_schema=False)
+async def startup_timings() -> Response:
+    return Response(node=startup.report(), status=200)
+
+@app.get("/internal/rate-limits", tags=["internal"], include_in_schema=False)
+async def rate_limits() -> Response:
+    return Response(node=rate_limiter.stats(), status=200)
+
+@app.get("/internal/jobs", tags=["internal"], include_in_schema=False)
+async def jobs() -> Response:
+    return Response(node=job_stats(), status=200)
+
+@app.get("/metrics", tags=["internal"], include_in_schema=False)
+async def prometheus_metrics() -> RawResponse:
+    body, content_type = metrics.render()
+    return RawResponse(body, media_type=content_type)
+
+@app.get("/.well-known/jwks.json")
+async def jwks() -> JSONResponse:
+    # Served as a bare JWK Set, as verifiers expect, rather than wrapped in a Response
+    return JSONResponse(JwtUtil.get_jwks())
 
 
@@ -0,0 +1,50 @@
+"""initial schema
+
+The tables as created by Base.metadata.create_all before migrations existed.
+Databases created that way are stamped with this revision by
+`database.db_migrate` and upgraded from there.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-09-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'roles',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('name', sa.String(50), nullable=False),
+    )
+    op.create_table(
+        'users',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('firstname', sa.String(50), nullable=False),
+        sa.Column('lastname', sa.String(50), nullable=False),
+        sa.Column('email', sa.String(50), nullable=False),
+        sa.Column('phone_number', sa.String(50), nullable=True),
+        sa.Column('_password', sa.String(100)),
+        sa.Column('verified', sa.Boolean),
+        sa.Column('two_factor_enabled', sa.Boolean),
+        sa.Column('profile_picture', sa.String(100)),
+        sa.UniqueConstraint('email'),
+    )
+    op.create_table(
+        'user_roles',
+        sa.Column('user_id', sa.String(36), sa.ForeignKey('users.id')),
+        sa.Column('role_id', sa.String(36), sa.ForeignKey('roles.id')),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_roles')
+    op.drop_table('users')
+    op.drop_table('roles')
@@ -0,0 +1,48 @@
+"""user_roles keys and normalized emails
+
+- Removes duplicate and incomplete user_roles rows, then adds the composite
+  primary key (user_id, role_id), which also serves lookups by user_id, and an
+  index on role_id.
+- Lowercases the stored emails, so the unique index on users.email serves
+  case-insensitive lookups. This fails on the unique index if two accounts
+  differ only by case; those have to be merged by hand first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-09-08 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE user_roles_dedup AS "
+        "SELECT DISTINCT user_id, role_id FROM user_roles "
+        "WHERE user_id IS NOT NULL AND role_id IS NOT NULL"
+    )
+    op.execute("DELETE FROM user_roles")
+    op.execute("INSERT INTO user_roles (user_id, role_id) SELECT user_id, role_id FROM user_roles_dedup")
+    op.drop_table('user_roles_dedup')
+
+    with op.batch_alter_table('user_roles') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.String(36), nullable=False)
+        batch_op.alter_column('role_id', existing_type=sa.String(36), nullable=False)
+        batch_op.create_primary_key('pk_user_roles', ['user_id', 'role_id'])
+        batch_op.create_index('ix_user_roles_role_id', ['role_id'])
+
+    op.execute("UPDATE users SET email = LOWER(TRIM(email))")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('user_roles') as batch_op:
+        batch_op.drop_index('ix_user_roles_role_id')
+        batch_op.drop_constraint('pk_user_roles', type_='primary')
+        batch_op.alter_column('user_id', existing_type=sa.String(36), nullable=True)
+        batch_op.alter_column('role_id', existing_type=sa.String(36), nullable=True)
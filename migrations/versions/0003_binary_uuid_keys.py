@@ -0,0 +1,76 @@
+"""binary uuid keys
+
+Converts users.id, roles.id and both user_roles columns from CHAR(36) text to
+BINARY(16) on MySQL (see app.models.types.BinaryUUID). Other databases keep the
+text form and are left untouched.
+
+Each column is copied into a new BINARY(16) column with UNHEX, then swapped in
+place of the old one; the foreign keys are dropped for the duration and
+recreated with their original names.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-09-15 00:00:00
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# Foreign key names given by MySQL to the constraints created in 0001
+_foreign_keys = [
+    ('user_roles_ibfk_1', 'user_id', 'users'),
+    ('user_roles_ibfk_2', 'role_id', 'roles'),
+]
+
+
+def _to_binary(column: str) -> str:
+    return f"UNHEX(REPLACE({column}, '-', ''))"
+
+
+def _to_text(column: str) -> str:
+    return (f"LOWER(CONCAT_WS('-', SUBSTR(HEX({column}), 1, 8), SUBSTR(HEX({column}), 9, 4), "
+            f"SUBSTR(HEX({column}), 13, 4), SUBSTR(HEX({column}), 17, 4), SUBSTR(HEX({column}), 21)))")
+
+
+def _convert(column_type: str, convert) -> None:
+    for name, _, _ in _foreign_keys:
+        op.drop_constraint(name, 'user_roles', type_='foreignkey')
+
+    for table in ('users', 'roles'):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN id_new {column_type} NULL")
+        op.execute(f"UPDATE {table} SET id_new = {convert('id')}")
+        op.execute(
+            f"ALTER TABLE {table} DROP PRIMARY KEY, DROP COLUMN id, "
+            f"CHANGE id_new id {column_type} NOT NULL FIRST, ADD PRIMARY KEY (id)"
+        )
+
+    op.execute(f"ALTER TABLE user_roles ADD COLUMN user_id_new {column_type} NULL, "
+               f"ADD COLUMN role_id_new {column_type} NULL")
+    op.execute(f"UPDATE user_roles SET user_id_new = {convert('user_id')}, role_id_new = {convert('role_id')}")
+    # Dropping the columns also drops the primary key and the indexes built on them
+    op.execute(
+        f"ALTER TABLE user_roles DROP COLUMN user_id, DROP COLUMN role_id, "
+        f"CHANGE user_id_new user_id {column_type} NOT NULL FIRST, "
+        f"CHANGE role_id_new role_id {column_type} NOT NULL AFTER user_id, "
+        f"ADD CONSTRAINT pk_user_roles PRIMARY KEY (user_id, role_id), "
+        f"ADD INDEX ix_user_roles_role_id (role_id)"
+    )
+
+    for name, column, table in _foreign_keys:
+        op.create_foreign_key(name, 'user_roles', table, [column], ['id'])
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    _convert('BINARY(16)', _to_binary)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    _convert('VARCHAR(36)', _to_text)
@@ -0,0 +1,43 @@
+"""refresh tokens
+
+Adds the refresh_tokens table. Tokens are stored as their SHA-256 digest, looked
+up through the unique index on token_hash; the other indexes serve revoking a
+token family and purging expired tokens.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-09-22 00:00:00
+"""
+from alembic import op
+from sqlalchemy.dialects import mysql
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+# Same storage as app.models.types.BinaryUUID
+_uuid = sa.String(36).with_variant(mysql.BINARY(16), 'mysql')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'refresh_tokens',
+        sa.Column('id', _uuid, primary_key=True),
+        sa.Column('token_hash', sa.String(64), nullable=False),
+        sa.Column('user_id', _uuid, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('family_id', _uuid, nullable=False),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+        sa.Column('used', sa.Boolean, nullable=False),
+        sa.Column('revoked', sa.Boolean, nullable=False),
+    )
+    op.create_index('ix_refresh_tokens_token_hash', 'refresh_tokens', ['token_hash'], unique=True)
+    op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens', ['user_id'])
+    op.create_index('ix_refresh_tokens_family_id', 'refresh_tokens', ['family_id'])
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('refresh_tokens')
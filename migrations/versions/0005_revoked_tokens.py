@@ -0,0 +1,30 @@
+"""revoked tokens
+
+Adds the revoked_tokens table, the persisted form of the in-memory revocation
+list, indexed on expires_at for purging.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-09-29 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revoked_tokens',
+        sa.Column('jti', sa.String(32), primary_key=True),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+    )
+    op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('revoked_tokens')
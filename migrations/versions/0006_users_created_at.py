@@ -0,0 +1,33 @@
+"""users created_at
+
+Adds users.created_at, indexed for the cleanup of never-verified accounts.
+Existing users get the time of the upgrade, so they are only considered for
+cleanup after the full grace period.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-10-06 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('created_at', sa.DateTime, nullable=True))
+    op.execute("UPDATE users SET created_at = CURRENT_TIMESTAMP")
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime, nullable=False)
+        batch_op.create_index('ix_users_created_at', ['created_at'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_index('ix_users_created_at')
+        batch_op.drop_column('created_at')
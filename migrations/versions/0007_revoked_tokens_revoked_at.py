@@ -0,0 +1,33 @@
+"""revoked_tokens revoked_at
+
+Adds revoked_tokens.revoked_at, indexed so each revocation sync only reads the
+tokens revoked since the previous one. Existing rows get the time of the
+upgrade, workers load them with their first, full, sync anyway.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-10-20 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('revoked_tokens', sa.Column('revoked_at', sa.DateTime, nullable=True))
+    op.execute("UPDATE revoked_tokens SET revoked_at = CURRENT_TIMESTAMP")
+
+    with op.batch_alter_table('revoked_tokens') as batch_op:
+        batch_op.alter_column('revoked_at', existing_type=sa.DateTime, nullable=False)
+        batch_op.create_index('ix_revoked_tokens_revoked_at', ['revoked_at'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('revoked_tokens') as batch_op:
+        batch_op.drop_index('ix_revoked_tokens_revoked_at')
+        batch_op.drop_column('revoked_at')
@@ -0,0 +1,70 @@
+"""
+Fixtures shared by the tests
+
+The tests run against a migrated sqlite database, created for the session and
+seeded like the service's own (roles, admin@admin.com and user@mail.com), with
+in-memory signing keys and a low bcrypt cost so hashing stays fast. Async code
+runs on one event loop for the whole session, as the async engine's pooled
+connections belong to the loop that opened them.
+"""
+import asyncio
+import httpx
+import pytest
+
+# app.utils and app.models import each other; loading the config package first
+# resolves them in the same order as main.py
+from app.config import database
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(database.async_db_shutdown())
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(event_loop):
+    """
+    Run a coroutine to completion on the session's event loop
+    """
+    return event_loop.run_until_complete
+
+
+@pytest.fixture(scope="session")
+def sqlite_db(tmp_path_factory):
+    from app.utils import password_util
+
+    database._DatabaseConfig.update(TYPE="sqlite", NAME=str(tmp_path_factory.mktemp("db") / "auth"))
+    password_util._PasswordConfig["ROUNDS"] = 4
+    database.db_migrate()
+    database.db_init()
+
+    yield
+
+    database.db_shutdown()
+
+
+@pytest.fixture(scope="session")
+def jwt_keys():
+    from app.utils import JwtUtil
+
+    if JwtUtil._KEYS["private"] is None:
+        JwtUtil.generate_keys(algorithm="RS256")
+    return JwtUtil
+
+
+@pytest.fixture
+def client(sqlite_db, jwt_keys, run, monkeypatch):
+    """
+    An HTTP client calling the app in-process, without running its lifespan
+    (whose shutdown drops the schema), and with the rate limiter off
+    """
+    from main import app
+    from app.utils import rate_limiter
+
+    monkeypatch.setitem(rate_limiter._RateLimitConfig, "ENABLED", False)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    yield client
+    run(client.aclose())
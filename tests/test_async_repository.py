@@ -0,0 +1,148 @@
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql
+
+from app.config import database
+from app.models import Role, User, user_roles
+from app.utils import AsyncRepository
+from app.utils.repository import _upsert_statement
+
+repo = AsyncRepository(base_model=Role)
+
+
+def _name() -> str:
+    return f"role-{uuid.uuid4().hex[:12]}"
+
+
+def test_create_and_get_by(sqlite_db, run):
+    name = _name()
+    created = run(repo.create(Role(name=name)))
+
+    found = run(repo.get_by(name=name))
+    assert found is not None
+    assert found.id == created.id
+
+
+def test_get_by_missing(sqlite_db, run):
+    assert run(repo.get_by(name=_name())) is None
+
+
+def test_create_many_and_get_many_by_ids(sqlite_db, run):
+    rows = [{"id": str(uuid.uuid4()), "name": _name()} for _ in range(3)]
+    assert run(repo.create_many(rows)) == 3
+
+    ids = [rows[2]["id"], rows[0]["id"], str(uuid.uuid4())]
+    found = run(repo.get_many_by_ids(ids))
+    # In the order asked for, the unknown id skipped
+    assert [role.id for role in found] == ids[:2]
+
+
+def test_update_where(sqlite_db, run):
+    name, renamed = _name(), _name()
+    run(repo.create(Role(name=name)))
+
+    assert run(repo.update_where({"name": renamed}, name=name)) == 1
+    assert run(repo.get_by(name=name)) is None
+    assert run(repo.get_by(name=renamed)) is not None
+
+
+def test_upsert_many_inserts_and_updates(sqlite_db, run):
+    existing = run(repo.create(Role(name=_name())))
+    new_id, renamed = str(uuid.uuid4()), _name()
+
+    assert run(repo.upsert_many([
+        {"id": existing.id, "name": renamed},
+        {"id": new_id, "name": _name()},
+    ])) == 2
+    assert run(repo.get_by(id=existing.id)).name == renamed
+    assert run(repo.get_by(id=new_id)) is not None
+
+
+def test_upsert_many_composite_primary_key(sqlite_db, run):
+    links = AsyncRepository(base_model=user_roles)
+    user_id, role_id = str(uuid.uuid4()), str(uuid.uuid4())
+    row = {"user_id": user_id, "role_id": role_id}
+
+    assert run(links.upsert_many([row])) == 1
+    # Made of its primary key alone, an existing row is left as it is
+    assert run(links.upsert_many([row, {"user_id": user_id, "role_id": str(uuid.uuid4())}])) == 2
+
+    async def count():
+        session = database.get_async_session()
+        try:
+            return len((await session.execute(select(user_roles).where(user_roles.c.user_id == user_id))).all())
+        finally:
+            await session.close()
+
+    assert run(count()) == 2
+
+
+def _user(email: str) -> dict:
+    return {"id": str(uuid.uuid4()), "firstname": "Test", "lastname": "User", "email": email}
+
+
+def test_upsert_many_sqlite_only_resolves_the_primary_key(sqlite_db, run):
+    users = AsyncRepository(base_model=User)
+    email = f"test-{uuid.uuid4().hex[:12]}@mail.com"
+    row = _user(email)
+    assert run(users.upsert_many([row])) == 1
+
+    assert run(users.upsert_many([dict(row, firstname="Renamed")])) == 1
+    assert run(users.get_by(id=row["id"])).firstname == "Renamed"
+
+    # Another id with the same (unique) email is not resolved on sqlite
+    assert run(users.upsert_many([_user(email)])) == 0
+
+
+def test_upsert_statement_mysql_resolves_any_unique_key():
+    sql = str(_upsert_statement(User, "mysql", [_user("user@mail.com")]).compile(dialect=mysql.dialect()))
+
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "email = VALUES(email)" in sql
+    assert "id = VALUES(id)" not in sql
+
+
+def test_upsert_statement_mysql_composite_primary_key():
+    sql = str(_upsert_statement(user_roles, "mysql", [{"user_id": "a", "role_id": "b"}]).compile(
+        dialect=mysql.dialect()
+    ))
+
+    # Nothing to update but the key itself, so an existing row is left as it is
+    assert "ON DUPLICATE KEY UPDATE user_id = VALUES(user_id)" in sql
+
+
+def test_delete_by(sqlite_db, run):
+    name = _name()
+    run(repo.create(Role(name=name)))
+
+    assert run(repo.delete_by(name=name))
+    assert run(repo.get_by(name=name)) is None
+
+
+def test_stream_all(sqlite_db, run):
+    name = _name()
+    run(repo.create_many([{"id": str(uuid.uuid4()), "name": name} for _ in range(5)]))
+
+    async def collect():
+        return [role async for role in repo.stream_all(batch_size=2, name=name)]
+
+    assert len(run(collect())) == 5
+
+
+def test_given_session_is_left_to_its_owner(sqlite_db, run):
+    name = _name()
+
+    async def scenario():
+        session = database.get_async_session()
+        try:
+            # Flushed in the caller's session, but neither committed nor visible outside it
+            assert await repo.create(Role(name=name), session=session) is not None
+            assert await repo.get_by(session=session, name=name) is not None
+            assert await repo.get_by(name=name) is None
+            await session.rollback()
+        finally:
+            await session.close()
+
+    run(scenario())
+    assert run(repo.get_by(name=name)) is None
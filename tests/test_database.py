@@ -0,0 +1,47 @@
+import pytest
+import uuid
+
+from app.config import database
+from app.models import Role
+from app.utils import AsyncRepository
+
+repo = AsyncRepository(base_model=Role)
+
+
+def test_get_db_commits_when_the_route_returns(sqlite_db, run):
+    name = f"role-{uuid.uuid4().hex[:12]}"
+
+    async def request():
+        dependency = database.get_db()
+        session = await anext(dependency)
+        await repo.create(Role(name=name), session=session)
+        # The route returned, FastAPI resumes the dependency
+        with pytest.raises(StopAsyncIteration):
+            await anext(dependency)
+
+    run(request())
+    assert run(repo.get_by(name=name)) is not None
+
+
+def test_get_db_rolls_back_when_the_route_raises(sqlite_db, run):
+    name = f"role-{uuid.uuid4().hex[:12]}"
+
+    async def request():
+        dependency = database.get_db()
+        session = await anext(dependency)
+        await repo.create(Role(name=name), session=session)
+        # The route raised, FastAPI throws the error into the dependency
+        with pytest.raises(RuntimeError):
+            await dependency.athrow(RuntimeError("route failed"))
+
+    run(request())
+    assert run(repo.get_by(name=name)) is None
+
+
+def test_advisory_lock_is_exclusive(sqlite_db):
+    with database.advisory_lock("test") as acquired:
+        assert acquired
+        with database.advisory_lock("test") as again:
+            assert not again
+    with database.advisory_lock("test") as acquired:
+        assert acquired
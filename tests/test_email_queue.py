@@ -0,0 +1,224 @@
+from email.mime.text import MIMEText
+import smtplib
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from app.utils import email_queue
+from app.utils.email_queue import EmailQueue
+
+SENDER = "noreply@test.com"
+
+# The tests patch time.sleep to skip the backoff, their own waits keep the real one
+_sleep = time.sleep
+
+
+class _Handler:
+    """
+    Accepts every message, except for recipients starting with "refused" (for good)
+    or "busy" (the first time only)
+    """
+
+    def __init__(self):
+        self.delivered: list[str] = []
+        self.busy: set[str] = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refused"):
+            return "550 Mailbox unavailable"
+        if address.startswith("busy") and address not in self.busy:
+            self.busy.add(address)
+            return "451 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _message(to: str) -> MIMEText:
+    message = MIMEText("Hello")
+    message["Subject"] = "Test"
+    message["From"] = SENDER
+    message["To"] = to
+    return message
+
+
+def _wait(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        _sleep(0.01)
+
+
+@pytest.fixture
+def smtp_server():
+    handler = _Handler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+@pytest.fixture
+def connections(smtp_server):
+    """
+    The connections opened to the server, failing with the errors queued in `errors` first
+    """
+    controller, _ = smtp_server
+
+    class Connections(list):
+        def __init__(self):
+            super().__init__()
+            self.errors: list[Exception] = []
+
+        def connect(self) -> smtplib.SMTP:
+            if self.errors:
+                raise self.errors.pop(0)
+            connection = smtplib.SMTP(controller.hostname, controller.port)
+            self.append(connection)
+            return connection
+
+    return Connections()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    The backoff delays of the queue's workers, skipped rather than waited
+    """
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(email_queue.time, "sleep", sleep)
+    return delays
+
+
+def _queue_batch(mail: EmailQueue, recipients: list[str]):
+    """
+    Queue the messages before the workers start, so they are sent as one batch
+    """
+    for to in recipients:
+        mail._queue.put(email_queue.QueuedEmail(to=to, message=_message(to)))
+    mail.start()
+
+
+def test_next_batch_takes_at_most_batch_size(connections):
+    mail = EmailQueue(connections.connect, SENDER, batch_size=3)
+    for i in range(5):
+        mail._queue.put(email_queue.QueuedEmail(to=f"user{i}@test.com", message=_message(f"user{i}@test.com")))
+    mail._queue.put(None)
+
+    first, stopping = mail._next_batch()
+    assert [email.to for email in first] == [f"user{i}@test.com" for i in range(3)]
+    assert not stopping
+
+    second, stopping = mail._next_batch()
+    assert [email.to for email in second] == ["user3@test.com", "user4@test.com"]
+    assert stopping
+
+
+def test_sends_every_batch_over_one_connection(smtp_server, connections):
+    _, handler = smtp_server
+    mail = EmailQueue(connections.connect, SENDER, batch_size=4)
+
+    recipients = [f"user{i}@test.com" for i in range(10)]
+    for to in recipients:
+        mail.enqueue(to, _message(to))
+    _wait(lambda: len(handler.delivered) == 10)
+    # A later batch reuses the open connection too
+    mail.enqueue("late@test.com", _message("late@test.com"))
+    mail.stop()
+
+    assert handler.delivered == recipients + ["late@test.com"]
+    assert len(connections) == 1
+
+
+def test_reconnects_when_an_idle_connection_was_closed(smtp_server, connections):
+    _, handler = smtp_server
+    mail = EmailQueue(connections.connect, SENDER, idle_timeout=0)
+
+    mail.enqueue("first@test.com", _message("first@test.com"))
+    _wait(lambda: len(handler.delivered) == 1)
+    connections[0].close()
+    mail.enqueue("second@test.com", _message("second@test.com"))
+    mail.stop()
+
+    assert handler.delivered == ["first@test.com", "second@test.com"]
+    assert len(connections) == 2
+
+
+def test_retries_with_exponential_backoff(smtp_server, connections, sleeps):
+    _, handler = smtp_server
+    connections.errors = [ConnectionRefusedError(), ConnectionRefusedError(), ConnectionRefusedError()]
+    mail = EmailQueue(connections.connect, SENDER, backoff=0.5)
+
+    mail.enqueue("user@test.com", _message("user@test.com"))
+    mail.stop()
+
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert handler.delivered == ["user@test.com"]
+
+
+def test_drops_a_message_after_max_retries(smtp_server, connections, sleeps, caplog):
+    _, handler = smtp_server
+    connections.errors = [ConnectionRefusedError() for _ in range(5)]
+    mail = EmailQueue(connections.connect, SENDER, max_retries=3, backoff=0.5)
+
+    with caplog.at_level("ERROR", logger=email_queue.__name__):
+        mail.enqueue("user@test.com", _message("user@test.com"))
+        mail.stop()
+
+    assert sleeps == [0.5, 1.0]
+    assert handler.delivered == []
+    assert "Email to user@test.com dropped after 3 attempts" in caplog.text
+
+
+def test_refused_recipient_is_not_retried(smtp_server, connections, sleeps, caplog):
+    _, handler = smtp_server
+    mail = EmailQueue(connections.connect, SENDER)
+
+    with caplog.at_level("ERROR", logger=email_queue.__name__):
+        for to in ["before@test.com", "refused@test.com", "after@test.com"]:
+            mail.enqueue(to, _message(to))
+        mail.stop()
+
+    assert handler.delivered == ["before@test.com", "after@test.com"]
+    assert sleeps == []
+    assert len(connections) == 1
+    assert "Email to refused@test.com refused" in caplog.text
+
+
+def test_transient_refusal_is_retried(smtp_server, connections, sleeps):
+    _, handler = smtp_server
+    mail = EmailQueue(connections.connect, SENDER, backoff=0.5)
+
+    _queue_batch(mail, ["before@test.com", "busy@test.com", "after@test.com"])
+    mail.stop()
+
+    assert handler.delivered == ["before@test.com", "busy@test.com", "after@test.com"]
+    # The messages left in the batch had no attempts yet, the delay is still the first one
+    assert sleeps == [0.5]
+
+
+@pytest.mark.parametrize("error, permanent", [
+    (smtplib.SMTPRecipientsRefused({"user@test.com": (550, b"Mailbox unavailable")}), True),
+    (smtplib.SMTPRecipientsRefused({"user@test.com": (450, b"Mailbox busy")}), False),
+    (smtplib.SMTPDataError(554, b"Rejected"), True),
+    (smtplib.SMTPDataError(421, b"Closing connection"), False),
+    (smtplib.SMTPSenderRefused(553, b"Sender rejected", SENDER), True),
+    (smtplib.SMTPSenderRefused(451, b"Try again later", SENDER), False),
+])
+def test_only_5xx_replies_are_permanent(error, permanent):
+    assert email_queue._permanent(error) is permanent
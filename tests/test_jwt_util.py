@@ -0,0 +1,17 @@
+import pytest
+
+from app.utils import JwtUtil
+from app.utils.key_store import ALGORITHMS, generate_private_key
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_supported_algorithms(algorithm):
+    assert JwtUtil._get_algorithm(algorithm) is not None
+
+
+@pytest.mark.parametrize("algorithm", ["HS256", "none", "RS1024"])
+def test_unsupported_algorithm_is_a_configuration_error(algorithm):
+    with pytest.raises(ValueError, match="must be one of RS256"):
+        JwtUtil._get_algorithm(algorithm)
+    with pytest.raises(ValueError, match="must be one of RS256"):
+        generate_private_key(algorithm)
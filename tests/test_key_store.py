@@ -0,0 +1,44 @@
+from app.utils.key_store import KeyStore, ACTIVE, RETIRING
+
+
+def _active(store: KeyStore) -> dict:
+    return next(entry for entry in store.load(create=False) if entry["status"] == ACTIVE)
+
+
+def test_load_creates_one_active_key(tmp_path):
+    store = KeyStore(str(tmp_path), algorithm="ES256")
+
+    keys = store.load()
+    assert [(entry["alg"], entry["status"]) for entry in keys] == [("ES256", ACTIVE)]
+    assert [entry["kid"] for entry in store.load()] == [keys[0]["kid"]]
+
+
+def test_rotate_only_when_due(tmp_path):
+    store = KeyStore(str(tmp_path), algorithm="ES256")
+    kid = store.load()[0]["kid"]
+
+    assert not store.rotate()
+    assert store.rotate(force=True)
+    statuses = {entry["kid"]: entry["status"] for entry in store.load()}
+    assert statuses[kid] == RETIRING
+    assert list(statuses.values()).count(ACTIVE) == 1
+
+
+def test_another_algorithm_does_not_rotate(tmp_path):
+    KeyStore(str(tmp_path), algorithm="ES256").load()
+    # A replica configured with another algorithm, e.g. during a rolling deploy
+    other = KeyStore(str(tmp_path), algorithm="EdDSA")
+
+    assert not other.rotate()
+    assert _active(other)["alg"] == "ES256"
+
+
+def test_switch_algorithm_rotates_once(tmp_path):
+    KeyStore(str(tmp_path), algorithm="ES256").load()
+    first, second = KeyStore(str(tmp_path), algorithm="EdDSA"), KeyStore(str(tmp_path), algorithm="EdDSA")
+
+    assert first.rotate(switch_algorithm=True)
+    assert _active(first)["alg"] == "EdDSA"
+    # The next replica starting finds the key already switched
+    assert not second.rotate(switch_algorithm=True)
+    assert len(second.load()) == 2
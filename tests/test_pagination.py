@@ -0,0 +1,35 @@
+import base64
+import json
+
+import pytest
+
+from app.utils import pagination
+
+
+def _cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("key, key_type", [("7a60c528-14d8-4792-a022-8281375e724d", str), (42, int)])
+def test_round_trip(key, key_type):
+    assert pagination.decode_cursor(pagination.encode_cursor(key), key_type) == key
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    "é",
+    _cursor([1, 2]),
+    _cursor({"key": "a"}),
+    _cursor({"k": 42}),
+    _cursor({"k": None}),
+    _cursor({"k": ["a"]}),
+    _cursor({"k": {"a": 1}}),
+])
+def test_malformed_or_mistyped_cursor(cursor):
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(cursor, str)
+
+
+def test_bool_is_not_an_int_key():
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(_cursor({"k": True}), int)
@@ -0,0 +1,235 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.utils import rate_limiter
+from app.utils.rate_limiter import RateLimitExceeded, SlidingWindowLimiter
+
+WINDOW = 60.0
+
+
+class _Clock:
+    """
+    Stands in for the time module in rate_limiter, moved by hand
+    """
+
+    def __init__(self, now: float = 1_000 * WINDOW):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    """
+    Fresh limiters, on, with a budget of 5 per email
+    """
+    monkeypatch.setitem(rate_limiter._RateLimitConfig, "ENABLED", True)
+    for rule, limit in (("login_ip", 100), ("login_email", 5), ("register_ip", 100)):
+        monkeypatch.setitem(rate_limiter._limiters, rule, SlidingWindowLimiter(limit, WINDOW))
+    return rate_limiter._limiters
+
+
+def test_allows_up_to_the_limit(run, clock):
+    limiter = SlidingWindowLimiter(3, WINDOW)
+
+    assert [run(limiter.hit("key")) for _ in range(3)] == [0, 0, 0]
+    assert run(limiter.hit("key")) > 0
+    # Other keys have their own count
+    assert run(limiter.hit("other")) == 0
+
+
+def test_rejected_attempts_are_not_counted(run, clock):
+    limiter = SlidingWindowLimiter(2, WINDOW)
+    for _ in range(2):
+        run(limiter.hit("key"))
+
+    retry_after = run(limiter.hit("key"))
+    for _ in range(10):
+        assert run(limiter.hit("key")) == retry_after
+
+    clock.now += retry_after
+    assert run(limiter.hit("key")) == 0
+
+
+def test_retry_after_once_the_window_turns(run, clock):
+    limiter = SlidingWindowLimiter(2, WINDOW)
+    for _ in range(2):
+        run(limiter.hit("key"))
+
+    # The current window is full: the rest of it, then until half of it has left the sliding window
+    assert run(limiter.hit("key")) == pytest.approx(WINDOW * 1.5)
+
+    clock.now += WINDOW * 1.5 - 1
+    assert run(limiter.hit("key")) == pytest.approx(1)
+    clock.now += 1
+    assert run(limiter.hit("key")) == 0
+
+
+def test_retry_after_while_the_previous_window_leaves(run, clock):
+    limiter = SlidingWindowLimiter(4, WINDOW)
+    clock.now += WINDOW - 10
+    for _ in range(4):
+        run(limiter.hit("key"))
+
+    # Just into the next window, the previous one still weighs fully
+    clock.now += 10
+    assert run(limiter.hit("key")) == pytest.approx(WINDOW / 4)
+    clock.now += WINDOW / 4
+    assert run(limiter.hit("key")) == 0
+
+
+def test_release(run, clock):
+    limiter = SlidingWindowLimiter(2, WINDOW)
+    for _ in range(2):
+        run(limiter.hit("key"))
+
+    run(limiter.release("key"))
+    assert run(limiter.hit("key")) == 0
+    assert run(limiter.hit("key")) > 0
+
+
+def test_release_after_the_window_turned(run, clock):
+    limiter = SlidingWindowLimiter(2, WINDOW)
+    clock.now += WINDOW - 1
+    for _ in range(2):
+        run(limiter.hit("key"))
+
+    clock.now += 1
+    run(limiter.release("key"))
+    # One attempt left in the previous window, which still weighs fully
+    assert run(limiter.hit("key")) == 0
+    assert run(limiter.hit("key")) > 0
+
+
+def test_reset(run, clock):
+    limiter = SlidingWindowLimiter(2, WINDOW)
+    for _ in range(2):
+        run(limiter.hit("key"))
+
+    run(limiter.reset("key"))
+    assert run(limiter.hit("key")) == 0
+
+
+def test_evicts_the_least_recently_used_key(run, clock):
+    limiter = SlidingWindowLimiter(1, WINDOW, max_keys=2)
+    run(limiter.hit("first"))
+    run(limiter.hit("second"))
+    run(limiter.hit("first"))
+    run(limiter.hit("third"))
+
+    assert limiter.stats()["keys"] == 2
+    # "first" was used more recently than "second", which was forgotten
+    assert run(limiter.hit("first")) > 0
+    assert run(limiter.hit("second")) == 0
+
+
+def test_limit_login_counts_every_spelling_of_an_email(run, limiters):
+    for email in ["victim@x.com", " victim@x.com", "victim@x.com ", "VICTIM@x.com", "\tVictim@X.com\n"]:
+        run(rate_limiter.limit_login("10.0.0.1", email))
+
+    with pytest.raises(RateLimitExceeded):
+        run(rate_limiter.limit_login("10.0.0.2", "  victim@x.com  "))
+
+
+def test_limit_login_concurrent_attempts(run, limiters):
+    async def attempts():
+        return await asyncio.gather(
+            *(rate_limiter.limit_login(f"10.0.0.{i}", "victim@x.com") for i in range(15)),
+            return_exceptions=True
+        )
+
+    results = run(attempts())
+    assert results.count(None) == 5
+    assert all(isinstance(result, RateLimitExceeded) for result in results if result is not None)
+
+
+def test_login_succeeded_clears_the_email(run, limiters):
+    for _ in range(5):
+        run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+
+    run(rate_limiter.login_succeeded(" User@x.com"))
+    for _ in range(5):
+        run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+
+
+def test_login_aborted_gives_the_attempt_back(run, limiters):
+    for _ in range(5):
+        run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+
+    run(rate_limiter.login_aborted("user@x.com"))
+    run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+    with pytest.raises(RateLimitExceeded):
+        run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+
+
+def test_limit_register(run, limiters, monkeypatch):
+    monkeypatch.setitem(limiters, "register_ip", SlidingWindowLimiter(2, WINDOW))
+    run(rate_limiter.limit_register("10.0.0.1"))
+    run(rate_limiter.limit_register("10.0.0.1"))
+
+    with pytest.raises(RateLimitExceeded):
+        run(rate_limiter.limit_register("10.0.0.1"))
+    # Not limited when the client IP is unknown
+    run(rate_limiter.limit_register(None))
+
+
+def test_disabled(run, limiters, monkeypatch):
+    monkeypatch.setitem(rate_limiter._RateLimitConfig, "ENABLED", False)
+    for _ in range(10):
+        run(rate_limiter.limit_login("10.0.0.1", "user@x.com"))
+
+
+@pytest.fixture
+def limited_client(client, limiters, monkeypatch):
+    monkeypatch.setitem(rate_limiter._RateLimitConfig, "ENABLED", True)
+    return client
+
+
+def _registered(client, run) -> str:
+    email = f"test-{uuid.uuid4().hex[:12]}@mail.com"
+    run(client.post("/register", json={"email": email, "password": "secret", "firstname": "Test", "lastname": "User"}))
+    return email
+
+
+def test_login_padded_emails_share_the_limit(limited_client, run):
+    email = _registered(limited_client, run)
+
+    statuses = [
+        run(limited_client.post("/login", json={"email": padded, "password": "wrong"})).status_code
+        for padded in [email, f" {email}", f"{email} ", f"  {email}", email.upper(), f" {email} ", f"{email}  "]
+    ]
+    # Wrong passwords are answered with a 401 in the body, rate limited attempts with a real 429
+    assert statuses == [200] * 5 + [429] * 2
+
+
+def test_login_concurrent_wrong_passwords(limited_client, run):
+    email = _registered(limited_client, run)
+
+    async def attempts():
+        return await asyncio.gather(
+            *(limited_client.post("/login", json={"email": email, "password": "wrong"}) for _ in range(15))
+        )
+
+    statuses = sorted(response.status_code for response in run(attempts()))
+    assert statuses == [200] * 5 + [429] * 10
+
+
+def test_login_success_clears_failed_attempts(limited_client, run):
+    email = _registered(limited_client, run)
+    for _ in range(4):
+        run(limited_client.post("/login", json={"email": email, "password": "wrong"}))
+
+    body = run(limited_client.post("/login", json={"email": email, "password": "secret"})).json()
+    assert body["status"] == 200
+    for _ in range(5):
+        assert run(limited_client.post("/login", json={"email": email, "password": "wrong"})).json()["status"] == 401
@@ -0,0 +1,328 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+import pytest
+import sys
+import uuid
+
+from fastapi import HTTPException
+
+from app.config import database, run_job
+from app.models import RefreshToken, RevokedToken
+from app.utils import AsyncRepository, PasswordUtil, pagination
+from app.utils.refresh_token_repository import hash_token, utcnow
+
+
+def _registration(email: str, password: str = "secret") -> dict:
+    return {"email": email, "password": password, "firstname": "Test", "lastname": "User"}
+
+
+def _email() -> str:
+    return f"test-{uuid.uuid4().hex[:12]}@mail.com"
+
+
+def test_register_returns_tokens(client, run):
+    body = run(client.post("/register", json=_registration(_email()))).json()
+
+    assert body["status"] == 200
+    assert set(body["node"]) == {"access_token", "refresh_token", "token_type"}
+
+
+def test_register_existing_email(client, run):
+    email = _email()
+    run(client.post("/register", json=_registration(email)))
+
+    body = run(client.post("/register", json=_registration(email))).json()
+    assert body["status"] == 409
+
+
+def test_register_invalid_body(client, run):
+    body = run(client.post("/register", json={"email": _email()})).json()
+    assert body["status"] == 422
+
+
+def test_login(client, run, jwt_keys):
+    email = _email()
+    registered = run(client.post("/register", json=_registration(email))).json()["node"]
+
+    body = run(client.post("/login", json={"email": email, "password": "secret"})).json()
+    assert body["status"] == 200
+    claims = jwt_keys.decode_jwt(body["node"]["access_token"])
+    assert claims["sub"] == jwt_keys.decode_jwt(registered["access_token"])["sub"]
+
+
+def test_login_seeded_admin(client, run, jwt_keys):
+    body = run(client.post("/login", json={"email": "admin@admin.com", "password": "admin"})).json()
+
+    assert body["status"] == 200
+    assert jwt_keys.decode_jwt(body["node"]["access_token"])["roles"] == ["admin"]
+
+
+def test_login_wrong_password(client, run):
+    email = _email()
+    run(client.post("/register", json=_registration(email)))
+
+    body = run(client.post("/login", json={"email": email, "password": "wrong"})).json()
+    assert body["status"] == 401
+
+
+def test_login_unknown_user(client, run):
+    body = run(client.post("/login", json={"email": _email(), "password": "secret"})).json()
+    assert body["status"] == 404
+
+
+def test_reset_password(client, run):
+    email = _email()
+    token = run(client.post("/register", json=_registration(email))).json()["node"]["access_token"]
+
+    body = run(client.request(
+        "GET", "/password/reset", json={"password": "changed"}, headers={"Authorization": f"Bearer {token}"}
+    )).json()
+    assert body["status"] == 200
+
+    # The new password is committed with the request
+    assert run(client.post("/login", json={"email": email, "password": "changed"})).json()["status"] == 200
+    assert run(client.post("/login", json={"email": email, "password": "secret"})).json()["status"] == 401
+
+
+def test_reset_password_invalid_token(client, run):
+    body = run(client.request(
+        "GET", "/password/reset", json={"password": "changed"}, headers={"Authorization": "Bearer invalid"}
+    )).json()
+    assert body["status"] == 401
+
+
+@pytest.fixture
+def connections_while_hashing(monkeypatch):
+    """
+    The database connections checked out while each bcrypt call runs
+    """
+    checked_out = []
+    run_bcrypt = PasswordUtil._run
+
+    async def _run(cls, func, *args):
+        checked_out.append(database.pool_status()["async"]["checked_out"])
+        return await run_bcrypt(func, *args)
+
+    monkeypatch.setattr(PasswordUtil, "_run", classmethod(_run))
+    return checked_out
+
+
+def test_no_connection_is_held_while_hashing(client, run, connections_while_hashing):
+    email = _email()
+    token = run(client.post("/register", json=_registration(email))).json()["node"]["access_token"]
+    assert run(client.post("/login", json={"email": email, "password": "secret"})).json()["status"] == 200
+    assert run(client.post("/login", json={"email": email, "password": "wrong"})).json()["status"] == 401
+    run(client.request(
+        "GET", "/password/reset", json={"password": "changed"}, headers={"Authorization": f"Bearer {token}"}
+    ))
+
+    assert connections_while_hashing == [0, 0, 0, 0]
+
+
+def _admin_token(client, run) -> str:
+    body = run(client.post("/login", json={"email": "admin@admin.com", "password": "admin"})).json()
+    return body["node"]["access_token"]
+
+
+def _list_users(client, run, token: str, **params) -> dict:
+    return run(client.get("/users", params=params, headers={"Authorization": f"Bearer {token}"})).json()
+
+
+def test_list_users_pages(client, run):
+    token = _admin_token(client, run)
+    for _ in range(3):
+        run(client.post("/register", json=_registration(_email())))
+
+    first = _list_users(client, run, token, limit=2)
+    assert first["status"] == 200
+    assert len(first["node"]["users"]) == 2
+
+    second = _list_users(client, run, token, limit=2, cursor=first["node"]["next_cursor"])
+    assert second["status"] == 200
+    ids = [user["id"] for user in first["node"]["users"] + second["node"]["users"]]
+    assert ids == sorted(ids, key=lambda user_id: uuid.UUID(user_id).bytes)
+    assert len(set(ids)) == len(ids)
+
+
+def test_list_users_requires_admin(client, run):
+    token = run(client.post("/register", json=_registration(_email()))).json()["node"]["access_token"]
+    assert _list_users(client, run, token)["status"] == 403
+
+
+@pytest.mark.parametrize("key", [42, None, ["a"], {"a": 1}, "not-a-uuid"])
+def test_list_users_tampered_cursor(client, run, key):
+    cursor = pagination.encode_cursor(key)
+    assert _list_users(client, run, _admin_token(client, run), cursor=cursor)["status"] == 400
+
+
+def test_list_users_malformed_cursor(client, run):
+    assert _list_users(client, run, _admin_token(client, run), cursor="not a cursor")["status"] == 400
+
+
+def _tokens(client, run) -> dict:
+    return run(client.post("/register", json=_registration(_email()))).json()["node"]
+
+
+def _refresh(client, run, refresh_token: str, key: str = "refresh_token") -> dict:
+    return run(client.post("/token/refresh", json={key: refresh_token})).json()
+
+
+def test_refresh_rotates_the_token(client, run, jwt_keys):
+    tokens = _tokens(client, run)
+
+    body = _refresh(client, run, tokens["refresh_token"])
+    assert body["status"] == 200
+    assert body["node"]["refresh_token"] != tokens["refresh_token"]
+    assert jwt_keys.decode_jwt(body["node"]["access_token"])["sub"] == jwt_keys.decode_jwt(tokens["access_token"])["sub"]
+    # The new refresh token is good for one more rotation
+    assert _refresh(client, run, body["node"]["refresh_token"])["status"] == 200
+
+
+def test_refresh_accepts_the_session_token_key(client, run):
+    tokens = _tokens(client, run)
+    assert _refresh(client, run, tokens["refresh_token"], key="session_token")["status"] == 200
+
+
+def test_refresh_unknown_token(client, run):
+    assert _refresh(client, run, uuid.uuid4().hex)["status"] == 401
+
+
+def test_refresh_expired_token(client, run):
+    tokens = _tokens(client, run)
+    run(AsyncRepository(base_model=RefreshToken).update_where(
+        {"expires_at": datetime(2000, 1, 1)}, token_hash=hash_token(tokens["refresh_token"])
+    ))
+
+    body = _refresh(client, run, tokens["refresh_token"])
+    assert body["status"] == 401
+    assert body["node"]["message"] == "Refresh token has expired"
+
+
+def test_refresh_reuse_revokes_the_family(client, run):
+    email = _email()
+    tokens = run(client.post("/register", json=_registration(email))).json()["node"]
+    rotated = _refresh(client, run, tokens["refresh_token"])["node"]
+
+    # The used token presented again, e.g. stolen before the rotation
+    assert _refresh(client, run, tokens["refresh_token"])["status"] == 401
+    # Every token of its family is revoked, including the one the rotation issued
+    assert _refresh(client, run, rotated["refresh_token"])["status"] == 401
+    # Other sessions of the user are not
+    other = run(client.post("/login", json={"email": email, "password": "secret"})).json()["node"]
+    assert _refresh(client, run, other["refresh_token"])["status"] == 200
+
+
+def test_refresh_concurrent_reuse(client, run):
+    tokens = _tokens(client, run)
+
+    async def refresh_twice():
+        return await asyncio.gather(*(
+            client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}) for _ in range(2)
+        ))
+
+    bodies = [response.json() for response in run(refresh_twice())]
+    assert sorted(body["status"] for body in bodies) == [200, 401]
+    # The winner's token belongs to the family revoked by the loser
+    winner = next(body for body in bodies if body["status"] == 200)
+    assert _refresh(client, run, winner["node"]["refresh_token"])["status"] == 401
+
+
+def _logout(client, run, access_token: str, refresh_token: str = None) -> dict:
+    return run(client.post(
+        "/logout",
+        json={"refresh_token": refresh_token} if refresh_token else None,
+        headers={"Authorization": f"Bearer {access_token}"}
+    )).json()
+
+
+def _reset_password(client, run, access_token: str) -> dict:
+    return run(client.request(
+        "GET", "/password/reset", json={"password": "changed"}, headers={"Authorization": f"Bearer {access_token}"}
+    )).json()
+
+
+def test_logout_revokes_the_access_token(client, run):
+    tokens = _tokens(client, run)
+
+    assert _logout(client, run, tokens["access_token"])["status"] == 200
+    assert _reset_password(client, run, tokens["access_token"])["status"] == 401
+    # The refresh token was not given, so it still works
+    assert _refresh(client, run, tokens["refresh_token"])["status"] == 200
+
+
+def test_logout_revokes_the_refresh_token_family(client, run):
+    tokens = _tokens(client, run)
+    rotated = _refresh(client, run, tokens["refresh_token"])["node"]
+
+    assert _logout(client, run, rotated["access_token"], rotated["refresh_token"])["status"] == 200
+    assert _refresh(client, run, rotated["refresh_token"])["status"] == 401
+
+
+def test_logout_leaves_other_users_refresh_tokens(client, run):
+    mine, theirs = _tokens(client, run), _tokens(client, run)
+
+    assert _logout(client, run, mine["access_token"], theirs["refresh_token"])["status"] == 200
+    assert _refresh(client, run, theirs["refresh_token"])["status"] == 200
+
+
+def test_logout_stores_the_revocation(client, run, jwt_keys):
+    tokens = _tokens(client, run)
+    payload = jwt_keys.decode_jwt(tokens["access_token"])
+    _logout(client, run, tokens["access_token"])
+
+    # For the other workers to pick up, until the token expires
+    revoked = run(AsyncRepository(base_model=RevokedToken).get_by(jti=payload["jti"]))
+    assert revoked is not None
+    assert revoked.expires_at == datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None)
+
+
+@pytest.fixture
+def sync_state(monkeypatch):
+    """
+    sync_revocations as if it had never run in this process
+    """
+    monkeypatch.setattr(sys.modules["app.config.scheduler"], "_revocations_synced_at", None)
+
+
+def _revoked_elsewhere(run, revoked_at: datetime = None, expires_in: timedelta = timedelta(minutes=15)) -> str:
+    """
+    Store a revocation, as another worker logging out would
+    """
+    jti = uuid.uuid4().hex
+    row = {"jti": jti, "expires_at": utcnow() + expires_in}
+    if revoked_at is not None:
+        row["revoked_at"] = revoked_at
+    assert run(AsyncRepository(base_model=RevokedToken).create_many([row]))
+    return jti
+
+
+def test_sync_loads_the_unexpired_revocations(run, sqlite_db, jwt_keys, sync_state):
+    revoked, expired = _revoked_elsewhere(run), _revoked_elsewhere(run, expires_in=timedelta(minutes=-1))
+
+    run_job("sync_revocations")
+    assert jwt_keys._REVOKED.is_revoked(revoked)
+    assert not jwt_keys._REVOKED.is_revoked(expired)
+
+
+def test_sync_after_the_first_run_reads_the_new_revocations(run, sqlite_db, jwt_keys, sync_state):
+    run_job("sync_revocations")
+    # Revoked before the last sync (and its overlap), so it was already read then
+    missed = _revoked_elsewhere(run, revoked_at=utcnow() - timedelta(hours=1))
+    new = _revoked_elsewhere(run)
+
+    run_job("sync_revocations")
+    assert jwt_keys._REVOKED.is_revoked(new)
+    assert not jwt_keys._REVOKED.is_revoked(missed)
+
+
+def test_token_revoked_by_another_worker(run, sqlite_db, jwt_keys, sync_state):
+    token = jwt_keys.encode_jwt({"sub": str(uuid.uuid4())})
+    payload = jwt_keys.decode_jwt(token)
+    assert run(AsyncRepository(base_model=RevokedToken).create_many([
+        {"jti": payload["jti"], "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None)}
+    ]))
+
+    run_job("sync_revocations")
+    with pytest.raises(HTTPException) as error:
+        jwt_keys.decode_jwt(token)
+    assert error.value.status_code == 401